@@ -10,13 +10,128 @@
 #       data = api.query(armSkuName='Premium_SSD_Managed_Disk_P10', armRegionName='westeurope')
 #       print(data)
 #
+#   Responses can be cached on disk between runs by passing a PriceCache (see price_cache.py):
+#
+#       api = AzureRetailPricesClient(cache=PriceCache('.price_cache'))
+#
+#   For large result sets, iter_query() yields records as each page arrives instead of building a list:
+#
+#       for record in api.iter_query(predicate=lambda r: r['type'] == 'Consumption', armRegionName='uksouth'):
+#           ...
+#
+#   Many independent queries can be run concurrently with AsyncAzureRetailPricesClient:
+#
+#       api = AsyncAzureRetailPricesClient(concurrency=16)
+#       results = api.run_many([{'armRegionName': 'uksouth', 'skuName': 'P10 LRS'}, {'armRegionName': 'ukwest', 'skuName': 'P10 LRS'}])
+#
+#   Many point lookups can be merged into a few requests with query_batch():
+#
+#       results = api.query_batch([{'armRegionName': 'uksouth', 'skuName': 'P10 LRS'}, {'armRegionName': 'uksouth', 'skuName': 'P20 LRS'}])
+#
+#   Requests are paced by a RateController (see rate_limit.py) that backs off on 429 responses.
+#   Pass the same controller to several clients to share one request budget between them.
+#
+#   With return_values set, each record is reduced to those fields as its page is parsed and returned
+#   as a compact tuple that still reads like a dict (record['retailPrice'], record.get(...), dict(record)),
+#   see price_records.py. Full-catalog pulls keep a fraction of the memory that full dicts take.
+#   stream_pages=True (needs ijson) also parses those pages incrementally as they are downloaded.
+#
+#   Requests, pages, bytes, latencies and cache lookups are recorded in instrumentation.metrics.
+#
+#   All requests go through one pooled requests.Session (keep-alive, gzip). A preconfigured
+#   session can be injected instead, e.g. for tests: AzureRetailPricesClient(session=my_session)
+#
 #   The Azure Retail Rates Prices API is documented here: https://learn.microsoft.com/en-us/rest/api/cost-management/retail-prices/azure-retail-prices
 #
 #########################################################################################
 
+import asyncio
+import functools
 import requests
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
 from tabulate import tabulate
+from rate_limit import RateController, parse_retry_after
+from instrumentation import metrics
+from price_records import read_page, record_type, require_streaming
+
+# Filters accepted by query(), iter_pages() and iter_query()
+FILTER_FIELDS = (
+    'armRegionName',
+    'location',
+    'meterId',
+    'meterName',
+    'productid',
+    'skuId',
+    'productName',
+    'skuName',
+    'serviceName',
+    'serviceId',
+    'serviceFamily',
+    'priceType',
+    'armSkuName',
+    'tierMinimumUnits'
+)
+
+# Filters whose name differs from the field they match in the returned price records
+FILTER_RECORD_FIELDS = {
+    'productid': 'productId',
+    'priceType': 'type'
+}
+
+# Responses worth retrying: throttling and transient server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Longest URL that query_batch() sends when merging lookups into one $filter
+MAX_URL_LENGTH = 2048
+URL_SAFE_CHARACTERS = ":/?&=$'()"
+
+# Value used to match a record to a lookup: numbers numerically, strings case-insensitively like the API does
+def _match_value(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return value.casefold()
+    return value
+
+def _match_key(alternative: tuple) -> tuple:
+    return tuple(_match_value(value) for _, value in alternative)
+
+# How query_batch() merges lookups that all filter on `fields`: returns (merged fields, shared fields).
+# Each choice of one field to vary is tried. Fields whose value it determines (e.g. meterName, when every
+# skuName has one meterName) vary with it, as part of each or-ed alternative; the remaining fields are
+# shared, and each distinct combination of them is a subgroup with its own requests. The choice with the
+# fewest subgroups wins, then the one with the fewest merged fields (the shortest URLs).
+def _merge_plan(fields: tuple, lookups: list) -> tuple:
+    values = {field: [_match_value(lookup[field]) for lookup in lookups] for field in fields}
+    best = None
+    for varying in fields:
+        dependent = []
+        for field in fields:
+            if field == varying or len(set(values[field])) == 1:
+                continue  # a field with one value for all lookups is cheapest shared
+            if len(set(zip(values[varying], values[field]))) == len(set(values[varying])):
+                dependent.append(field)
+        merged = (varying,) + tuple(dependent)
+        shared = tuple(field for field in fields if field not in merged)
+        subgroups = len(set(zip(*(values[field] for field in shared)))) if shared else 1
+        if best is None or (subgroups, len(merged)) < best[0]:
+            best = ((subgroups, len(merged)), merged, shared)
+    return best[1], best[2]
+
+# Size of a response as sent: Content-Length when the server gave one (compressed size with gzip), else the body length
+def _response_bytes(response) -> int:
+    try:
+        return int(response.headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return len(response.content or b'')
+    except RuntimeError: # streamed body, already consumed by the incremental parser
+        return response.raw.tell()
 
 class AzureRetailPricesClient:    
 
@@ -27,7 +142,13 @@ class AzureRetailPricesClient:
             currency_code: str = 'USD',
             sort_by: str = 'armRegionName',
             format = None,
-            return_values = None
+            return_values = None,
+            cache = None,
+            session: requests.Session = None,
+            timeout = (10, 60),
+            pool_size: int = 10,
+            rate_controller: RateController = None,
+            stream_pages: bool = False
             ) -> None:
 
         self.url = url
@@ -35,6 +156,11 @@ class AzureRetailPricesClient:
         self.sort_by = sort_by
         self.format = format
         self.return_values = return_values
+        self.cache = cache
+        self.timeout = timeout # (connect, read) seconds, passed to every request
+        self.session = session if session is not None else self._create_session(pool_size)
+        self.rate_controller = rate_controller if rate_controller is not None else RateController()
+        self.stream_pages = stream_pages # parse projected pages with ijson as they are read, e.g. for very large pages
 
     # Relatively useless but just in case
     def as_dict(self) -> dict:
@@ -89,68 +215,282 @@ class AzureRetailPricesClient:
         '''
 
         parameters = locals()
+        parameters.pop('self')
 
-        criterias = []
-        for parameter_name, parameter_value in parameters.items():
-            if parameter_name != 'self':
-                if parameter_value is not None:
-                    # Don't quote numbers for numeric fields like tierMinimumUnits
-                    if parameter_name == 'tierMinimumUnits' and isinstance(parameter_value, (int, float)):
-                        criterias.append(f"{parameter_name} eq {parameter_value}")
-                    else:
-                        criterias.append(f"{parameter_name} eq '{parameter_value}'")
-
-        if criterias:
-            filter = f"?currencyCode='{self.currency_code}'&$filter="
-            for criteria in criterias:
-                if criteria != criterias[len(criterias)-1]:
-                    filter += f"{criteria} and "
-                else:
-                    filter += f"{criteria}"
-        else:
-            filter = f"?currencyCode='{self.currency_code}'"
-
-        url = self.url+filter
-
-        all_price_records = []
-        
-        while True:
-            if not url:
-                break
-            response = requests.get(url)
-            if response.status_code == 200:
-                json_data = response.json()
-                url = json_data['NextPageLink'] # Fetch next link
-                all_price_records = all_price_records + json_data['Items']
-            else:
-                print(response.status_code)
-        
-        return_price_records = []
-
-        if self.return_values:
-            for record in all_price_records:
-                return_price_records.append({key: record[key] for key in self.return_values})
-        else:
-            return_price_records = all_price_records
+        filter = self._build_filter(parameters)
+        return_price_records = [record for page in self._iter_price_pages(filter, self._fields()) for record in page]
 
         if self.format == 'table':
-            headers = return_price_records[0].keys() # Here is an issue. Some datasets have a key called 'effectiveEndDate'. If this key is not included in the first record that is returned, then the values are not in the right column for some rows within this table. This is mainly the case with Spot instances since pricing is more short-lived for Spot instances.
+            # Columns are the union of the keys of all records, in first-seen order: some records carry keys that others
+            # lack (e.g. 'effectiveEndDate', mainly on short-lived Spot prices), and must not shift the other values
+            headers = list(dict.fromkeys(key for record in return_price_records for key in record.keys()))
             
             if self.sort_by is not None:
-                sorted_data = sorted(return_price_records, key=lambda x: x[self.sort_by])
+                sorted_data = sorted(return_price_records, key=lambda x: (x.get(self.sort_by) is None, x.get(self.sort_by)))
             else:
                 sorted_data = return_price_records
             
-            values = [item.values() for item in sorted_data]
+            values = [[item.get(header) for header in headers] for item in sorted_data]
             table = tabulate(values, headers=headers)
             return table
         
         elif self.format == 'json':
-            return json.dumps(return_price_records, indent=2, sort_keys=True)
+            return json.dumps([dict(record) for record in return_price_records], indent=2, sort_keys=True)
         
         else:
             return return_price_records
 
+    # Streaming variant of query(): yields the raw price records of each page as it arrives.
+    # Takes the same filters as query(), e.g. api.iter_pages(armRegionName='uksouth', skuName='Premium LRS').
+    # Extra OData criteria that are not equality filters can be passed as strings and are and-ed with them,
+    # e.g. api.iter_pages("effectiveStartDate ge 2024-06-01T00:00:00Z", serviceName='Storage')
+    def iter_pages(self, *criterias, **filters):
+        self._check_filters(filters)
+        if not criterias:
+            yield from self._iter_price_pages(self._build_filter(filters))
+            return
+        filter = self._filter_for([self._criteria(name, value) for name, value in filters.items() if value is not None] + list(criterias))
+        yield from self._iter_price_pages(filter)
+
+    # Streaming variant of query() that yields one record at a time, so memory use does not grow with the
+    # number of pages. Records for which predicate(record) is false are skipped; the predicate sees the raw
+    # record, before return_values is applied. Stop iterating to stop fetching further pages.
+    def iter_query(self, predicate=None, **filters):
+        if predicate is None and self.return_values:
+            self._check_filters(filters)
+            for page in self._iter_price_pages(self._build_filter(filters), self._fields()):
+                yield from page
+            return
+        for page in self.iter_pages(**filters):
+            for record in page:
+                if predicate is not None and not predicate(record):
+                    continue
+                yield self._project(record) if self.return_values else record
+
+    # Answers many point lookups (dicts of query() filters) with as few requests as possible.
+    # Lookups that filter on the same fields are merged into one $filter that ors their differing fields,
+    # e.g. "armRegionName eq 'uksouth' and (skuName eq 'P10 LRS' or skuName eq 'P20 LRS')", or, when more than
+    # one field differs with each lookup, "... and ((skuName eq 'P10 LRS' and meterName eq 'P10 LRS Disk') or ...)".
+    # Merged filters are split into chunks that keep the URL under max_url_length (see _merge_plan() for how the
+    # lookups are grouped). Returns one list of records per lookup, in input order.
+    # With refresh, cached responses are fetched again (and the cache updated) even while still fresh.
+    def query_batch(self, lookups: list, max_url_length: int = MAX_URL_LENGTH, refresh: bool = False) -> list:
+        results = [[] for _ in lookups]
+        groups = {}
+        for position, lookup in enumerate(lookups):
+            lookup = {name: value for name, value in lookup.items() if value is not None}
+            self._check_filters(lookup)
+            groups.setdefault(tuple(sorted(lookup)), []).append((position, lookup))
+
+        for fields, members in groups.items():
+            if not fields:
+                records = [record for page in self._iter_price_pages(self._filter_for([]), refresh=refresh) for record in page]
+                for position, _ in members:
+                    results[position] = records
+                continue
+            # The merged fields are or-ed as one alternative per lookup; the shared ones are the same within a subgroup
+            merged, shared_fields = _merge_plan(fields, [lookup for _, lookup in members])
+            subgroups = {}
+            for position, lookup in members:
+                shared = tuple((field, lookup[field]) for field in shared_fields)
+                alternative = tuple((field, lookup[field]) for field in merged)
+                subgroups.setdefault(shared, {}).setdefault(_match_key(alternative), (alternative, []))[1].append(position)
+
+            record_fields = [FILTER_RECORD_FIELDS.get(field, field) for field in merged]
+            for shared, alternatives in subgroups.items():
+                shared_criterias = [self._criteria(field, value) for field, value in shared]
+                for chunk in self._chunk_alternatives(shared_criterias, list(alternatives.values()), max_url_length):
+                    alternative = " or ".join(self._alternative_criteria(value) for value, _ in chunk)
+                    filter = self._filter_for(shared_criterias + [f"({alternative})" if len(chunk) > 1 else alternative])
+                    positions = {_match_key(value): positions for value, positions in chunk}
+                    for page in self._iter_price_pages(filter, refresh=refresh):
+                        for record in page:
+                            key = tuple(_match_value(record.get(field)) for field in record_fields)
+                            for position in positions.get(key, []):
+                                results[position].append(record)
+
+        if self.return_values:
+            results = [[self._project(record) for record in records] for records in results]
+        return results
+
+    # Splits the alternatives into groups whose merged filter keeps the encoded URL within max_url_length
+    def _chunk_alternatives(self, shared_criterias: list, alternatives: list, max_url_length: int):
+        base_length = len(quote(self.url + self._filter_for(shared_criterias + ['()']), safe=URL_SAFE_CHARACTERS))
+        chunk, length = [], base_length
+        for value, positions in alternatives:
+            added = len(quote(f" or {self._alternative_criteria(value)}", safe=URL_SAFE_CHARACTERS))
+            if chunk and length + added > max_url_length:
+                yield chunk
+                chunk, length = [], base_length
+            chunk.append((value, positions))
+            length += added
+        if chunk:
+            yield chunk
+
+    # Fields kept by the return_values projection, or None for full records
+    def _fields(self):
+        return tuple(self.return_values) if self.return_values else None
+
+    def _project(self, record: dict):
+        return record_type(self._fields()).from_mapping(record)
+
+    @staticmethod
+    def _check_filters(filters: dict) -> None:
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise TypeError(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+
+    # Session with a connection pool so that every page reuses the same TCP/TLS connections
+    @staticmethod
+    def _create_session(pool_size: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+        return session
+
+    # Builds the query string for the given criteria. The result is also used as the cache key.
+    def _build_filter(self, parameters: dict) -> str:
+        criterias = []
+        for parameter_name, parameter_value in parameters.items():
+            if parameter_value is not None:
+                criterias.append(self._criteria(parameter_name, parameter_value))
+
+        return self._filter_for(criterias)
+
+    def _filter_for(self, criterias: list) -> str:
+        if criterias:
+            return f"?currencyCode='{self.currency_code}'&$filter=" + " and ".join(criterias)
+        return f"?currencyCode='{self.currency_code}'"
+
+    # Criteria of one merged alternative, ((field, value), ...); parenthesized when it has several fields
+    @classmethod
+    def _alternative_criteria(cls, alternative: tuple) -> str:
+        criterias = " and ".join(cls._criteria(field, value) for field, value in alternative)
+        return f"({criterias})" if len(alternative) > 1 else criterias
+
+    @staticmethod
+    def _criteria(parameter_name: str, parameter_value) -> str:
+        # Don't quote numbers for numeric fields like tierMinimumUnits
+        if parameter_name == 'tierMinimumUnits' and isinstance(parameter_value, (int, float)):
+            return f"{parameter_name} eq {parameter_value}"
+        return f"{parameter_name} eq '{parameter_value}'"
+
+    # Yields the price records page by page, from the cache when it holds a fresh copy (unless refresh is set).
+    # With fields, the records are projected to those fields (see price_records.py) and cached as such.
+    def _iter_price_pages(self, filter: str, fields: tuple = None, refresh: bool = False):
+        if self.cache is None:
+            yield from self._fetch_pages(self.url+filter, fields)
+            return
+
+        key = filter if fields is None else f"{filter}|fields={','.join(fields)}"
+        cached = self.cache.get(key)
+        if cached is not None and fields is not None:
+            cached = ([record_type(fields)._make(row) for row in cached[0]], cached[1])
+        if cached is not None and not cached[1] and not refresh:
+            metrics.incr("price_cache_lookups_total", result="hit")
+            yield cached[0]
+            return
+        metrics.incr("price_cache_lookups_total", result="miss" if cached is None else "expired" if cached[1] else "refresh")
+        # Only a complete result is cached: a caller that stops iterating early leaves the entry unset
+        all_price_records = []
+        try:
+            for page in self._fetch_pages(self.url+filter, fields):
+                all_price_records.extend(page) # kept so the complete result can be cached
+                yield page
+        except requests.RequestException:
+            # Serve the expired copy rather than failing when the API can't be reached
+            if cached is not None and self.cache.stale_while_offline and not all_price_records:
+                self.cache.record_stale_hit()
+                metrics.incr("price_cache_lookups_total", result="stale")
+                yield cached[0]
+                return
+            raise
+        self.cache.set(key, all_price_records)
+
+    # Follows NextPageLink, yielding the items of each page (projected records when fields are given).
+    # Requests are paced by the shared rate controller; 429 and 5xx responses are retried with backoff
+    # (honouring Retry-After) up to its retry cap, after which the HTTP error is raised.
+    def _fetch_pages(self, url: str, fields: tuple = None):
+        attempt = 0
+        stream = fields is not None and self.stream_pages # let ijson parse the body as it is read
+        if stream:
+            require_streaming()
+        while True:
+            if not url:
+                break
+            self.rate_controller.acquire()
+            start = time.perf_counter()
+            response = self.session.get(url, timeout=self.timeout, stream=stream)
+            metrics.observe("price_api_request_seconds", time.perf_counter() - start)
+            metrics.incr("price_api_requests_total", status=response.status_code)
+            if response.status_code == 200:
+                self.rate_controller.on_success()
+                attempt = 0
+                items, url = read_page(response, fields, stream) # url is the next link
+                metrics.incr("price_api_pages_total")
+                metrics.incr("price_api_records_total", len(items))
+                metrics.incr("price_api_bytes_total", _response_bytes(response))
+                yield items
+            elif response.status_code in RETRY_STATUS_CODES and attempt < self.rate_controller.max_retries:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if stream:
+                    response.content # read the error body so the connection goes back to the pool
+                if response.status_code == 429:
+                    self.rate_controller.on_throttle(retry_after)
+                time.sleep(self.rate_controller.backoff(attempt, retry_after))
+                attempt += 1
+            else:
+                response.raise_for_status()
+                raise requests.HTTPError(f"Unexpected status {response.status_code} for {url}", response=response)
+
+# asyncio front end for AzureRetailPricesClient. Queries run on a bounded pool of worker threads that
+# share one client, and therefore one connection pool sized to the concurrency limit.
+# Filters are the same as for AzureRetailPricesClient.query().
+class AsyncAzureRetailPricesClient:
+
+    # Init Function. Any other keyword arguments are passed to AzureRetailPricesClient.
+    def __init__(
+            self,
+            concurrency: int = 16,
+            client: AzureRetailPricesClient = None,
+            **client_kwargs
+            ) -> None:
+
+        self.concurrency = concurrency
+        self.client = client if client is not None else AzureRetailPricesClient(pool_size=concurrency, **client_kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='retail-prices')
+        self._semaphores = {}
+
+    def __str__(self) -> str:
+        return f'(concurrency: {self.concurrency}, client: {self.client})'
+
+    async def query(self, **filters):
+        AzureRetailPricesClient._check_filters(filters)
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(self.client.query, **filters))
+
+    # Runs one query per filter dict, at most `concurrency` at a time, and returns the results in input order
+    async def query_many(self, filters_list: list) -> list:
+        return await asyncio.gather(*(self.query(**filters) for filters in filters_list))
+
+    # Convenience wrapper for callers that are not running an event loop
+    def run_many(self, filters_list: list) -> list:
+        return asyncio.run(self.query_many(filters_list))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.client.session.close()
+
+    # Semaphores are bound to the event loop they are used in, so keep one per loop
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[loop]
+
 if __name__ == '__main__':
     from AzureRetailPricesApi import AzureRetailPricesClient
     api = AzureRetailPricesClient()
@@ -0,0 +1,45 @@
+#########################################################################################
+#
+#    Helper for running Azure CLI commands that return JSON
+#    `az` is looked up on PATH, so a fake executable can stand in for it when testing offline.
+#    Call counts and durations are recorded in instrumentation.metrics, per command (e.g. "graph query").
+#
+#########################################################################################
+
+import json
+import subprocess
+import time
+from instrumentation import metrics
+
+AZ_EXECUTABLE = "az"
+
+
+class AzCliError(Exception):
+    pass
+
+
+# Runs `az <args> --output json` and returns the parsed output. Raises AzCliError if the command fails or prints nothing.
+def run_az(args: list, debug: bool = False):
+    cmd = [AZ_EXECUTABLE] + list(args) + ["--output", "json"]
+    if debug:
+        print(f"[INFO] Running: {' '.join(cmd)}")
+    command = az_command(args)
+    start = time.perf_counter()
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    metrics.observe("az_call_seconds", time.perf_counter() - start, command=command)
+    metrics.incr("az_calls_total", command=command, outcome="ok" if result.returncode == 0 else "error")
+    if result.returncode != 0:
+        raise AzCliError(f"{' '.join(cmd[:3])} failed: {result.stderr.strip()}")
+    if not result.stdout.strip():
+        raise AzCliError(f"{' '.join(cmd[:3])} returned no output")
+    return json.loads(result.stdout)
+
+
+# The command part of an az argument list, e.g. "graph query" or "disk show"
+def az_command(args: list) -> str:
+    words = []
+    for arg in args:
+        if arg.startswith("-"):
+            break
+        words.append(arg)
+    return " ".join(words[:3])
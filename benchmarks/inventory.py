@@ -0,0 +1,118 @@
+#########################################################################################
+#
+#    Synthetic inventory shared by the benchmark harness and the fake `az` executable
+#    Resource names encode an index, so the fake CLI can derive the same disk, storage
+#    account and metrics details from a name alone, without any shared state:
+#
+#       disks = disk_inventory(1000)              # input for compare_disk_prices.py (disks.json)
+#       details = disk_details("bench-disk-000042")
+#
+#   Every MISSING_EVERY-th resource does not exist, to exercise the per-resource fallbacks.
+#
+#########################################################################################
+
+import zlib
+
+SUBSCRIPTIONS = (
+    "00000000-0000-0000-0000-00000000b001",
+    "00000000-0000-0000-0000-00000000b002",
+)
+RESOURCE_GROUPS = 20
+REGIONS = ("uksouth", "ukwest")
+MISSING_EVERY = 100
+
+DISK_PREFIX = "bench-disk-"
+ACCOUNT_PREFIX = "benchsa"
+
+DISK_SKUS = ("Premium_LRS", "StandardSSD_LRS", "Premium_ZRS", "StandardSSD_ZRS")
+DISK_SIZES_GB = (32, 64, 128, 256, 512, 1024, 2048, 4096)
+DISK_IOPS = (120, 500, 2300, 5000, 7500)
+DISK_MBPS = (25, 100, 150, 200, 250)
+ACCOUNT_SKUS = ("Standard_LRS", "Standard_ZRS", "Standard_GRS", "Standard_RAGRS", "Premium_LRS")
+ACCOUNT_KINDS = ("StorageV2", "Storage", "BlockBlobStorage")
+
+
+def _index(name: str, prefix: str):
+    if not name.startswith(prefix):
+        return None
+    try:
+        return int(name[len(prefix):])
+    except ValueError:
+        return None
+
+
+def _pick(options: tuple, index: int, salt: str):
+    return options[zlib.crc32(f"{salt}{index}".encode()) % len(options)]
+
+
+def resource_group(index: int) -> str:
+    return f"rg-bench-{index % RESOURCE_GROUPS:02d}"
+
+
+def subscription(index: int) -> str:
+    return SUBSCRIPTIONS[index % len(SUBSCRIPTIONS)]
+
+
+def region(index: int) -> str:
+    return REGIONS[index % len(REGIONS)]
+
+
+def exists(index: int) -> bool:
+    return index % MISSING_EVERY != MISSING_EVERY - 1
+
+
+def disk_inventory(count: int) -> list:
+    return [{
+        "diskname": f"{DISK_PREFIX}{index:06d}",
+        "resourcegroup": resource_group(index),
+        "subscription": subscription(index)
+    } for index in range(count)]
+
+
+def storage_inventory(count: int) -> list:
+    return [{
+        "name": f"{ACCOUNT_PREFIX}{index:06d}",
+        "resourceGroup": resource_group(index),
+        "subscriptionId": subscription(index)
+    } for index in range(count)]
+
+
+# Same fields as `az disk show` (and the Resource Graph projection), or None if the disk does not exist
+def disk_details(name: str):
+    index = _index(name, DISK_PREFIX)
+    if index is None or not exists(index):
+        return None
+    return {
+        "name": name,
+        "resourceGroup": resource_group(index),
+        "subscriptionId": subscription(index),
+        "location": region(index),
+        "sku": {"name": _pick(DISK_SKUS, index, "sku"), "tier": "Premium"},
+        "diskSizeGB": _pick(DISK_SIZES_GB, index, "size"),
+        "diskIOPSReadWrite": _pick(DISK_IOPS, index, "iops"),
+        "diskMBpsReadWrite": _pick(DISK_MBPS, index, "mbps"),
+    }
+
+
+# Same fields as `az storage account show`, or None if the account does not exist
+def storage_account_details(name: str):
+    index = _index(name, ACCOUNT_PREFIX)
+    if index is None or not exists(index):
+        return None
+    return {
+        "id": f"/subscriptions/{subscription(index)}/resourceGroups/{resource_group(index)}/providers/Microsoft.Storage/storageAccounts/{name}",
+        "name": name,
+        "resourceGroup": resource_group(index),
+        "subscriptionId": subscription(index),
+        "location": region(index),
+        "sku": {"name": _pick(ACCOUNT_SKUS, index, "sku"), "tier": "Standard"},
+        "kind": _pick(ACCOUNT_KINDS, index, "kind"),
+    }
+
+
+# UsedCapacity in bytes `days_ago` days before now: a per-account base size with a steady daily growth
+def used_capacity_bytes(name: str, days_ago: float) -> float:
+    index = _index(name, ACCOUNT_PREFIX) or 0
+    base_gb = 50 + zlib.crc32(f"base{index}".encode()) % 5000
+    growth_gb = (zlib.crc32(f"growth{index}".encode()) % 200) / 10.0
+    return max(base_gb - growth_gb * days_ago, 1.0) * 1024 ** 3
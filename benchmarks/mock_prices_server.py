@@ -0,0 +1,422 @@
+#########################################################################################
+#
+#    Local stand-in for the Azure Retail Prices API (prices.azure.com)
+#    Serves a synthetic catalog (managed disks, Premium SSD v2, Ultra and blob storage meters
+#    for a few regions) with the same paging as the real API: each page holds page_size items
+#    and a NextPageLink to the next one ($skip). Latency and throttling can be injected:
+#
+#       from mock_prices_server import MockPricesServer
+#       with MockPricesServer(latency=0.02, page_size=100, throttle_every=50) as server:
+#           client = AzureRetailPricesClient(url=server.url)
+#           ...
+#           print(server.stats())   # requests, pages, throttled, bytes, records
+#
+#   or on its own, for pointing the scripts at it by hand:
+#
+#       python benchmarks/mock_prices_server.py --port 8080 --latency 0.05 --throttle-every 20
+#
+#   $filter supports what the client sends: eq/ne/gt/ge/lt/le comparisons joined by and/or,
+#   with parentheses. String comparisons ignore case, like the real API.
+#
+#########################################################################################
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode, quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from disk_tiers import STANDARD_HDD_TIERS, STANDARD_SSD_TIERS, PREMIUM_SSD_TIERS
+
+API_PATH = "/api/retail/prices"
+REGIONS = {
+    "uksouth": ("UK South", 1.00),
+    "ukwest": ("UK West", 1.05),
+    "westeurope": ("EU West", 1.02),
+    "northeurope": ("EU North", 0.98),
+    "eastus": ("US East", 0.90),
+}
+DISK_REDUNDANCIES = ("LRS", "ZRS")
+BLOB_REDUNDANCIES = ("LRS", "ZRS", "GRS", "RA-GRS", "GZRS", "RA-GZRS")
+BLOB_ACCESS_TIERS = {"Hot": 0.0184, "Cool": 0.01, "Cold": 0.0036, "Archive": 0.00099}
+BLOB_VOLUME_TIERS = ((0.0, 1.0), (51200.0, 0.96), (512000.0, 0.92))  # (tierMinimumUnits in GB, price factor)
+BLOB_REDUNDANCY_FACTORS = {"LRS": 1.0, "ZRS": 1.25, "GRS": 2.0, "RA-GRS": 2.5, "GZRS": 2.25, "RA-GZRS": 2.8}
+EFFECTIVE_START_DATE = "2024-01-01T00:00:00Z"
+FILTER_FIELD_ALIASES = {"pricetype": "type"}
+
+
+def _id(*parts) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "/".join(str(part) for part in parts)))
+
+
+def _record(region: str, product: str, sku: str, meter: str, price: float, unit: str,
+            service: str = "Storage", family: str = "Storage", tier: float = 0.0, arm_sku: str = "") -> dict:
+    location, factor = REGIONS[region]
+    price = round(price * factor, 6)
+    return {
+        "currencyCode": "USD",
+        "tierMinimumUnits": tier,
+        "retailPrice": price,
+        "unitPrice": price,
+        "armRegionName": region,
+        "location": location,
+        "effectiveStartDate": EFFECTIVE_START_DATE,
+        "meterId": _id("meter", region, product, meter, tier),
+        "meterName": meter,
+        "productId": _id("product", product)[:12].upper(),
+        "skuId": _id("sku", product, sku)[:12].upper() + "/0001",
+        "productName": product,
+        "skuName": sku,
+        "serviceName": service,
+        "serviceId": _id("service", service)[:12].upper(),
+        "serviceFamily": family,
+        "unitOfMeasure": unit,
+        "type": "Consumption",
+        "isPrimaryMeterRegion": True,
+        "armSkuName": arm_sku,
+    }
+
+
+# The synthetic catalog: every region gets the same meters, with region-specific prices.
+# extra_records adds that many records of a "Benchmark Product" in uksouth, for timing large result sets.
+def build_catalog(extra_records: int = 0) -> list:
+    catalog = []
+    for region in REGIONS:
+        for product, tiers, base in (
+                ("Standard HDD Managed Disks", STANDARD_HDD_TIERS, 0.045),
+                ("Standard SSD Managed Disks", STANDARD_SSD_TIERS, 0.075),
+                ("Premium SSD Managed Disks", PREMIUM_SSD_TIERS, 0.135)):
+            for redundancy in DISK_REDUNDANCIES:
+                factor = 1.0 if redundancy == "LRS" else 1.5
+                for max_size, tier, _, _ in tiers:
+                    sku = f"{tier} {redundancy}"
+                    catalog.append(_record(region, product, sku, f"{sku} Disk", base * max_size * factor, "1/Month"))
+                    catalog.append(_record(region, product, sku, f"{sku} Disk Operations", 0.0005, "10K"))
+        catalog.append(_record(region, "Azure Premium SSD v2", "Premium LRS", "Premium LRS Provisioned Capacity", 0.000110, "1 GiB/Hour"))
+        catalog.append(_record(region, "Azure Premium SSD v2", "Premium LRS", "Premium LRS Provisioned IOPS", 0.0000068, "1/Hour"))
+        catalog.append(_record(region, "Azure Premium SSD v2", "Premium LRS", "Premium LRS Provisioned Throughput (MBps)", 0.0, "1/Hour"))
+        catalog.append(_record(region, "Azure Premium SSD v2", "Premium LRS", "Premium LRS Provisioned Throughput (MBps)", 0.000055, "1/Hour", tier=125.0))
+        catalog.append(_record(region, "Ultra Disks", "Ultra LRS", "Ultra LRS Provisioned Capacity", 0.000164, "1 GiB/Hour"))
+        catalog.append(_record(region, "Ultra Disks", "Ultra LRS", "Ultra LRS Provisioned IOPS", 0.0000680, "1/Hour"))
+        catalog.append(_record(region, "Ultra Disks", "Ultra LRS", "Ultra LRS Provisioned Throughput (MBps)", 0.000479, "1/Hour"))
+        for redundancy in BLOB_REDUNDANCIES:
+            scale = BLOB_REDUNDANCY_FACTORS[redundancy]
+            for minimum, volume in BLOB_VOLUME_TIERS:
+                catalog.append(_record(region, "General Block Blob", f"Standard {redundancy}", f"{redundancy} Data Stored",
+                                       0.024 * scale * volume, "1 GB/Month", tier=minimum))
+                for access_tier, price in BLOB_ACCESS_TIERS.items():
+                    catalog.append(_record(region, "General Block Blob v2", f"{access_tier} {redundancy}", f"{access_tier} {redundancy} Data Stored",
+                                           price * scale * volume, "1 GB/Month", tier=minimum))
+            for access_tier in BLOB_ACCESS_TIERS:
+                catalog.append(_record(region, "General Block Blob v2", f"{access_tier} {redundancy}", f"{access_tier} {redundancy} Write Operations", 0.065 * scale, "10K"))
+        for redundancy in ("LRS", "ZRS"):
+            catalog.append(_record(region, "Premium Block Blob", f"Premium {redundancy}", f"Premium {redundancy} Data Stored",
+                                   0.15 * (1.0 if redundancy == "LRS" else 1.25), "1 GB/Month"))
+    for index in range(extra_records):
+        catalog.append(_record("uksouth", "Benchmark Product", f"Bench {index % 1000}", f"Bench Meter {index}", 0.001 * (index % 997),
+                               "1 Hour", service="Benchmark", family="Compute", arm_sku=f"Standard_Bench_{index % 1000}"))
+    return catalog
+
+
+#####
+# $filter parsing
+#####
+
+TOKEN = re.compile(r"\s*(?:(?P<open>\()|(?P<close>\))|'(?P<string>(?:[^']|'')*)'|(?P<word>[A-Za-z_]\w*)|(?P<literal>[-+]?\d[\w:.+\-]*))")
+COMPARISONS = {
+    "eq": lambda a, b: a == b,
+    "ne": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b,
+    "ge": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+    "le": lambda a, b: a is not None and a <= b,
+}
+
+
+def _tokenize(text: str) -> list:
+    tokens, position = [], 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Invalid $filter near: {text[position:position + 20]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = value.replace("''", "'")
+        tokens.append((kind, value))
+    return tokens
+
+
+def _comparable(value):
+    if isinstance(value, str):
+        return value.casefold()
+    if isinstance(value, bool) or value is None:
+        return value
+    return float(value)
+
+
+def _literal(kind: str, value: str):
+    if kind == "string":
+        return value.casefold()
+    if kind == "word" and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    try:
+        return float(value)
+    except ValueError:
+        return value.casefold()  # unquoted dates, e.g. effectiveStartDate gt 2024-01-01T00:00:00Z
+
+
+# Compiles a $filter expression into a predicate over price records
+def parse_filter(text: str):
+    tokens = _tokenize(text)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else (None, None)
+
+    def take():
+        nonlocal position
+        token = peek()
+        position += 1
+        return token
+
+    def expression():
+        terms = [term()]
+        while peek()[0] == "word" and peek()[1].lower() == "or":
+            take()
+            terms.append(term())
+        return terms[0] if len(terms) == 1 else (lambda record: any(t(record) for t in terms))
+
+    def term():
+        factors = [factor()]
+        while peek()[0] == "word" and peek()[1].lower() == "and":
+            take()
+            factors.append(factor())
+        return factors[0] if len(factors) == 1 else (lambda record: all(f(record) for f in factors))
+
+    def factor():
+        kind, value = take()
+        if kind == "open":
+            inner = expression()
+            if take()[0] != "close":
+                raise ValueError("Invalid $filter: missing ')'")
+            return inner
+        if kind != "word":
+            raise ValueError(f"Invalid $filter: expected a field name, got {value!r}")
+        field = FILTER_FIELD_ALIASES.get(value.lower(), value.lower())
+        operator_kind, operator = take()
+        if operator_kind != "word" or operator.lower() not in COMPARISONS:
+            raise ValueError(f"Invalid $filter: unknown operator {operator!r}")
+        compare = COMPARISONS[operator.lower()]
+        literal_kind, literal = take()
+        if literal_kind not in ("string", "literal", "word"):
+            raise ValueError(f"Invalid $filter: expected a value after {value} {operator}")
+        expected = _literal(literal_kind, literal)
+        return lambda record: compare(_comparable(record.get(field)), expected)
+
+    predicate = expression()
+    if position != len(tokens):
+        raise ValueError(f"Invalid $filter: unexpected {tokens[position][1]!r}")
+    return predicate
+
+
+#####
+# Server
+#####
+
+class MockPricesServer:
+
+    # Init Function. port=0 picks a free port; throttle_every=N answers every Nth request with 429.
+    def __init__(
+            self,
+            catalog: list = None,
+            page_size: int = 100,
+            latency: float = 0.0,
+            throttle_every: int = 0,
+            retry_after: float = 1.0,
+            extra_records: int = 0,
+            host: str = "127.0.0.1",
+            port: int = 0
+            ) -> None:
+
+        self.catalog = catalog if catalog is not None else build_catalog(extra_records)
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self._index = [{key.lower(): value for key, value in record.items()} for record in self.catalog]
+        self._filtered = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+        self.reset_stats()
+
+    def __str__(self) -> str:
+        return f'(url: {self.url}, records: {len(self.catalog)}, page_size: {self.page_size}, latency: {self.latency}, throttle_every: {self.throttle_every})'
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{API_PATH}"
+
+    def start(self) -> 'MockPricesServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-prices", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = dict({'requests': 0, 'pages': 0, 'throttled': 0, 'errors': 0, 'bytes': 0, 'records': 0})
+
+    # Applies changes (e.g. retailPrice=1.5, effectiveStartDate="2024-06-01T00:00:00Z") to every record
+    # for which predicate(record) is true, as a price update on the real API would. Returns the count.
+    def update_records(self, predicate, **changes) -> int:
+        count = 0
+        with self._lock:
+            for position, record in enumerate(self.catalog):
+                if predicate(record):
+                    record.update(changes)
+                    self._index[position] = {key.lower(): value for key, value in record.items()}
+                    count += 1
+            self._filtered.clear()
+        return count
+
+    def add_records(self, records: list) -> None:
+        with self._lock:
+            for record in records:
+                self.catalog.append(record)
+                self._index.append({key.lower(): value for key, value in record.items()})
+            self._filtered.clear()
+
+    # Positions of the catalog records matching a $filter; kept per filter so that paging through a result is cheap
+    def _matching(self, filter_text: str) -> list:
+        with self._lock:
+            if filter_text in self._filtered:
+                return self._filtered[filter_text]
+        predicate = parse_filter(filter_text) if filter_text.strip() else (lambda record: True)
+        positions = [position for position, record in enumerate(self._index) if predicate(record)]
+        with self._lock:
+            if len(self._filtered) > 1024:
+                self._filtered.clear()
+            self._filtered[filter_text] = positions
+        return positions
+
+    def _respond(self, handler, path: str, query: list):
+        with self._lock:
+            self._stats['requests'] += 1
+            throttled = self.throttle_every and self._stats['requests'] % self.throttle_every == 0
+        if self.latency:
+            time.sleep(self.latency)
+        if path != API_PATH:
+            return 404, {}, {"Error": {"Code": "NotFound", "Message": f"No such path {path}"}}
+        if throttled:
+            with self._lock:
+                self._stats['throttled'] += 1
+            return 429, {"Retry-After": f"{self.retry_after:g}"}, {"Error": {"Code": "TooManyRequests", "Message": "Too many requests"}}
+        parameters = dict(query)
+        try:
+            positions = self._matching(parameters.get("$filter", ""))
+            skip = int(parameters.get("$skip", "0"))
+        except ValueError as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            return 400, {}, {"Error": {"Code": "BadRequest", "Message": str(e)}}
+        currency = parameters.get("currencyCode", "USD").strip("'")
+        items = [self.catalog[position] for position in positions[skip:skip + self.page_size]]
+        if currency != "USD":
+            items = [dict(item, currencyCode=currency) for item in items]
+        next_link = None
+        if skip + self.page_size < len(positions):
+            next_query = [(name, value) for name, value in query if name != "$skip"] + [("$skip", str(skip + self.page_size))]
+            next_link = f"http://{handler.headers.get('Host')}{path}?{urlencode(next_query, quote_via=quote, safe=':$')}"
+        with self._lock:
+            self._stats['pages'] += 1
+            self._stats['records'] += len(items)
+        return 200, {}, {
+            "BillingCurrency": currency,
+            "CustomerEntityId": "Default",
+            "CustomerEntityType": "Retail",
+            "Items": items,
+            "NextPageLink": next_link,
+            "Count": len(items)
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body are separate writes; don't wait for the client's delayed ACK
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                status, headers, body = server._respond(self, parts.path, parse_qsl(parts.query, keep_blank_values=True))
+                payload = json.dumps(body).encode()
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    payload = gzip.compress(payload, compresslevel=5)
+                    headers = dict(headers, **{"Content-Encoding": "gzip"})
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+                with server._lock:
+                    server._stats['bytes'] += len(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Azure Retail Prices API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth request with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--extra-records", type=int, default=0, help="Synthetic 'Benchmark Product' records to add to the catalog")
+    args = parser.parse_args()
+    server = MockPricesServer(page_size=args.page_size, latency=args.latency, throttle_every=args.throttle_every,
+                              retry_after=args.retry_after, extra_records=args.extra_records, host=args.host, port=args.port)
+    server.start()
+    print(f"[INFO] Serving {len(server.catalog)} price records at {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"[INFO] {server.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#########################################################################################
+#
+#    Reproducible offline benchmarks for the pricing client and the compare scripts
+#    Every case runs in a fresh process against the local mock Retail Prices API
+#    (mock_prices_server.py) with the fake `az` (fake_az/az) first on PATH, so no Azure
+#    access is needed and results are comparable between runs:
+#
+#       python benchmarks/run_benchmarks.py
+#       python benchmarks/run_benchmarks.py --cases disk_main,blob_main --sizes 10,1000,100000 --latency 0.05
+#       python benchmarks/run_benchmarks.py --throttle-every 25 --output benchmarks/results.json
+#
+#   Cases:
+#       query       AzureRetailPricesClient.query() returning `size` records
+#       query_projected     the same with return_values set (compact projected records)
+#       premiumv2   compare_disk_prices.get_premiumv2_price() for `size` disks
+#       disk_main   compare_disk_prices.main() over a disks.json of `size` disks
+#       blob_main   compare_blob_prices.main() over a blobs.json of `size` accounts
+#
+#   For each case and size it reports the price API requests, pages, 429s and bytes seen by the
+#   mock server, retries made by the client, `az` calls, wall time and peak memory (max RSS).
+#   The client's rate limit is raised (--client-rate) so that the code, not the pacing, is measured.
+#
+#########################################################################################
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+FAKE_AZ_DIR = os.path.join(BENCHMARK_DIR, "fake_az")
+sys.path.insert(0, REPO_DIR)
+
+import inventory
+from mock_prices_server import MockPricesServer
+
+CASES = ("query", "query_projected", "premiumv2", "disk_main", "blob_main")
+DEFAULT_SIZES = "10,100,1000"
+
+
+#####
+# Cases, each run in its own process (--run-case) from a scratch working directory
+#####
+
+def _client(args):
+    from AzureRetailPricesApi import AzureRetailPricesClient
+    from rate_limit import RateController
+    return AzureRetailPricesClient(url=args.url, rate_controller=RateController(
+        rate=args.client_rate, burst=max(int(args.client_rate), 1), max_rate=args.client_rate, base_delay=0.1))
+
+
+def case_query(args, client):
+    records = client.query(productName="Benchmark Product", armRegionName="uksouth")
+    if len(records) != args.size:
+        raise RuntimeError(f"query() returned {len(records)} records, expected {args.size}")
+
+
+def case_query_projected(args, client):
+    client.return_values = ['skuName', 'meterName', 'retailPrice', 'unitOfMeasure', 'tierMinimumUnits']
+    case_query(args, client)
+
+
+def case_premiumv2(args, client):
+    import compare_disk_prices
+    compare_disk_prices.api_client = client
+    for disk in inventory.disk_inventory(args.size):
+        details = inventory.disk_details(disk["diskname"]) or {"diskSizeGB": 0, "diskIOPSReadWrite": 0, "diskMBpsReadWrite": 0}
+        compare_disk_prices.get_premiumv2_price("uksouth", details["diskSizeGB"], details["diskIOPSReadWrite"], details["diskMBpsReadWrite"])
+
+
+def case_disk_main(args, client):
+    import compare_disk_prices
+    compare_disk_prices.api_client = client
+    compare_disk_prices.main(["--fresh", "--workers", str(args.workers)])
+
+
+def case_blob_main(args, client):
+    import compare_blob_prices
+    compare_blob_prices.api_client = client
+    compare_blob_prices.RETRY_DELAY = args.retry_delay
+    compare_blob_prices.main(["--fresh", "--workers", str(args.workers)])
+
+
+CASE_FUNCTIONS = {
+    "query": case_query,
+    "query_projected": case_query_projected,
+    "premiumv2": case_premiumv2,
+    "disk_main": case_disk_main,
+    "blob_main": case_blob_main,
+}
+
+
+# Max RSS of this process in MB. On Linux ru_maxrss survives exec(), so it would report the driver's
+# peak (which hosts the mock catalog); VmHWM belongs to this process image only.
+def _peak_memory_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(args):
+    client = _client(args)
+    start = time.perf_counter()
+    CASE_FUNCTIONS[args.run_case](args, client)
+    wall = time.perf_counter() - start
+    with open(args.result_file, "w") as f:
+        json.dump({'wall_s': wall, 'peak_mb': _peak_memory_mb(), 'client': client.rate_controller.stats()}, f)
+
+
+#####
+# Driver
+#####
+
+def _prepare_workdir(case: str, size: int) -> str:
+    workdir = tempfile.mkdtemp(prefix=f"bench-{case}-{size}-")
+    with open(os.path.join(workdir, "disks.json"), "w") as f:
+        json.dump(inventory.disk_inventory(size if case == "disk_main" else 0), f)
+    with open(os.path.join(workdir, "blobs.json"), "w") as f:
+        json.dump(inventory.storage_inventory(size if case == "blob_main" else 0), f)
+    return workdir
+
+
+def _az_calls(log_path: str) -> int:
+    if not os.path.exists(log_path):
+        return 0
+    with open(log_path) as f:
+        return sum(1 for _ in f)
+
+
+def benchmark(case: str, size: int, args) -> dict:
+    server = MockPricesServer(page_size=args.page_size, latency=args.latency, throttle_every=args.throttle_every,
+                              retry_after=args.retry_after, extra_records=size if case.startswith("query") else 0).start()
+    workdir = _prepare_workdir(case, size)
+    env = dict(os.environ,
+               PATH=FAKE_AZ_DIR + os.pathsep + os.environ.get("PATH", ""),
+               FAKE_AZ_LOG=os.path.join(workdir, "az.log"),
+               FAKE_AZ_LATENCY=str(args.az_latency))
+    result_file = os.path.join(workdir, "result.json")
+    command = [sys.executable, os.path.abspath(__file__), "--run-case", case, "--size", str(size), "--url", server.url,
+               "--result-file", result_file, "--workers", str(args.workers), "--client-rate", str(args.client_rate),
+               "--retry-delay", str(args.retry_delay)]
+    try:
+        with open(os.path.join(workdir, "output.log"), "w") as output:
+            completed = subprocess.run(command, cwd=workdir, env=env, stdout=output, stderr=subprocess.STDOUT)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{case} with {size} items failed, see {os.path.join(workdir, 'output.log')}")
+        with open(result_file) as f:
+            measured = json.load(f)
+        az_calls = _az_calls(env["FAKE_AZ_LOG"])
+        stats = server.stats()
+    finally:
+        server.stop()
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return dict({
+        'case': case,
+        'size': size,
+        'wall_s': measured['wall_s'],
+        'peak_mb': measured['peak_mb'],
+        'requests': stats['requests'],
+        'pages': stats['pages'],
+        'throttled': stats['throttled'],
+        'bytes': stats['bytes'],
+        'records': stats['records'],
+        'retries': measured['client']['retries'],
+        'az_calls': az_calls,
+    })
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a mock Retail Prices API and a fake az CLI")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"Comma separated cases (default: all of {', '.join(CASES)})")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma separated inventory sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds the mock API adds to every response (default: 0.01)")
+    parser.add_argument("--page-size", type=int, default=100, help="Items per page (default: 100, as the real API)")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth price request with 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--az-latency", type=float, default=0.0, help="Seconds added to every fake az call")
+    parser.add_argument("--workers", type=int, default=1, help="--workers passed to the compare scripts")
+    parser.add_argument("--client-rate", type=float, default=1000.0, help="Requests per second the client's rate controller allows")
+    parser.add_argument("--retry-delay", type=float, default=0.0, help="RETRY_DELAY for compare_blob_prices.py (its default of 10s dominates otherwise)")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="Keep each case's working directory (inputs, results, output.log)")
+    parser.add_argument("--run-case", choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run_case:
+        run_case(args)
+        return
+    from tabulate import tabulate
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        raise SystemExit(f"Unknown case(s): {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = []
+    for case in cases:
+        for size in sizes:
+            print(f"[INFO] Running {case} with {size} items...")
+            results.append(benchmark(case, size, args))
+    print(tabulate([[
+        result['case'], result['size'], f"{result['wall_s']:.3f}", result['requests'], result['pages'], result['throttled'],
+        result['retries'], f"{result['bytes'] / 1024:.1f}", result['az_calls'],
+        f"{result['peak_mb']:.1f}" if result['peak_mb'] is not None else "N/A"
+    ] for result in results], headers=["Case", "Size", "Wall_s", "Requests", "Pages", "429s", "Retries", "KB", "Az_Calls", "Peak_MB"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#########################################################################################
+#
+#    Blob storage pricing engine
+#    The "Data Stored" meters of every blob product, access tier and redundancy are fetched
+#    once per region (one batched pass for all regions, see price_matrix.py), after which
+#    any number of kind / access tier scenarios are priced locally for each account:
+#
+#       from blob_pricing import BlobPricingEngine, DEFAULT_SCENARIOS
+#       engine = BlobPricingEngine(api_client)
+#       engine.load(['uksouth', 'ukwest'])
+#       engine.price(usage_gb, 'uksouth', 'Standard_ZRS', DEFAULT_SCENARIOS)   # [gbp, gbp, gbp]
+#       engine.price(usage_gb, 'uksouth', 'Standard_ZRS', [('StorageV2', 'Cool'), ('StorageV2', 'Archive')])
+#
+#   A scenario is a (kind, access_tier) pair; access_tier only applies to StorageV2 (None means Hot).
+#   Prices are monthly, in GBP (0.75 USD->GBP as elsewhere), at the rate of the first volume
+#   tier, as compare_blob_prices.py always priced them. From the command line:
+#
+#       python blob_pricing.py --region uksouth --capacity-gb 1000 --redundancy Standard_ZRS
+#
+#########################################################################################
+
+import argparse
+import threading
+from AzureRetailPricesApi import AzureRetailPricesClient
+from price_matrix import PriceMatrix, BLOB_PRODUCTS
+from single_flight import SingleFlight
+
+USD_TO_GBP = 0.75
+ACCESS_TIERS = ("Hot", "Cool", "Cold", "Archive")
+KIND_PRODUCTS = {
+    "Storage": "General Block Blob",
+    "StorageV2": "General Block Blob v2",
+    "BlockBlobStorage": "Premium Block Blob"
+}
+# Columns of compare_blob_prices.py: the account's capacity as a v1, premium block blob and Hot v2 account
+DEFAULT_SCENARIOS = (("Storage", None), ("BlockBlobStorage", None), ("StorageV2", "Hot"))
+# ARM SKU suffixes whose price sheet names are hyphenated
+REDUNDANCY_NAMES = {"RAGRS": "RA-GRS", "RAGZRS": "RA-GZRS"}
+
+
+# (productName, skuName, meterName) of the Data Stored meter for a kind, ARM redundancy (e.g. Standard_ZRS) and access tier
+def data_stored_meter(kind: str, redundancy: str, access_tier: str = None) -> tuple:
+    prefix = redundancy.split('_')[0]
+    suffix = redundancy.split('_')[-1]
+    suffix = REDUNDANCY_NAMES.get(suffix, suffix)
+    product_name = KIND_PRODUCTS.get(kind, kind)
+    if kind == "BlockBlobStorage":
+        return product_name, f"Premium {suffix}", f"Premium {suffix} Data Stored"
+    if kind == "Storage":
+        return product_name, f"Standard {suffix}", f"{suffix} Data Stored"
+    if kind == "StorageV2":
+        access_tier = access_tier or "Hot"
+        return product_name, f"{access_tier} {suffix}", f"{access_tier} {suffix} Data Stored"
+    return product_name, f"{prefix} {suffix}", f"{prefix} {suffix} Data Stored"
+
+
+class BlobRateCard:
+
+    # Data Stored rates of one region: {(productName, skuName, meterName): [(tierMinimumUnits, USD per GB month), ...]}
+    def __init__(self, region: str, rates: dict) -> None:
+        self.region = region
+        self.rates = rates
+
+    def __str__(self) -> str:
+        return f'(region: {self.region}, meters: {len(self.rates)})'
+
+    def __len__(self) -> int:
+        return len(self.rates)
+
+    @classmethod
+    def from_records(cls, region: str, records) -> 'BlobRateCard':
+        rates = {}
+        for record in records:
+            meter = record.get("meterName") or ""
+            if record.get("type", "Consumption") != "Consumption" or "Data Stored" not in meter:
+                continue
+            key = (record.get("productName"), record.get("skuName"), meter)
+            rates.setdefault(key, []).append((float(record.get("tierMinimumUnits") or 0.0), float(record.get("retailPrice", 0.0))))
+        for tiers in rates.values():
+            tiers.sort()
+        return cls(region, rates)
+
+    # USD per GB month of the first volume tier, or None where the meter is not sold
+    def rate(self, kind: str, redundancy: str, access_tier: str = None):
+        tiers = self.rates.get(data_stored_meter(kind, redundancy, access_tier))
+        return tiers[0][1] if tiers else None
+
+
+class BlobPricingEngine:
+
+    # Init Function
+    def __init__(self, client, products: tuple = BLOB_PRODUCTS) -> None:
+        self.client = client
+        self.products = tuple(products)
+        self._cards = {}
+        self._lock = threading.Lock()
+        self._loading = SingleFlight()
+
+    def __str__(self) -> str:
+        return f'(regions: {sorted(self._cards)}, client: {self.client})'
+
+    # Fetches the rate cards of every region not loaded yet, in one batched pass
+    def load(self, regions: list) -> None:
+        regions = sorted({region.strip().lower() for region in regions if region and region.strip()})
+        with self._lock:
+            missing = [region for region in regions if region not in self._cards]
+        if missing:
+            self._fetch(missing)
+
+    # Rate card of a region, fetched on first use when load() did not cover it
+    def rate_card(self, region: str) -> BlobRateCard:
+        region = region.strip().lower()
+        with self._lock:
+            card = self._cards.get(region)
+        if card is not None:
+            return card
+        return self._loading.do(region, lambda: self._fetch([region])[region])
+
+    # Monthly GBP cost of usage_gb in a region for each (kind, access_tier) scenario; None where a scenario is not sold
+    def price(self, usage_gb: float, region: str, redundancy: str, scenarios=DEFAULT_SCENARIOS) -> list:
+        return [None if rate is None else rate * usage_gb for rate in self.rates(region, redundancy, scenarios)]
+
+    # GBP per GB month in a region for each (kind, access_tier) scenario; None where a scenario is not sold
+    def rates(self, region: str, redundancy: str, scenarios=DEFAULT_SCENARIOS) -> list:
+        card = self.rate_card(region)
+        rates = []
+        for kind, access_tier in scenarios:
+            rate = card.rate(kind, redundancy, access_tier)
+            rates.append(None if rate is None else rate * USD_TO_GBP)
+        return rates
+
+    def _fetch(self, regions: list) -> dict:
+        matrix = PriceMatrix.fetch(self.client, regions, self.products)
+        by_region = {region: [] for region in regions}
+        for record in matrix.items:
+            region = (record.get("armRegionName") or "").lower()
+            if region in by_region:
+                by_region[region].append(record)
+        cards = {region: BlobRateCard.from_records(region, records) for region, records in by_region.items()}
+        with self._lock:
+            self._cards.update(cards)
+        return cards
+
+
+# Scenarios for compare_blob_prices.py: v1 and premium block blob, then StorageV2 in each access tier
+def scenarios_for(access_tiers: list = ("Hot",)) -> list:
+    return [("Storage", None), ("BlockBlobStorage", None)] + [("StorageV2", access_tier) for access_tier in access_tiers]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monthly blob storage cost of a capacity for every kind and access tier")
+    parser.add_argument("--region", action="append", dest="regions", required=True, help="armRegionName to price in (repeatable)")
+    parser.add_argument("--capacity-gb", type=float, default=1000.0, help="Stored capacity in GB (default: 1000)")
+    parser.add_argument("--redundancy", default="Standard_ZRS", help="ARM SKU name whose redundancy is priced (default: Standard_ZRS)")
+    parser.add_argument("--currency", default="USD", help="Currency code for prices")
+    args = parser.parse_args()
+
+    from tabulate import tabulate
+    engine = BlobPricingEngine(AzureRetailPricesClient(currency_code=args.currency))
+    engine.load(args.regions)
+    scenarios = scenarios_for(ACCESS_TIERS)
+    regions = [region.strip().lower() for region in args.regions]
+    columns = [engine.price(args.capacity_gb, region, args.redundancy, scenarios) for region in regions]
+    print(tabulate([[kind, access_tier or ""] + [f"{column[index]:.2f}" if column[index] is not None else "N/A" for column in columns]
+                    for index, (kind, access_tier) in enumerate(scenarios)],
+                   headers=["Kind", "Access_Tier"] + [f"{region}_(GBP)" for region in regions]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#########################################################################################
+#
+#    Capacity trend projection (requires numpy)
+#    Fits a linear growth trend to the daily UsedCapacity of every account at once (one
+#    least-squares fit per row of an accounts x days array) and projects the capacity, and
+#    its monthly cost for each candidate SKU, a few months ahead:
+#
+#       from capacity_projection import capacity_matrix, fit_trends, project_capacity, project_costs
+#       days, used_gb = capacity_matrix([history.series(resource_id, 60) for resource_id in resource_ids])
+#       trend = fit_trends(days, used_gb)                    # {'current_gb', 'growth_gb_per_day', 'points'}
+#       capacity = project_capacity(trend, [3, 6, 12])       # accounts x horizons, in GB
+#       costs = project_costs(capacity, rates)               # accounts x SKUs x horizons, in GBP per month
+#
+#   rates is an accounts x SKUs array of GBP per GB month (NaN where a SKU is not sold), e.g.
+#   from BlobPricingEngine. compare_blob_prices.py --project uses it for the blob accounts of a run.
+#   Accounts without data points project to NaN; a single data point projects flat. Capacity
+#   never projects below zero.
+#
+#########################################################################################
+
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; only projections need it
+    np = None
+
+MONTH_DAYS = 365.25 / 12
+HORIZON_MONTHS = (3, 6, 12)
+
+
+# Raises ImportError without numpy; callers can check up front, before any slow work
+def require_numpy():
+    if np is None:
+        raise ImportError("capacity_projection needs numpy: pip install numpy")
+
+
+# Stacks per-account [(day 'YYYY-MM-DD', gb), ...] series into (day numbers, accounts x days array with NaN gaps).
+# Day numbers count back from the latest day of any series, which is day 0.
+def capacity_matrix(series: list):
+    require_numpy()
+    days = sorted({day for points in series for day, _ in points})
+    if not days:
+        return np.zeros(0), np.full((len(series), 0), np.nan)
+    column = {day: index for index, day in enumerate(days)}
+    used_gb = np.full((len(series), len(days)), np.nan)
+    for row, points in enumerate(series):
+        for day, gb in points:
+            if gb is not None:
+                used_gb[row, column[day]] = gb
+    latest = date.fromisoformat(days[-1])
+    offsets = np.array([(date.fromisoformat(day) - latest).days for day in days], dtype=float)
+    return offsets, used_gb
+
+
+# Least-squares line through each row's non-NaN points, all rows at once.
+# current_gb is the fitted capacity at day 0; growth_gb_per_day its slope (0 for rows with one point).
+def fit_trends(days, used_gb) -> dict:
+    require_numpy()
+    used_gb = np.asarray(used_gb, dtype=float)
+    mask = ~np.isnan(used_gb)
+    x = np.where(mask, np.broadcast_to(np.asarray(days, dtype=float), used_gb.shape), 0.0)
+    y = np.where(mask, used_gb, 0.0)
+    n = mask.sum(axis=1).astype(float)
+    sum_x = x.sum(axis=1)
+    sum_y = y.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        denominator = n * (x * x).sum(axis=1) - sum_x * sum_x
+        slope = np.where(denominator > 0, (n * (x * y).sum(axis=1) - sum_x * sum_y) / np.where(denominator > 0, denominator, 1.0), 0.0)
+        intercept = np.where(n > 0, (sum_y - slope * sum_x) / np.where(n > 0, n, 1.0), np.nan)
+    return dict({
+        'current_gb': np.maximum(intercept, 0.0),
+        'growth_gb_per_day': np.where(n > 0, slope, np.nan),
+        'points': n.astype(int)
+    })
+
+
+# Fitted capacity `months` ahead of day 0, as an accounts x horizons array in GB
+def project_capacity(trend: dict, months=HORIZON_MONTHS):
+    require_numpy()
+    horizons = np.asarray(months, dtype=float) * MONTH_DAYS
+    capacity = trend['current_gb'][:, None] + trend['growth_gb_per_day'][:, None] * horizons[None, :]
+    return np.maximum(capacity, 0.0)
+
+
+# Monthly cost of each projected capacity at each SKU's rate: accounts x SKUs x horizons, in GBP
+def project_costs(capacity, rates):
+    require_numpy()
+    rates = np.asarray(rates, dtype=float)
+    if rates.ndim == 1:  # no accounts, so no SKU axis either
+        rates = rates.reshape(len(rates), 0)
+    return rates[:, :, None] * np.asarray(capacity, dtype=float)[:, None, :]
@@ -0,0 +1,209 @@
+#########################################################################################
+#
+#    Append-only checkpoint journal for resumable runs
+#    Each finished row is appended to a JSONL journal as {"key": ..., "row": [...]}, so saving
+#    progress costs one short write per row instead of rewriting every result so far.
+#    Writes are fsync'ed in batches; a torn last line left by a crash is ignored on load.
+#    At the end of a run, compact() rewrites the journal without duplicates and writes the
+#    plain JSON list of rows to the results file. keys(), iter_entries(), rows() and compact() only
+#    hold the keys in memory, so journals of any length can be resumed and compacted.
+#
+#########################################################################################
+
+import json
+import os
+import time
+
+
+class CheckpointJournal:
+
+    # Init Function
+    def __init__(
+            self,
+            path: str,
+            results_path: str = None,
+            fsync_every: int = 100,
+            fsync_interval: float = 2.0
+            ) -> None:
+
+        self.path = path
+        self.results_path = results_path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def __str__(self) -> str:
+        return f'(path: {self.path}, results_path: {self.results_path}, fsync_every: {self.fsync_every}, fsync_interval: {self.fsync_interval})'
+
+    # Returns the saved (key, row) entries in the order they were first saved; later entries for a key replace earlier ones.
+    # If there is no journal yet, rows from an older results file are keyed with legacy_key(row) and copied into a new journal.
+    def load(self, legacy_key=None) -> list:
+        self._migrate(legacy_key)
+        return list(self.iter_entries())
+
+    # Keys of the saved rows, in the order they were first saved (see load() for legacy_key)
+    def keys(self, legacy_key=None) -> list:
+        self._migrate(legacy_key)
+        return list(self._offsets())
+
+    # Yields the saved (key, row) entries like load(), reading one row at a time
+    def iter_entries(self):
+        offsets = self._offsets()
+        if not offsets:
+            return
+        with open(self.path, "rb") as f:
+            for key, offset in offsets.items():
+                f.seek(offset)
+                yield key, json.loads(f.readline())["row"]
+
+    # Raises ValueError if the saved rows don't have `width` columns, e.g. when a run is resumed with
+    # options that change the columns. Rows are always written at full width, so the first one is checked.
+    def check_width(self, width: int) -> None:
+        for key, row in self.iter_entries():
+            if len(row) != width:
+                raise ValueError(f"Saved progress in {self.path} has {len(row)} columns but this run has {width}")
+            return
+
+    # Yields the saved row of each of keys, in the order given (None for keys without a saved row)
+    def rows(self, keys):
+        offsets = self._offsets()
+        if not offsets:
+            for _ in keys:
+                yield None
+            return
+        with open(self.path, "rb") as f:
+            for key in keys:
+                offset = offsets.get(key)
+                if offset is None:
+                    yield None
+                    continue
+                f.seek(offset)
+                yield json.loads(f.readline())["row"]
+
+    # Byte offset of the latest entry of each key, in the order keys were first saved
+    def _offsets(self) -> dict:
+        offsets = {}
+        if self._file is not None:
+            self._file.flush()
+        if not os.path.exists(self.path):
+            return offsets
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    offsets[json.loads(line)["key"]] = offset
+                except ValueError:
+                    pass # torn write from an interrupted run
+                offset += len(line)
+        return offsets
+
+    # Copies the rows of an older results file into a new journal, keyed with legacy_key(row)
+    def _migrate(self, legacy_key) -> None:
+        if legacy_key is None or os.path.exists(self.path) or not self.results_path or not os.path.exists(self.results_path):
+            return
+        with open(self.results_path) as f:
+            rows = json.load(f)
+        for row in rows:
+            self.append(legacy_key(row), row)
+        self.sync()
+
+    def append(self, key: str, row: list) -> None:
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "a")
+            self._end_torn_line()
+        self._file.write(json.dumps({"key": key, "row": row}, separators=(',', ':')) + "\n")
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    # A crash can leave a last line without its newline; end it, so the next entry starts on a line of its own
+    def _end_torn_line(self) -> None:
+        if self._file.tell() == 0:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                self._file.write("\n")
+
+    def sync(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    # Forgets all saved progress, including an older results file (used to start a run over)
+    def discard(self) -> None:
+        self.close()
+        for path in (self.path, self.results_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    # Moves the journal and results file to path and results_path, replacing any files there, e.g. to swap in a journal
+    # that was built under temporary names once it is complete
+    def move_to(self, path: str, results_path: str = None) -> None:
+        self.close()
+        for source, target in ((self.path, path), (self.results_path, results_path)):
+            if source and target and os.path.exists(source):
+                os.replace(source, target)
+        self.path = path
+        self.results_path = results_path
+
+    # Rewrites the journal with one entry per key and writes the results file; both are replaced atomically.
+    # Returns the number of entries.
+    def compact(self) -> int:
+        self.close()
+        count = 0
+        with _AtomicFile(self.path) as journal, _AtomicFile(self.results_path) as results:
+            results.write("[")
+            for key, row in self.iter_entries():
+                journal.write(json.dumps({"key": key, "row": row}, separators=(',', ':')) + "\n")
+                results.write((", " if count else "") + json.dumps(row))
+                count += 1
+            results.write("]")
+        return count
+
+
+# Temporary file that replaces path when the block completes; without a path, writes are dropped
+class _AtomicFile:
+
+    # Init Function
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(f"{self.path}.tmp", "w")
+        return self
+
+    def write(self, text: str) -> None:
+        if self._file is not None:
+            self._file.write(text)
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self._file is None:
+            return
+        if exc_type is not None:
+            self._file.close()
+            os.remove(f"{self.path}.tmp")
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(f"{self.path}.tmp", self.path)
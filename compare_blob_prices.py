@@ -1,37 +1,85 @@
+import argparse
+import functools
 import subprocess
 import json
 import time
-import os
-from tabulate import tabulate
+import random
 from AzureRetailPricesApi import AzureRetailPricesClient
+from price_cache import PriceCache
+from price_snapshot import PriceSnapshot
+from price_store import PriceStore
+from price_catalog import PriceCatalog
+from price_service import PriceServiceClient
+from price_matrix import parse_regions
+from blob_pricing import BlobPricingEngine, ACCESS_TIERS, scenarios_for
+from resource_graph import discover_storage_accounts
+from storage_metrics import CapacityCollector, CapacityHistory, HISTORY_DAYS, storage_account_id
+from capacity_projection import HORIZON_MONTHS, MONTH_DAYS, capacity_matrix, fit_trends, project_capacity, project_costs, require_numpy
+from az_cli import AzCliError
+from pipeline import run_pipeline
+from checkpoint import CheckpointJournal
+from sharding import first_shard_row, in_shard, merge_shards, parse_shard, shard_path
+from instrumentation import metrics
+from result_writers import FORMATS, open_writer, rows_on_stdout
 
 DEBUG = None
 RESULTS_FILE = "results/blob_price_results.json"
+JOURNAL_FILE = "results/blob_price_results.jsonl"
 MAX_RETRIES = 3
-RETRY_DELAY = 10  # seconds
+RETRY_DELAY = 10  # seconds before the first retry, doubled for each further retry
+PRICE_CACHE_DIR = None  # e.g. ".price_cache" to reuse price responses between runs
+PRICE_CACHE_TTL = 24 * 3600  # seconds
+PRICE_SNAPSHOT_FILE = None  # e.g. a file written by price_snapshot.py; lookups then make no API calls
+USE_RESOURCE_GRAPH = True  # resolve all accounts with batched `az graph query` calls, falling back to `az storage account show`
+PRICE_STORE_FILE = None  # e.g. a file written by price_store.py; like a snapshot, but memory-mapped and indexed
+PRICE_CATALOG_FILE = None  # e.g. a catalog kept current by price_catalog.py; used like a snapshot
+CAPACITY_HISTORY_FILE = "results/capacity_history.sqlite3"  # daily UsedCapacity kept between --project runs
 
-def save_progress(table):
-    with open(RESULTS_FILE, "w") as f:
-        json.dump(table, f)
+# Prices come from a local store, snapshot or catalog when one is configured, otherwise from the API
+def create_price_client():
+    if PRICE_STORE_FILE:
+        return PriceStore(PRICE_STORE_FILE)
+    if PRICE_SNAPSHOT_FILE:
+        return PriceSnapshot.load(PRICE_SNAPSHOT_FILE)
+    if PRICE_CATALOG_FILE:
+        return PriceCatalog(PRICE_CATALOG_FILE).snapshot()
+    return AzureRetailPricesClient(
+        cache=PriceCache(PRICE_CACHE_DIR, ttl=PRICE_CACHE_TTL) if PRICE_CACHE_DIR else None
+    )
 
-def load_progress():
-    if os.path.exists(RESULTS_FILE):
-        with open(RESULTS_FILE) as f:
-            return json.load(f)
-    return []
+api_client = create_price_client()
+blob_prices = None  # set by use_blob_pricing() when main() starts, from whichever api_client is in place then
+capacity_collector = CapacityCollector(debug=DEBUG)
+
+# Progress is appended to a journal (one line per account) and compacted into RESULTS_FILE at the end of the run
+def save_progress(journal, row):
+    journal.append(row_key(row), row)
+
+# Keys of the rows already saved, carrying over an older results file if there is no journal yet
+def load_progress(journal):
+    return journal.keys(legacy_key=row_key)
 
 def row_key(row):
     # Use account name and resource group as unique key
     return f"{row[0]}|{row[1]}"
 
-def retry_api_call(func, *args, **kwargs):
-    for attempt in range(1, MAX_RETRIES + 1):
+# The same key, from an entry of blobs.json
+def account_key(acc):
+    return f"{acc['name']}|{acc['resourceGroup']}"
+
+# Retries a call that returned None, with exponential backoff and jitter (RETRY_DELAY, 2x, 4x, ...).
+# Price API throttling is handled by the client's rate controller, so this no longer waits on top of it.
+def retry_api_call(func, *args, attempts=MAX_RETRIES, **kwargs):
+    for attempt in range(1, attempts + 1):
         result = func(*args, **kwargs)
         if result is not None:
             return result
+        if attempt == attempts:
+            break
+        delay = RETRY_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
         if DEBUG:
-            print(f"[RETRY] API call failed (attempt {attempt}/{MAX_RETRIES}), retrying in {RETRY_DELAY}s...")
-        time.sleep(RETRY_DELAY)
+            print(f"[RETRY] API call failed (attempt {attempt}/{attempts}), retrying in {delay:.1f}s...")
+        time.sleep(delay)
     return None
 
 def get_storage_account_details(account_name, resource_group, subscription):
@@ -44,136 +92,299 @@ def get_storage_account_details(account_name, resource_group, subscription):
     ]
     if DEBUG:
         print(f"[INFO] Running: {' '.join(cmd)}")
+    start = time.perf_counter()
     result = subprocess.run(cmd, capture_output=True, text=True)
+    metrics.observe("az_call_seconds", time.perf_counter() - start, command="storage account show")
+    metrics.incr("az_calls_total", command="storage account show", outcome="ok" if result.returncode == 0 else "error")
     if result.returncode != 0:
         if DEBUG:
             print(f"[WARN] Could not fetch details for {account_name}: {result.stderr}")
         return None
     return json.loads(result.stdout)
 
-def get_blob_price(account_name, resource_group, subscription, region, redundancy, kind):
-    # Get current capacity (in GB) using az monitor metrics list
-    cmd = [
-        "az", "monitor", "metrics", "list",
-        "--resource", f"/subscriptions/{subscription}/resourceGroups/{resource_group}/providers/Microsoft.Storage/storageAccounts/{account_name}",
-        "--metric", "UsedCapacity",
-        "--interval", "PT1H",
-        "--aggregation", "Average",
-        "--output", "json"
-    ]
-    if DEBUG:
-        print(f"[INFO] Running: {' '.join(cmd)}")
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
+# Current capacity (in GB), collected in batches up front and cached for the run; None if it could not be fetched
+def get_used_capacity_gb(account_name, resource_group, subscription, region):
+    try:
+        usage_gb = capacity_collector.used_capacity_gb(storage_account_id(subscription, resource_group, account_name), region)
+    except (AzCliError, ValueError) as e:
         if DEBUG:
-            print(f"[WARN] Could not fetch metrics for {account_name}: {result.stderr}")
+            print(f"[WARN] Could not fetch metrics for {account_name}: {e}")
         return None
-    metrics = json.loads(result.stdout)
-    usage_gb = 1000  # default fallback
-    try:
-        data = metrics["value"][0]["timeseries"][0]["data"]
-        # Get the latest non-null average value
-        for point in reversed(data):
-            avg = point.get("average")
-            if avg is not None:
-                usage_gb = float(avg) / (1024 ** 3)  # Convert bytes to GB
-                break
-    except Exception as e:
+    if usage_gb is None:
         if DEBUG:
-            print(f"[WARN] Could not parse metrics: {e}")
-        # fallback to default
-
-    api_client = AzureRetailPricesClient()
-    kind_map = {
-        "Storage": "General Block Blob",
-        "StorageV2": "General Block Blob v2",
-        "BlockBlobStorage": "Premium Block Blob"
-    }
-    product_name = kind_map.get(kind, kind)
-    redundancy_prefix = redundancy.split('_')[0]
-    redundancy_suffix = redundancy.split('_')[-1]
-    if DEBUG:
-        print(f"Redundancy is '{redundancy}")
-    if kind == "BlockBlobStorage":
-        sku_name = f"Premium {redundancy_suffix}"
-        meter_name = f"Premium {redundancy_suffix} Data Stored"
-    elif kind == "Storage":
-        sku_name = f"Standard {redundancy_suffix}"
-        meter_name = f"{redundancy_suffix} Data Stored"
-    elif kind == "StorageV2":
-        sku_name = f"Hot {redundancy_suffix}"
-        meter_name = f"Hot {redundancy_suffix} Data Stored"
-    else:
-        sku_name = f"{redundancy_prefix} {redundancy_suffix}"
-        meter_name = f"{redundancy_prefix} {redundancy_suffix} Data Stored"
-
-    query_args = {
-        'armRegionName': region,
-        'productName': product_name,
-        'skuName': sku_name,
-        'meterName': meter_name
-    }
+            print(f"[WARN] No UsedCapacity data points for {account_name}")
+        usage_gb = 1000  # default fallback
+    return usage_gb
+
+# Pipeline stage 1: account details, from the batched Resource Graph results or `az storage account show`
+def discover_account(item):
+    acc, details = item
+    details = details or retry_api_call(get_storage_account_details, acc["name"], acc["resourceGroup"], acc["subscriptionId"])
+    if not details:
+        raise LookupError(f"Storage account {acc['name']} not found in {acc['resourceGroup']}")
+    return details
+
+def failed_account_row(item, error, regions=None, access_tiers=("Hot",)):
+    acc, _ = item
     if DEBUG:
-        print(f"[QUERY] api_client.query({query_args})")
-    results = retry_api_call(api_client.query, **query_args)
+        print(f"[WARN] {error}. Marking as N/A.")
+    return [acc["name"], acc["resourceGroup"], "N/A", "N/A", "N/A"] + ["N/A"] * len(price_headers(regions, access_tiers))
+
+# Price columns for each region; without --regions, the account's own region is priced
+def price_headers(regions=None, access_tiers=("Hot",)):
+    names = ["Storage_V1_(GBP)", "BlockBlob_(GBP)"] + [
+        "Storage_V2_(GBP)" if access_tier == "Hot" else f"Storage_V2_{access_tier}_(GBP)" for access_tier in access_tiers
+    ]
+    if not regions or len(regions) == 1:
+        return names
+    return [f"{name}_{region}" for region in regions for name in names]
+
+# For pricing, always use ZRS if not already ZRS
+def pricing_redundancy(actual_redundancy):
+    if actual_redundancy.endswith("ZRS"):
+        return actual_redundancy
+    redundancy_for_pricing = actual_redundancy.split('_')[0] + "_ZRS"
     if DEBUG:
-        print(f"API response is '{results}")
-    if not results:
-        return None
-    price_per_gb = None
-    for item in results:
-        meter = item.get("meterName", "")
-        if "Data Stored" in meter:
-            price_per_gb = float(item.get("retailPrice", 0.0))
-            break
-    if price_per_gb is None:
-        return None
-    gbp = price_per_gb * 0.75 * usage_gb
-    return gbp
-
-def main():
-    # Read blobs.json
-    with open("blobs.json") as f:
-        accounts = json.load(f)
-    table = load_progress()
-    processed_keys = set(row_key(row) for row in table)
-    for acc in accounts:
-        name = acc["name"]
-        rg = acc["resourceGroup"]
-        sub = acc["subscriptionId"]
-        key = f"{name}|{rg}"
-        if key in processed_keys:
-            if DEBUG:
-                print(f"[SKIP] Already processed {name} in {rg}")
-            continue
-        details = retry_api_call(get_storage_account_details, name, rg, sub)
-        if not details:
-            row = [name, rg, "N/A", "N/A", "N/A", "N/A", "N/A", "N/A"]
-            table.append(row)
-            save_progress(table)
+        print(f"[INFO] Overriding redundancy for pricing to {redundancy_for_pricing}")
+    return redundancy_for_pricing
+
+# Pipeline stage 2: price the account's capacity as each storage kind (and StorageV2 access tier), in its own region
+# or in each of `regions`. All scenarios come from the blob pricing engine's rate cards, so they cost no extra API calls.
+def price_account(item, details, regions=None, access_tiers=("Hot",)):
+    acc, _ = item
+    name = acc["name"]
+    rg = acc["resourceGroup"]
+    sub = acc["subscriptionId"]
+    kind = details.get("kind", "?")
+    actual_redundancy = details.get("sku", {}).get("name", "?")
+    region = details.get("location", "uksouth")
+    redundancy_for_pricing = pricing_redundancy(actual_redundancy)
+    scenarios = scenarios_for(access_tiers)
+    usage_gb = get_used_capacity_gb(name, rg, sub, region)
+    row = [name, rg, kind, actual_redundancy, region]
+    for price_region in regions or [region]:
+        prices = blob_prices.price(usage_gb, price_region, redundancy_for_pricing, scenarios) if usage_gb is not None else [None] * len(scenarios)
+        row += [f"{price:.2f}" if price is not None else "N/A" for price in prices]
+    return row
+
+# Projection columns: each price column at each horizon
+def projection_headers(access_tiers=("Hot",), months=HORIZON_MONTHS):
+    return [name.replace("_(GBP)", f"_{month}m_(GBP)") for name in price_headers(None, access_tiers) for month in months]
+
+# Projection mode: fits a growth trend to the daily UsedCapacity of all accounts at once, then writes each account's
+# projected monthly cost as each kind / access tier HORIZON_MONTHS ahead. The metrics history is kept in
+# CAPACITY_HISTORY_FILE, so a rerun only fetches the days since the last one. No progress journal is used.
+def project_accounts(accounts, args):
+    require_numpy()  # fail before the slow discovery and metrics collection
+    with metrics.phase("discovery"):
+        if USE_RESOURCE_GRAPH:
+            discovered = discover_storage_accounts(accounts, debug=DEBUG)
+        else:
+            discovered = [None] * len(accounts)
+        found = []
+        for item in zip(accounts, discovered):
+            try:
+                found.append(discover_account(item))
+            except LookupError as e:
+                if DEBUG:
+                    print(f"[WARN] {e}. Marking as N/A.")
+                found.append(None)
+    resource_ids = [storage_account_id(acc["subscriptionId"], acc["resourceGroup"], acc["name"]) for acc in accounts]
+    located = [details is not None and bool(details.get("location")) for details in found]
+    with metrics.phase("metrics"):
+        history = CapacityHistory(CAPACITY_HISTORY_FILE, debug=DEBUG)
+        history.collect([(resource_id, details["location"]) for resource_id, details, ok in zip(resource_ids, found, located) if ok],
+                        days=args.history_days)
+        if DEBUG:
+            print(f"[INFO] Capacity history: {history}")
+    with metrics.phase("price_matrix"):
+        blob_prices.load([details["location"] for details, ok in zip(found, located) if ok])
+    with metrics.phase("projection"):
+        scenarios = scenarios_for(args.access_tiers)
+        days, used_gb = capacity_matrix([history.series(resource_id, args.history_days) if ok else [] for resource_id, ok in zip(resource_ids, located)])
+        trend = fit_trends(days, used_gb)
+        capacity = project_capacity(trend, HORIZON_MONTHS)
+        rates = [blob_prices.rates(details["location"], pricing_redundancy(details.get("sku", {}).get("name", "?")), scenarios) if ok
+                 else [None] * len(scenarios) for details, ok in zip(found, located)]
+        costs = project_costs(capacity, rates)
+    history.close()
+    headers = ["Account_Name", "Resource_Group", "Kind", "Redundancy", "Region", "Used_GB", "Growth_GB_per_Month"] + projection_headers(args.access_tiers)
+    with open_writer(args.format, args.output, headers, title=f"\n[RESULT] Projected Monthly Blob Storage Costs ({args.history_days} day UsedCapacity trend):") as writer:
+        for index, (acc, details) in enumerate(zip(accounts, found)):
+            if details is None:
+                writer.write([acc["name"], acc["resourceGroup"]] + ["N/A"] * (len(headers) - 2))
+                continue
+            row = [acc["name"], acc["resourceGroup"], details.get("kind", "?"), details.get("sku", {}).get("name", "?"), details.get("location", "?")]
+            row += [_amount(trend["current_gb"][index]), _amount(trend["growth_gb_per_day"][index] * MONTH_DAYS)]
+            row += [_amount(cost) for cost in costs[index].ravel()]
+            writer.write(row)
+
+# Two decimals, or N/A for a missing (NaN) value
+def _amount(value):
+    return "N/A" if value != value else f"{value:.2f}"
+
+# Comma separated StorageV2 access tiers to price, e.g. Hot,Cool,Archive
+def parse_access_tiers(value):
+    tiers = {tier.lower(): tier for tier in ACCESS_TIERS}
+    access_tiers = []
+    for name in value.split(","):
+        if not name.strip():
             continue
-        kind = details.get("kind", "?")
-        actual_redundancy = details.get("sku", {}).get("name", "?")
-        region = details.get("location", "uksouth")
-        # For pricing, always use ZRS if not already ZRS
-        redundancy_for_pricing = actual_redundancy
-        if not actual_redundancy.endswith("ZRS"):
-            redundancy_for_pricing = actual_redundancy.split('_')[0] + "_ZRS"
-            if DEBUG:
-                print(f"[INFO] Overriding redundancy for pricing to {redundancy_for_pricing}")
-        price_v1 = retry_api_call(get_blob_price, name, rg, sub, region, redundancy_for_pricing, kind="Storage")
-        price_block = retry_api_call(get_blob_price, name, rg, sub, region, redundancy_for_pricing, kind="BlockBlobStorage")
-        price_v2 = retry_api_call(get_blob_price, name, rg, sub, region, redundancy_for_pricing, kind="StorageV2")
-        row = [
-            name, rg, kind, actual_redundancy, region,
-            f"{price_v1:.2f}" if price_v1 is not None else "N/A",
-            f"{price_block:.2f}" if price_block is not None else "N/A",
-            f"{price_v2:.2f}" if price_v2 is not None else "N/A"
-        ]
-        table.append(row)
-        save_progress(table)
-    print("\n[RESULT] Blob Storage Price Comparison Table (for 1TB Hot Data):")
-    print(tabulate(table, headers=["Account_Name", "Resource_Group", "Kind", "Redundancy", "Region", "Storage_V1_(GBP)", "BlockBlob_(GBP)", "Storage_V2_(GBP)"]))
+        if name.strip().lower() not in tiers:
+            raise argparse.ArgumentTypeError(f"Unknown access tier '{name.strip()}', expected some of: {', '.join(ACCESS_TIERS)}")
+        access_tiers.append(tiers[name.strip().lower()])
+    return access_tiers
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare blob storage prices across storage account kinds")
+    parser.add_argument("--workers", type=int, default=1, help="Accounts discovered and priced concurrently (default: 1)")
+    parser.add_argument("--fresh", action="store_true", help="Ignore saved progress and start over")
+    parser.add_argument("--regions", type=parse_regions, help="Comma separated armRegionNames to price every account in, e.g. uksouth,ukwest (default: each account's own region)")
+    parser.add_argument("--access-tiers", type=parse_access_tiers, default=["Hot"], help=f"Comma separated StorageV2 access tiers to price, from {','.join(ACCESS_TIERS)} (default: Hot)")
+    parser.add_argument("--project", action="store_true", help="Project each account's monthly cost 3, 6 and 12 months ahead from its daily UsedCapacity trend (needs numpy)")
+    parser.add_argument("--history-days", type=int, default=HISTORY_DAYS, help=f"Days of daily UsedCapacity the --project trend is fitted to (default: {HISTORY_DAYS})")
+    parser.add_argument("--price-service", help="URL of a running price_service.py to get prices from instead of the API, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--format", choices=FORMATS, default="table", help="Result output: table (default), ndjson, csv, or parquet/arrow (need pyarrow); all but table are written as rows finish")
+    parser.add_argument("--output", help="Write the results to this file instead of stdout (required for parquet and arrow)")
+    parser.add_argument("--shard", type=parse_shard, help="Only process shard i of N, e.g. 2/4, with its own progress journal; accounts are split by a stable hash of their key")
+    parser.add_argument("--merge", type=int, metavar="N", help="Combine the journals of shards 1/N to N/N, in input order, into the final results instead of running")
+    parser.add_argument("--metrics-json", help="Write run metrics (phase timings, API and az call counts, latencies) to this JSON file")
+    parser.add_argument("--metrics-prom", help="Write run metrics to this Prometheus textfile (e.g. for node_exporter's textfile collector)")
+    args = parser.parse_args(argv)
+    if args.project and args.regions:
+        parser.error("--project prices each account in its own region; drop --regions")
+    if args.project and (args.shard or args.merge):
+        parser.error("--project runs over all accounts at once; it can't be combined with --shard or --merge")
+    if args.shard and args.merge:
+        parser.error("--shard and --merge can't be combined")
+    if args.merge is not None and args.merge < 1:
+        parser.error("--merge needs the number of shards, e.g. --merge 4")
+    if not 2 <= args.history_days <= 93:
+        parser.error("--history-days must be between 2 and 93 (Azure Monitor keeps 93 days of metrics)")
+    return args
+
+# Prices then come from a running price_service.py, which keeps them warm between runs
+def use_price_service(url):
+    global api_client
+    api_client = PriceServiceClient(url)
+    if DEBUG:
+        print(f"[INFO] Price service: {api_client}")
+
+# Data Stored rates of every blob product, access tier and redundancy, fetched once per region through api_client
+def use_blob_pricing():
+    global blob_prices
+    blob_prices = BlobPricingEngine(api_client)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # With csv or ndjson rows going to stdout, everything else printed goes to stderr
+    with rows_on_stdout(args.format, args.output):
+        run(args)
+
+def run(args):
+    headers = ["Account_Name", "Resource_Group", "Kind", "Redundancy", "Region"] + price_headers(args.regions, args.access_tiers)
+    if args.merge:
+        merge_shard_results(args, headers)
+        metrics.export(json_path=args.metrics_json, prom_path=args.metrics_prom)
+        return
+    if args.price_service:
+        use_price_service(args.price_service)
+    use_blob_pricing()
+    if args.project:
+        with metrics.phase("load"):
+            with open("blobs.json") as f:
+                accounts = json.load(f)
+        project_accounts(accounts, args)
+        metrics.export(json_path=args.metrics_json, prom_path=args.metrics_prom)
+        return
+    with metrics.phase("load"):
+        # Read blobs.json
+        with open("blobs.json") as f:
+            accounts = json.load(f)
+        # A shard keeps its own journal and only takes the accounts whose key hashes to it
+        journal = CheckpointJournal(shard_path(JOURNAL_FILE, args.shard), shard_path(RESULTS_FILE, args.shard))
+        if args.fresh:
+            journal.discard()
+        processed_keys = set(load_progress(journal) if args.shard is None else journal.keys())
+        try:
+            journal.check_width(len(headers))
+        except ValueError as e:
+            raise SystemExit(f"[ERROR] {e}; resume with the same --regions/--access-tiers options, or start over with --fresh")
+        pending = []
+        for acc in accounts:
+            if args.shard is not None and not in_shard(account_key(acc), args.shard):
+                continue
+            if account_key(acc) in processed_keys:
+                if DEBUG:
+                    print(f"[SKIP] Already processed {acc['name']} in {acc['resourceGroup']}")
+            else:
+                pending.append(acc)
+    with metrics.phase("discovery"):
+        if USE_RESOURCE_GRAPH:
+            discovered = discover_storage_accounts(pending, debug=DEBUG)
+        else:
+            discovered = [None] * len(pending)
+    with metrics.phase("metrics"):
+        # Fetch UsedCapacity for every account found, in batches, before pricing them
+        capacity_collector.collect([
+            (storage_account_id(acc["subscriptionId"], acc["resourceGroup"], acc["name"]), details["location"])
+            for acc, details in zip(pending, discovered)
+            if details and details.get("location")
+        ])
+    with metrics.phase("price_matrix"):
+        # One batched price fetch for every region that will be priced
+        blob_prices.load(args.regions or [details["location"] for details in discovered if details and details.get("location")])
+    if DEBUG:
+        print(f"[INFO] Blob pricing engine: {blob_prices}")
+    # Rows are written as they finish (saved rows of a resumed run first); the table format prints them at the end
+    with open_writer(args.format, args.output, headers, title="\n[RESULT] Blob Storage Price Comparison Table (for 1TB Hot Data):") as writer:
+        for _, row in journal.iter_entries():
+            writer.write(row)
+        with metrics.phase("pricing"):
+            for row in run_pipeline(zip(pending, discovered), discover_account,
+                                    functools.partial(price_account, regions=args.regions, access_tiers=args.access_tiers),
+                                    functools.partial(failed_account_row, regions=args.regions, access_tiers=args.access_tiers),
+                                    workers=args.workers):
+                writer.write(row)
+                save_progress(journal, row)
+        with metrics.phase("formatting"):
+            journal.compact()
+            writer.close()
+    metrics.export(json_path=args.metrics_json, prom_path=args.metrics_prom)
+    if DEBUG and getattr(api_client, "cache", None) is not None:
+        print(f"[INFO] Price cache: {api_client.cache.stats()}")
+    if DEBUG:
+        print(f"[INFO] Run metrics: {metrics.summary()}")
+
+# Combines the journals of an N-way sharded run (--merge N) into JOURNAL_FILE and RESULTS_FILE, in the order of
+# blobs.json, and writes the rows in the chosen format. Options that change the columns must match the shard runs.
+def merge_shard_results(args, headers):
+    with metrics.phase("load"):
+        with open("blobs.json") as f:
+            accounts = json.load(f)
+    first_row = first_shard_row(JOURNAL_FILE, args.merge)
+    if first_row is not None and len(first_row) != len(headers):
+        raise SystemExit(f"[ERROR] Shard rows have {len(first_row)} columns but the merge has {len(headers)}; merge with the same --regions/--access-tiers options as the shard runs")
+    # The merged journal replaces the current one only once it is complete
+    journal = CheckpointJournal(f"{JOURNAL_FILE}.merge", f"{RESULTS_FILE}.merge")
+    journal.discard()  # left over from an interrupted merge
+    missing = 0
+    with open_writer(args.format, args.output, headers, title="\n[RESULT] Blob Storage Price Comparison Table (for 1TB Hot Data):") as writer:
+        with metrics.phase("merge"):
+            for key, row in merge_shards((account_key(acc) for acc in accounts), JOURNAL_FILE, args.merge):
+                if row is None:
+                    missing += 1
+                    continue
+                if len(row) != len(headers):
+                    raise SystemExit(f"[ERROR] Shard rows have {len(row)} columns but the merge has {len(headers)}; merge with the same --regions/--access-tiers options as the shard runs")
+                writer.write(row)
+                save_progress(journal, row)
+        with metrics.phase("formatting"):
+            journal.compact()
+            writer.close()
+    journal.move_to(JOURNAL_FILE, RESULTS_FILE)
+    if missing:
+        print(f"[WARN] {missing} accounts have no saved row in their shard's journal; finish those shards and merge again")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,9 +1,35 @@
+import argparse
+import functools
 import subprocess
 import json
-from tabulate import tabulate
+import time
 from AzureRetailPricesApi import AzureRetailPricesClient
+from price_cache import PriceCache
+from price_snapshot import PriceSnapshot
+from price_store import PriceStore
+from price_catalog import PriceCatalog
+from price_service import PriceServiceClient
+from price_matrix import PriceMatrix, DISK_PRODUCTS, parse_regions
+from single_flight import memoize
+from resource_graph import discover_disks
+from pipeline import run_pipeline
+from checkpoint import CheckpointJournal
+from sharding import first_shard_row, in_shard, merge_shards, parse_shard, shard_path
+from disk_tiers import PREMIUM_SSD_TIERS, STANDARD_SSD_TIERS, tier_for_size
+from sku_optimizer import DiskOptimizer
+from instrumentation import metrics
+from result_writers import FORMATS, open_writer, rows_on_stdout
 
 DEBUG=None
+RESULTS_FILE = "results/disk_price_results.json"
+JOURNAL_FILE = "results/disk_price_results.jsonl"  # rows saved as they finish, so an interrupted run can resume
+PRICE_CACHE_DIR = None  # e.g. ".price_cache" to reuse price responses between runs
+PRICE_CACHE_TTL = 24 * 3600  # seconds
+PRICE_SNAPSHOT_FILE = None  # e.g. a file written by price_snapshot.py; lookups then make no API calls
+USE_RESOURCE_GRAPH = True  # resolve all disks with batched `az graph query` calls, falling back to `az disk show`
+PRICE_STORE_FILE = None  # e.g. a file written by price_store.py; like a snapshot, but memory-mapped and indexed
+PRICE_CATALOG_FILE = None  # e.g. a catalog kept current by price_catalog.py; used like a snapshot
+DEFAULT_REGIONS = ["uksouth"]  # regions priced when --regions is not given
 
 # Helper to run az cli and get disk details
 def get_disk_details(disk_name, resource_group, subscription):
@@ -16,7 +42,10 @@ def get_disk_details(disk_name, resource_group, subscription):
     ]
     if DEBUG:
         print(f"[INFO] Running: {' '.join(cmd)}")
+    start = time.perf_counter()
     result = subprocess.run(cmd, capture_output=True, text=True)
+    metrics.observe("az_call_seconds", time.perf_counter() - start, command="disk show")
+    metrics.incr("az_calls_total", command="disk show", outcome="ok" if result.returncode == 0 else "error")
     if result.returncode != 0:
         if DEBUG:
             print(f"[ERROR] Failed to get disk details: {result.stderr}")
@@ -31,7 +60,23 @@ def convert_usd_to_gbp(value):
     return float(value) * 0.75
 
 # Use AzureRetailPricesClient for all pricing queries
-api_client = AzureRetailPricesClient()
+# Prices come from a local store, snapshot or catalog when one is configured, otherwise from the API
+def create_price_client():
+    if PRICE_STORE_FILE:
+        return PriceStore(PRICE_STORE_FILE)
+    if PRICE_SNAPSHOT_FILE:
+        return PriceSnapshot.load(PRICE_SNAPSHOT_FILE)
+    if PRICE_CATALOG_FILE:
+        return PriceCatalog(PRICE_CATALOG_FILE).snapshot()
+    return AzureRetailPricesClient(
+        cache=PriceCache(PRICE_CACHE_DIR, ttl=PRICE_CACHE_TTL) if PRICE_CACHE_DIR else None
+    )
+
+api_client = create_price_client()
+
+# Disks that share an SKU and tier get the same price, so lookups are memoized for the whole run
+# (size_gb does not affect the per-disk price and is left out of the key)
+@memoize(ignore=("size_gb",))
 def get_disk_price(sku, size_gb, product_name, region="uksouth"):
     if '_' in sku:
         tier, redundancy = sku.split('_', 1)
@@ -75,6 +120,21 @@ def get_disk_price(sku, size_gb, product_name, region="uksouth"):
                 return convert_usd_to_gbp(price_usd)
     return None
 
+# Returns the Consumption price record whose meterName contains meter_substring, taking the highest
+# tierMinimumUnits: Provisioned IOPS and Throughput have a free (0 priced) first tier, and the paid tier
+# above it is the price that applies to what is provisioned beyond it. Every page is read, so the
+# complete result can be cached. Memoized, so each Premium SSD v2 meter is fetched once per region
+# rather than once per disk.
+@memoize
+def find_consumption_price(query_args, meter_substring):
+    def is_match(item):
+        return item.get("type") == "Consumption" and meter_substring in item.get("meterName", "")
+    found = None
+    for item in api_client.iter_query(predicate=is_match, **query_args):
+        if found is None or float(item.get("tierMinimumUnits") or 0.0) >= float(found.get("tierMinimumUnits") or 0.0):
+            found = item
+    return found
+
 def get_premiumv2_price(region, size_gb, iops, throughput, tierMinimumUnits=None):
     product_name = "Azure Premium SSD v2"
     sku_name = "Premium LRS"
@@ -87,61 +147,35 @@ def get_premiumv2_price(region, size_gb, iops, throughput, tierMinimumUnits=None
         'productName': product_name
     }
     if DEBUG:
-        print(f"[QUERY] api_client.query({cap_args}) for Premium SSD v2 Provisioned Capacity")
-    results = api_client.query(**cap_args)
-    if isinstance(results, str):
-        try:
-            results = json.loads(results)
-        except Exception:
-            print("[ERROR] Could not parse API result string.")
-            return None
-    if not isinstance(results, list):
-        print("[ERROR] Unexpected API result format.")
-        return None
-    for item in results:
-        if item.get("type") != "Consumption":
-            continue
-        meter = item.get("meterName", "")
-        if "Provisioned Capacity" in meter:
-            price_usd = float(item.get("retailPrice", 0.0))
-            price = convert_usd_to_gbp(price_usd)
-            cost = float(price) * float(size_gb) * 730.0
-            breakdown['capacity'] = cost
-            total += cost
-            if DEBUG:
-                print(f"[INFO] Capacity: {price_usd:.6f} USD, {price:.6f} GBP * {float(size_gb):.2f} * 730 = {cost:.6f} GBP")
+        print(f"[QUERY] api_client.iter_query({cap_args}) for Premium SSD v2 Provisioned Capacity")
+    item = find_consumption_price(cap_args, "Provisioned Capacity")
+    if item is not None:
+        price_usd = float(item.get("retailPrice", 0.0))
+        price = convert_usd_to_gbp(price_usd)
+        cost = float(price) * float(size_gb) * 730.0
+        breakdown['capacity'] = cost
+        total += cost
+        if DEBUG:
+            print(f"[INFO] Capacity: {price_usd:.6f} USD, {price:.6f} GBP * {float(size_gb):.2f} * 730 = {cost:.6f} GBP")
     # 2. Provisioned IOPS (no tierMinimumUnits, but must check against throughput tierMinimumUnits)
     if DEBUG:
-        print(f"[QUERY] api_client.query({cap_args}) for Premium SSD v2 Provisioned IOPS")
-    results = api_client.query(**cap_args)
-    if isinstance(results, str):
-        try:
-            results = json.loads(results)
-        except Exception:
-            print("[ERROR] Could not parse API result string.")
-            return None
-    if not isinstance(results, list):
-        print("[ERROR] Unexpected API result format.")
-        return None
+        print(f"[QUERY] api_client.iter_query({cap_args}) for Premium SSD v2 Provisioned IOPS")
+    item = find_consumption_price(cap_args, "Provisioned IOPS")
     # Set the tierMinimumUnits for IOPS
     iops_tier_min = 3000.0
-    for item in results:
-        if item.get("type") != "Consumption":
-            continue
-        meter = item.get("meterName", "")
-        if "Provisioned IOPS" in meter:
-            price_usd = float(item.get("retailPrice", 0.0))
-            price = convert_usd_to_gbp(price_usd)
-            if float(iops) <= iops_tier_min:
-                cost = 0.0
-                if DEBUG:
-                    print(f"[INFO] IOPS: {float(iops):.2f} <= {iops_tier_min} (tierMinimumUnits), cost is 0.0 GBP")
-            else:
-                cost = float(price) * (float(iops) - iops_tier_min) * 730.0
-                if DEBUG:
-                    print(f"[INFO] IOPS: {price_usd:.6f} USD, {price:.6f} GBP * ({float(iops):.2f} - {iops_tier_min}) * 730 = {cost:.6f} GBP")
-            breakdown['iops'] = cost
-            total += cost
+    if item is not None:
+        price_usd = float(item.get("retailPrice", 0.0))
+        price = convert_usd_to_gbp(price_usd)
+        if float(iops) <= iops_tier_min:
+            cost = 0.0
+            if DEBUG:
+                print(f"[INFO] IOPS: {float(iops):.2f} <= {iops_tier_min} (tierMinimumUnits), cost is 0.0 GBP")
+        else:
+            cost = float(price) * (float(iops) - iops_tier_min) * 730.0
+            if DEBUG:
+                print(f"[INFO] IOPS: {price_usd:.6f} USD, {price:.6f} GBP * ({float(iops):.2f} - {iops_tier_min}) * 730 = {cost:.6f} GBP")
+        breakdown['iops'] = cost
+        total += cost
     # 3. Provisioned Throughput (with tierMinimumUnits)
     throughput_args = {
         'armRegionName': region,
@@ -150,35 +184,22 @@ def get_premiumv2_price(region, size_gb, iops, throughput, tierMinimumUnits=None
         'tierMinimumUnits': 125.0
     }
     if DEBUG:
-        print(f"[QUERY] api_client.query({throughput_args}) for Premium SSD v2 Provisioned Throughput")
-    results = api_client.query(**throughput_args)
-    if isinstance(results, str):
-        try:
-            results = json.loads(results)
-        except Exception:
-            print("[ERROR] Could not parse API result string.")
-            return None
-    if not isinstance(results, list):
-        print("[ERROR] Unexpected API result format.")
-        return None
-    for item in results:
-        if item.get("type") != "Consumption":
-            continue
-        meter = item.get("meterName", "")
-        if "Provisioned Throughput" in meter:
-            price_usd = float(item.get("retailPrice", 0.0))
-            price = convert_usd_to_gbp(price_usd)
-            throughput_tier_min = 125.0
-            if float(throughput) <= throughput_tier_min:
-                cost = 0.0
-                if DEBUG:
-                    print(f"[INFO] Throughput: {float(throughput):.2f} <= {throughput_tier_min} (tierMinimumUnits), cost is 0.0 GBP")
-            else:
-                cost = float(price) * (float(throughput) - throughput_tier_min) * 730.0
-                if DEBUG:
-                    print(f"[INFO] Throughput: {price_usd:.6f} USD, {price:.6f} GBP * ({float(throughput):.2f} - {throughput_tier_min}) * 730 = {cost:.6f} GBP")
-            breakdown['throughput'] = cost
-            total += cost
+        print(f"[QUERY] api_client.iter_query({throughput_args}) for Premium SSD v2 Provisioned Throughput")
+    item = find_consumption_price(throughput_args, "Provisioned Throughput")
+    if item is not None:
+        price_usd = float(item.get("retailPrice", 0.0))
+        price = convert_usd_to_gbp(price_usd)
+        throughput_tier_min = 125.0
+        if float(throughput) <= throughput_tier_min:
+            cost = 0.0
+            if DEBUG:
+                print(f"[INFO] Throughput: {float(throughput):.2f} <= {throughput_tier_min} (tierMinimumUnits), cost is 0.0 GBP")
+        else:
+            cost = float(price) * (float(throughput) - throughput_tier_min) * 730.0
+            if DEBUG:
+                print(f"[INFO] Throughput: {price_usd:.6f} USD, {price:.6f} GBP * ({float(throughput):.2f} - {throughput_tier_min}) * 730 = {cost:.6f} GBP")
+        breakdown['throughput'] = cost
+        total += cost
     if not breakdown:
         print(f"[WARN] No Premium SSD v2 price components found for region {region}")
         return None
@@ -186,150 +207,282 @@ def get_premiumv2_price(region, size_gb, iops, throughput, tierMinimumUnits=None
         print(f"[INFO] Premium SSD v2 price breakdown: {breakdown}, total: {total}")
     return total
     
+# Price/performance frontier across S, E, P, Premium SSD v2 and Ultra, built once per region and redundancy
+# (Premium SSD v2 and Ultra are only sold as LRS, so other redundancies compare S, E and P only)
+@memoize
+def get_disk_optimizer(region, redundancy="LRS"):
+    return DiskOptimizer.build(api_client, region, redundancy)
+
 def get_standardssd_tier(size_gb):
-    # Mapping based on Azure Standard SSD disk sizes (as of 2024)
-    # https://learn.microsoft.com/en-us/azure/virtual-machines/disks-types#standard-ssd
-    # This can be extended as needed
-    size_to_tier = [
-        (4, "E1"),
-        (8, "E2"),
-        (16, "E3"),
-        (32, "E4"),
-        (64, "E6"),
-        (128, "E10"),
-        (256, "E15"), 
-        (512, "E20"),
-        (1024, "E30"),
-        (2048, "E40"),
-        (4096, "E50"),
-        (8192, "E60"),
-        (16384, "E70"),
-        (32767, "E80"),
-    ]
-    for max_size, tier in size_to_tier:
-        if size_gb <= max_size:
-            return tier
-    return f"E{size_gb}"  # fallback
+    # Tier sizes are in disk_tiers.STANDARD_SSD_TIERS
+    return tier_for_size(STANDARD_SSD_TIERS, size_gb) or f"E{size_gb}"  # fallback
 
 def get_premiumssd_tier(size_gb):
-    # Mapping based on Azure Standard SSD disk sizes (as of 2024)
-    # https://learn.microsoft.com/en-us/azure/virtual-machines/disks-types#standard-ssd
-    # This can be extended as needed
-    size_to_tier = [
-        (4, "P1"),
-        (8, "P2"),
-        (16, "P3"),
-        (32, "P4"),
-        (64, "P6"),
-        (128, "P10"),
-        (256, "P15"), 
-        (512, "P20"),
-        (1024, "P30"),
-        (2048, "P40"),
-        (4096, "P50"),
-        (8192, "P60"),
-        (16384, "P70"),
-        (32767, "P80"),
-    ]
-    for max_size, tier in size_to_tier:
-        if size_gb <= max_size:
-            return tier
-    return f"P{size_gb}"  # fallback
+    # Tier sizes are in disk_tiers.PREMIUM_SSD_TIERS
+    return tier_for_size(PREMIUM_SSD_TIERS, size_gb) or f"P{size_gb}"  # fallback
 
-# Main logic
-def main():
-    # Read disks from disks.json and take the first five
-    with open("disks.json") as f:
-        all_disks = json.load(f)
-    disks = all_disks
-    table = []
-    for idx, disk in enumerate(disks, 1):
-        # Support both 'diskname'/'resourcegroup' and 'name'/'resource_group' keys
-        disk_name = disk.get("diskname") or disk.get("name")
-        resource_group = disk.get("resourcegroup") or disk.get("resourceGroup")
-        subscription = disk.get("subscription") or disk.get("subscriptionId")
-        if DEBUG:
-            print(f"\n[INFO] Processing disk {idx}: {disk_name} in resource group {resource_group}")
-        try:
-            details = get_disk_details(disk_name, resource_group, subscription)
-        except Exception as e:
-            if DEBUG:
-                print(f"[WARN] Disk '{disk_name}' in resource group '{resource_group}' not found or error occurred: {e}. Marking as N/A.")
-            # Output all columns as N/A for this disk
-            table.append([
-                disk_name or "N/A",
-                "N/A",  # Size (GB)
-                "N/A",  # SKU
-                "N/A",  # IOPS
-                "N/A",  # Throughput (MBps)
-                "N/A",  # Existing Price
-                "N/A",  # Standard Price
-                "N/A"   # PremiumV2 Price
-            ])
-            continue
-        if DEBUG:
-            print(f"[DEBUG] Disk details: {details}")
-        size_gb = details["diskSizeGB"]
-        sku = details["sku"]["name"]
-        # Example: 'Premium_LRS' or 'StandardSSD_LRS'
-        if '_' in sku:
-            tier, redundancy = sku.split('_', 1)
-            # Infer the performance tier if not explicitly set
-            disk_tier = details.get("tier")
-            if not disk_tier or disk_tier == "?":
-                if tier == "Premium":
-                    disk_tier = get_premiumssd_tier(size_gb)
-                elif tier == "StandardSSD":
-                    disk_tier = get_standardssd_tier(size_gb)
-                else:
-                    disk_tier = tier  # fallback
+# Disk name, resource group and subscription, supporting both 'diskname'/'resourcegroup' and 'name'/'resourceGroup' keys
+def disk_identity(disk):
+    disk_name = disk.get("diskname") or disk.get("name")
+    resource_group = disk.get("resourcegroup") or disk.get("resourceGroup")
+    subscription = disk.get("subscription") or disk.get("subscriptionId")
+    return disk_name, resource_group, subscription
+
+# Unique key used to resume a run
+def disk_key(disk):
+    disk_name, resource_group, _ = disk_identity(disk)
+    return f"{disk_name}|{resource_group}"
+
+# Pipeline stage 1: disk details, from the batched Resource Graph results or `az disk show`
+def discover_disk(item):
+    idx, disk, details = item
+    disk_name, resource_group, subscription = disk_identity(disk)
+    if DEBUG:
+        print(f"\n[INFO] Processing disk {idx}: {disk_name} in resource group {resource_group}")
+    return details or get_disk_details(disk_name, resource_group, subscription)
+
+# Price columns for each region; names carry the region when more than one is priced
+def price_headers(regions):
+    names = ["Existing_Price", "Standard_Price", "PremiumV2_Price"]
+    if len(regions) == 1:
+        return names
+    return [f"{name}_{region}" for region in regions for name in names]
+
+# Cheapest SKU columns of --optimize, one pair per region like the price columns
+def cheapest_headers(regions):
+    names = ["Cheapest_SKU", "Cheapest_Price"]
+    if len(regions) == 1:
+        return names
+    return [f"{name}_{region}" for region in regions for name in names]
+
+# Output all columns as N/A for a disk that could not be found or priced
+def failed_disk_row(item, error, optimize=False, regions=DEFAULT_REGIONS):
+    idx, disk, _ = item
+    disk_name, resource_group, _ = disk_identity(disk)
+    if DEBUG:
+        print(f"[WARN] Disk '{disk_name}' in resource group '{resource_group}' not found or error occurred: {error}. Marking as N/A.")
+    return [
+        disk_name or "N/A",
+        "N/A",  # Size (GB)
+        "N/A",  # SKU
+        "N/A",  # IOPS
+        "N/A"   # Throughput (MBps)
+    ] + ["N/A", "N/A", "N/A"] * len(regions) + (["N/A", "N/A"] * len(regions) if optimize else [])  # Existing, Standard and PremiumV2 price per region; cheapest SKU and price per region
+
+# Pipeline stage 2: prices for the disk's current SKU, Standard SSD and Premium SSD v2 in each region
+def price_disk(item, details, optimize=False, regions=DEFAULT_REGIONS):
+    idx, disk, _ = item
+    disk_name, resource_group, subscription = disk_identity(disk)
+    if DEBUG:
+        print(f"[DEBUG] Disk details: {details}")
+    size_gb = details["diskSizeGB"]
+    sku = details["sku"]["name"]
+    # Example: 'Premium_LRS' or 'StandardSSD_LRS'
+    if '_' in sku:
+        tier, redundancy = sku.split('_', 1)
+        # Infer the performance tier if not explicitly set
+        disk_tier = details.get("tier")
+        if not disk_tier or disk_tier == "?":
             if tier == "Premium":
-                existing_sku = f"{disk_tier} {redundancy}"
+                disk_tier = get_premiumssd_tier(size_gb)
+            elif tier == "StandardSSD":
+                disk_tier = get_standardssd_tier(size_gb)
             else:
-                existing_sku = f"{tier} {redundancy}"
-            # Standard SSD logic: get correct tier for size
-            standardssd_tier = get_standardssd_tier(size_gb)
-            premiumssd_tier = get_premiumssd_tier(size_gb)
-            standard_sku = f"{standardssd_tier} {redundancy}"
-            premium_sku = f"{premiumssd_tier} {redundancy}"
-        iops = details.get("diskIOPSReadWrite", "?")
-        throughput = details.get("diskMBpsReadWrite", "?")
-        if DEBUG:
-            print(f"will search prices for '{existing_sku}'")
+                disk_tier = tier  # fallback
         if tier == "Premium":
-            product_name = "Premium SSD Managed Disks"
+            existing_sku = f"{disk_tier} {redundancy}"
         else:
-            product_name = "Standard SSD Managed Disks"
+            existing_sku = f"{tier} {redundancy}"
+        # Standard SSD logic: get correct tier for size
+        standardssd_tier = get_standardssd_tier(size_gb)
+        premiumssd_tier = get_premiumssd_tier(size_gb)
+        standard_sku = f"{standardssd_tier} {redundancy}"
+        premium_sku = f"{premiumssd_tier} {redundancy}"
+    iops = details.get("diskIOPSReadWrite", "?")
+    throughput = details.get("diskMBpsReadWrite", "?")
+    if DEBUG:
+        print(f"will search prices for '{existing_sku}'")
+    if tier == "Premium":
+        product_name = "Premium SSD Managed Disks"
+    else:
+        product_name = "Standard SSD Managed Disks"
 
+    # Format prices for table output with 6 decimal places
+    def fmt(val):
+        if isinstance(val, float):
+            return f"{val:.6f}"
+        return val
+    row = [disk_name, size_gb, sku, iops, throughput]
+    cheapest_columns = []
+    for region in regions:
+        where = f" in {region}" if len(regions) > 1 else ""
         # Get prices using correct formatted SKUs
         if DEBUG:
-            print(f"Get existing price")
-        existing_price = get_disk_price(existing_sku, size_gb, product_name)
+            print(f"Get existing price{where}")
+        existing_price = get_disk_price(existing_sku, size_gb, product_name, region)
         # For Standard SSD, set productName and use correct skuName
         if DEBUG:
-            print(f"Get standard price")
-        standard_price = get_disk_price(standard_sku, size_gb, "Standard SSD Managed Disks")
+            print(f"Get standard price{where}")
+        standard_price = get_disk_price(standard_sku, size_gb, "Standard SSD Managed Disks", region)
         if DEBUG:
-            print(f"Get premiumv2 price")
-        premiumv2_price = get_premiumv2_price("uksouth", size_gb, iops, throughput)
+            print(f"Get premiumv2 price{where}")
+        premiumv2_price = get_premiumv2_price(region, size_gb, iops, throughput)
         if DEBUG:
             print(f"Existing price is '{existing_price}'")
         if existing_price is None:
-            print(f"[WARN] No existing price found for {disk_name} ({existing_sku})")
+            print(f"[WARN] No existing price found for {disk_name} ({existing_sku}){where}")
         if standard_price is None:
-            print(f"[WARN] No StandardSSD price found for {disk_name}")
+            print(f"[WARN] No StandardSSD price found for {disk_name}{where}")
         if premiumv2_price is None:
-            print(f"[WARN] No PremiumV2 price found for {disk_name}")
-        # Format prices for table output with 6 decimal places
-        def fmt(val):
-            if isinstance(val, float):
-                return f"{val:.6f}"
-            return val
-        table.append([
-            disk_name, size_gb, sku, iops, throughput, fmt(existing_price), fmt(standard_price), fmt(premiumv2_price)
-        ])
-    print("\n[RESULT] Disk Price Comparison Table:")
-    print(tabulate(table, headers=["Disk_Name", "Size_GB", "SKU", "IOPS", "Throughput_MBps", "Existing_Price", "Standard_Price", "PremiumV2_Price"]))
+            print(f"[WARN] No PremiumV2 price found for {disk_name}{where}")
+        row += [fmt(existing_price), fmt(standard_price), fmt(premiumv2_price)]
+        if optimize:
+            # Only SKUs with the disk's own redundancy are candidates
+            cheapest = get_disk_optimizer(region, redundancy).cheapest(size_gb, number_or_zero(iops), number_or_zero(throughput))
+            cheapest_columns += [cheapest[0], fmt(cheapest[1])] if cheapest else ["N/A", "N/A"]
+    return row + cheapest_columns
+
+def number_or_zero(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare managed disk prices across SKUs")
+    parser.add_argument("--workers", type=int, default=1, help="Disks discovered and priced concurrently (default: 1)")
+    parser.add_argument("--fresh", action="store_true", help="Ignore saved progress and start over")
+    parser.add_argument("--regions", type=parse_regions, help="Comma separated armRegionNames to price every disk in, e.g. uksouth,ukwest,westeurope (default: uksouth)")
+    parser.add_argument("--optimize", action="store_true", help="Add the cheapest SKU (S/E/P, Premium SSD v2 or Ultra) that meets each disk's size, IOPS and throughput")
+    parser.add_argument("--price-service", help="URL of a running price_service.py to get prices from instead of the API, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--format", choices=FORMATS, default="table", help="Result output: table (default), ndjson, csv, or parquet/arrow (need pyarrow); all but table are written as rows finish")
+    parser.add_argument("--output", help="Write the results to this file instead of stdout (required for parquet and arrow)")
+    parser.add_argument("--shard", type=parse_shard, help="Only process shard i of N, e.g. 2/4, with its own progress journal; resources are split by a stable hash of their key")
+    parser.add_argument("--merge", type=int, metavar="N", help="Combine the journals of shards 1/N to N/N, in input order, into the final results instead of running")
+    parser.add_argument("--metrics-json", help="Write run metrics (phase timings, API and az call counts, latencies) to this JSON file")
+    parser.add_argument("--metrics-prom", help="Write run metrics to this Prometheus textfile (e.g. for node_exporter's textfile collector)")
+    args = parser.parse_args(argv)
+    if args.shard and args.merge:
+        parser.error("--shard and --merge can't be combined")
+    if args.merge is not None and args.merge < 1:
+        parser.error("--merge needs the number of shards, e.g. --merge 4")
+    return args
+
+# Prices then come from a running price_service.py, which keeps them warm between runs
+def use_price_service(url):
+    global api_client
+    api_client = PriceServiceClient(url)
+    if DEBUG:
+        print(f"[INFO] Price service: {api_client}")
+
+# Fetches the disk prices of all regions in one batched pass; the pricing helpers then read from it
+def use_price_matrix(regions):
+    global api_client
+    with metrics.phase("price_matrix"):
+        api_client = PriceMatrix.fetch(api_client, regions, DISK_PRODUCTS)
+    if DEBUG:
+        print(f"[INFO] Price matrix: {api_client}")
+
+# Main logic
+def main(argv=None):
+    args = parse_args(argv)
+    # With csv or ndjson rows going to stdout, everything else printed goes to stderr
+    with rows_on_stdout(args.format, args.output):
+        run(args)
+
+def run(args):
+    regions = args.regions or DEFAULT_REGIONS
+    headers = ["Disk_Name", "Size_GB", "SKU", "IOPS", "Throughput_MBps"] + price_headers(regions)
+    if args.optimize:
+        headers += cheapest_headers(regions)
+    if args.merge:
+        merge_shard_results(args, headers)
+        metrics.export(json_path=args.metrics_json, prom_path=args.metrics_prom)
+        return
+    if args.price_service:
+        use_price_service(args.price_service)
+    if args.regions:
+        use_price_matrix(regions)
+    with metrics.phase("load"):
+        # Read disks from disks.json
+        with open("disks.json") as f:
+            all_disks = json.load(f)
+        # A shard keeps its own journal and only takes the disks whose key hashes to it
+        journal = CheckpointJournal(shard_path(JOURNAL_FILE, args.shard), shard_path(RESULTS_FILE, args.shard))
+        if args.fresh:
+            journal.discard()
+        processed_keys = set(journal.keys())
+        try:
+            journal.check_width(len(headers))
+        except ValueError as e:
+            raise SystemExit(f"[ERROR] {e}; resume with the same --regions/--optimize options, or start over with --fresh")
+        pending = [(idx, disk) for idx, disk in enumerate(all_disks, 1)
+                   if disk_key(disk) not in processed_keys and (args.shard is None or in_shard(disk_key(disk), args.shard))]
+    if DEBUG and processed_keys:
+        print(f"[SKIP] {len(processed_keys)} disks already processed")
+    disks = [disk for _, disk in pending]
+    with metrics.phase("discovery"):
+        discovered = discover_disks(disks, debug=DEBUG) if USE_RESOURCE_GRAPH else [None] * len(disks)
+    items = [(idx, disk, details) for (idx, disk), details in zip(pending, discovered)]
+    # Rows are written as they finish (saved rows of a resumed run first); the table format prints them at the end
+    with open_writer(args.format, args.output, headers, title="\n[RESULT] Disk Price Comparison Table:") as writer:
+        for _, row in journal.iter_entries():
+            writer.write(row)
+        with metrics.phase("pricing"):
+            for item, row in zip(items, run_pipeline(
+                    items, discover_disk,
+                    functools.partial(price_disk, optimize=args.optimize, regions=regions),
+                    functools.partial(failed_disk_row, optimize=args.optimize, regions=regions),
+                    workers=args.workers)):
+                writer.write(row)
+                journal.append(disk_key(item[1]), row)
+        with metrics.phase("formatting"):
+            journal.compact()
+            writer.close()
+    record_memo_metrics()
+    metrics.export(json_path=args.metrics_json, prom_path=args.metrics_prom)
+    if DEBUG and getattr(api_client, "cache", None) is not None:
+        print(f"[INFO] Price cache: {api_client.cache.stats()}")
+    if DEBUG:
+        print(f"[INFO] Memoized disk prices: {get_disk_price.cache_stats()}, Premium SSD v2 meters: {find_consumption_price.cache_stats()}")
+        print(f"[INFO] Run metrics: {metrics.summary()}")
+
+# Combines the journals of an N-way sharded run (--merge N) into JOURNAL_FILE and RESULTS_FILE, in the order of
+# disks.json, and writes the rows in the chosen format. Options that change the columns must match the shard runs.
+def merge_shard_results(args, headers):
+    with metrics.phase("load"):
+        with open("disks.json") as f:
+            all_disks = json.load(f)
+    first_row = first_shard_row(JOURNAL_FILE, args.merge)
+    if first_row is not None and len(first_row) != len(headers):
+        raise SystemExit(f"[ERROR] Shard rows have {len(first_row)} columns but the merge has {len(headers)}; merge with the same --regions/--optimize options as the shard runs")
+    # The merged journal replaces the current one only once it is complete
+    journal = CheckpointJournal(f"{JOURNAL_FILE}.merge", f"{RESULTS_FILE}.merge")
+    journal.discard()  # left over from an interrupted merge
+    missing = 0
+    with open_writer(args.format, args.output, headers, title="\n[RESULT] Disk Price Comparison Table:") as writer:
+        with metrics.phase("merge"):
+            for key, row in merge_shards((disk_key(disk) for disk in all_disks), JOURNAL_FILE, args.merge):
+                if row is None:
+                    missing += 1
+                    continue
+                if len(row) != len(headers):
+                    raise SystemExit(f"[ERROR] Shard rows have {len(row)} columns but the merge has {len(headers)}; merge with the same --regions/--optimize options as the shard runs")
+                writer.write(row)
+                journal.append(key, row)
+        with metrics.phase("formatting"):
+            journal.compact()
+            writer.close()
+    journal.move_to(JOURNAL_FILE, RESULTS_FILE)
+    if missing:
+        print(f"[WARN] {missing} disks have no saved row in their shard's journal; finish those shards and merge again")
+
+# Hit/miss counts of the memoized pricing helpers, as gauges in the run metrics
+def record_memo_metrics():
+    for name, func in (("get_disk_price", get_disk_price), ("find_consumption_price", find_consumption_price), ("get_disk_optimizer", get_disk_optimizer)):
+        stats = func.cache_stats()
+        metrics.set_gauge("memo_lookups", stats['hits'], function=name, result="hit")
+        metrics.set_gauge("memo_lookups", stats['misses'], function=name, result="miss")
 
 if __name__ == "__main__":
     main()
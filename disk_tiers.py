@@ -0,0 +1,75 @@
+#########################################################################################
+#
+#    Managed disk performance tiers
+#    Size, IOPS and throughput limits per tier, based on the Azure disk types documentation
+#    (as of 2024): https://learn.microsoft.com/en-us/azure/virtual-machines/disks-types
+#    Each table is ordered by size, and IOPS/MBps never decrease with size, so the smallest
+#    tier that fits a requirement can be found by bisection.
+#
+#########################################################################################
+
+import bisect
+
+# (max_size_gb, tier, max_iops, max_mbps)
+STANDARD_HDD_TIERS = [
+    (32, "S4", 500, 60),
+    (64, "S6", 500, 60),
+    (128, "S10", 500, 60),
+    (256, "S15", 500, 60),
+    (512, "S20", 500, 60),
+    (1024, "S30", 500, 60),
+    (2048, "S40", 500, 60),
+    (4096, "S50", 500, 60),
+    (8192, "S60", 1300, 300),
+    (16384, "S70", 2000, 500),
+    (32767, "S80", 2000, 500),
+]
+
+STANDARD_SSD_TIERS = [
+    (4, "E1", 500, 100),
+    (8, "E2", 500, 100),
+    (16, "E3", 500, 100),
+    (32, "E4", 500, 100),
+    (64, "E6", 500, 100),
+    (128, "E10", 500, 100),
+    (256, "E15", 500, 100),
+    (512, "E20", 500, 100),
+    (1024, "E30", 500, 100),
+    (2048, "E40", 500, 100),
+    (4096, "E50", 500, 100),
+    (8192, "E60", 2000, 400),
+    (16384, "E70", 4000, 600),
+    (32767, "E80", 6000, 750),
+]
+
+PREMIUM_SSD_TIERS = [
+    (4, "P1", 120, 25),
+    (8, "P2", 120, 25),
+    (16, "P3", 120, 25),
+    (32, "P4", 120, 25),
+    (64, "P6", 240, 50),
+    (128, "P10", 500, 100),
+    (256, "P15", 1100, 125),
+    (512, "P20", 2300, 150),
+    (1024, "P30", 5000, 200),
+    (2048, "P40", 7500, 250),
+    (4096, "P50", 7500, 250),
+    (8192, "P60", 16000, 500),
+    (16384, "P70", 18000, 750),
+    (32767, "P80", 20000, 900),
+]
+
+# SKU tier prefix (as in 'Premium_LRS') -> (tier table, productName in the Retail Prices API)
+DISK_FAMILIES = {
+    "Standard": (STANDARD_HDD_TIERS, "Standard HDD Managed Disks"),
+    "StandardSSD": (STANDARD_SSD_TIERS, "Standard SSD Managed Disks"),
+    "Premium": (PREMIUM_SSD_TIERS, "Premium SSD Managed Disks"),
+}
+
+
+# Smallest tier whose size is at least size_gb, or None if the disk is larger than the biggest tier
+def tier_for_size(tiers, size_gb):
+    index = bisect.bisect_left(tiers, (size_gb,))
+    if index < len(tiers):
+        return tiers[index][1]
+    return None
@@ -0,0 +1,219 @@
+#########################################################################################
+#
+#    Run instrumentation: counters, gauges, latency histograms and phase timers
+#    The pricing client, the az CLI helper, the rate controller and the pipeline record into
+#    one process-wide registry, which the scripts export at the end of a run:
+#
+#       from instrumentation import metrics
+#       with metrics.phase("discovery"):
+#           ...
+#       metrics.incr("price_api_requests_total", status=200)
+#       metrics.observe("price_api_request_seconds", 0.123)
+#       metrics.export(json_path="results/metrics.json", prom_path="/var/lib/node_exporter/azure_pricing.prom")
+#
+#   The Prometheus file uses the text exposition format, for node_exporter's textfile collector.
+#   Both files are replaced atomically, so a collector never reads a half-written file.
+#
+#########################################################################################
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+METRIC_PREFIX = "azure_pricing_"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# HELP lines for the Prometheus export
+DESCRIPTIONS = {
+    "phase_seconds_total": "Wall time spent in each phase of the run",
+    "price_api_requests_total": "Retail Prices API requests by HTTP status",
+    "price_api_request_seconds": "Retail Prices API request latency",
+    "price_api_pages_total": "Retail Prices API pages received",
+    "price_api_records_total": "Price records received from the Retail Prices API",
+    "price_api_bytes_total": "Retail Prices API response bytes (as sent, i.e. compressed when gzip was used)",
+    "price_api_retries_total": "Retail Prices API requests retried after a throttle or server error",
+    "price_api_throttles_total": "Retail Prices API 429 responses",
+    "price_api_rate": "Requests per second currently allowed by the rate controller",
+    "price_cache_lookups_total": "Price cache lookups by result (hit, miss, expired, stale)",
+    "memo_lookups": "Memoized pricing helper lookups by result (hit, miss)",
+    "az_calls_total": "Azure CLI calls by command and outcome",
+    "az_call_seconds": "Azure CLI call duration",
+    "pipeline_item_seconds": "Time to discover or price one resource",
+    "resources_total": "Resources processed by outcome",
+    "price_service_request_seconds": "Price service request latency by endpoint",
+    "price_service_load_seconds": "Time for the price service to load (region, product) pairs into its index",
+}
+
+
+class Metrics:
+
+    # Init Function
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __str__(self) -> str:
+        return f'(counters: {len(self._counters)}, gauges: {len(self._gauges)}, histograms: {len(self._histograms)})'
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters = {}
+            self._gauges = {}
+            self._histograms = {}
+            self.started = time.time()
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]  # bucket counts (last is +Inf), count, sum
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    break
+            else:
+                index = len(self.buckets)
+            histogram[0][index] += 1
+            histogram[1] += 1
+            histogram[2] += value
+
+    # Records the duration of the block in a histogram
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # Adds the duration of the block to the phase_seconds_total counter of that phase
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.incr("phase_seconds_total", time.perf_counter() - start, phase=name)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (list(value[0]), value[1], value[2]) for key, value in self._histograms.items()}
+        return dict({
+            'started': datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            'duration_seconds': time.time() - self.started,
+            'counters': [dict({'name': name, 'labels': dict(labels), 'value': value}) for (name, labels), value in sorted(counters.items())],
+            'gauges': [dict({'name': name, 'labels': dict(labels), 'value': value}) for (name, labels), value in sorted(gauges.items())],
+            'histograms': [dict({
+                'name': name,
+                'labels': dict(labels),
+                'count': count,
+                'sum': total,
+                'buckets': {str(bound): bucket for bound, bucket in zip(list(self.buckets) + ['+Inf'], _cumulative(buckets))}
+            }) for (name, labels), (buckets, count, total) in sorted(histograms.items())]
+        })
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    # Text exposition format: https://prometheus.io/docs/instrumenting/exposition_formats/
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in DESCRIPTIONS:
+                    lines.append(f"# HELP {METRIC_PREFIX}{name} {DESCRIPTIONS[name]}")
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+
+        for entry in snapshot['counters']:
+            header(entry['name'], "counter")
+            lines.append(f"{METRIC_PREFIX}{entry['name']}{_format_labels(entry['labels'])} {_format_value(entry['value'])}")
+        for entry in snapshot['gauges']:
+            header(entry['name'], "gauge")
+            lines.append(f"{METRIC_PREFIX}{entry['name']}{_format_labels(entry['labels'])} {_format_value(entry['value'])}")
+        for entry in snapshot['histograms']:
+            header(entry['name'], "histogram")
+            for bound, count in entry['buckets'].items():
+                lines.append(f"{METRIC_PREFIX}{entry['name']}_bucket{_format_labels(dict(entry['labels'], le=bound))} {count}")
+            lines.append(f"{METRIC_PREFIX}{entry['name']}_sum{_format_labels(entry['labels'])} {_format_value(entry['sum'])}")
+            lines.append(f"{METRIC_PREFIX}{entry['name']}_count{_format_labels(entry['labels'])} {entry['count']}")
+        header("run_duration_seconds", "gauge")
+        lines.append(f"{METRIC_PREFIX}run_duration_seconds {_format_value(snapshot['duration_seconds'])}")
+        header("run_start_time_seconds", "gauge")
+        lines.append(f"{METRIC_PREFIX}run_start_time_seconds {_format_value(self.started)}")
+        return "\n".join(lines) + "\n"
+
+    # Writes the JSON and/or Prometheus textfile export
+    def export(self, json_path: str = None, prom_path: str = None) -> None:
+        if json_path:
+            _atomic_write(json_path, self.to_json())
+        if prom_path:
+            _atomic_write(prom_path, self.to_prometheus())
+
+    # Short per-phase and per-request summary, for DEBUG output
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        phases = ", ".join(f"{entry['labels']['phase']} {entry['value']:.2f}s" for entry in snapshot['counters'] if entry['name'] == "phase_seconds_total")
+        requests = sum(entry['value'] for entry in snapshot['counters'] if entry['name'] == "price_api_requests_total")
+        az_calls = sum(entry['value'] for entry in snapshot['counters'] if entry['name'] == "az_calls_total")
+        return f"phases: {phases or 'none'}; price API requests: {requests:g}; az calls: {az_calls:g}"
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _cumulative(buckets: list) -> list:
+    total, result = 0, []
+    for count in buckets:
+        total += count
+        result.append(total)
+    return result
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items())) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _atomic_write(path: str, content: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+# Process-wide registry used by the client, the helpers and the scripts
+metrics = Metrics()
@@ -0,0 +1,72 @@
+#########################################################################################
+#
+#    Concurrent, order-preserving worker pipeline for the compare_*_prices scripts
+#    Each input item goes through two stages with their own bounded thread pools:
+#
+#       discover(item) -> details         subprocess-bound (az CLI calls, metrics)
+#       price(item, details) -> row       network-bound (Retail Prices API)
+#
+#   Rows are yielded in input order. If either stage raises, failed_row(item, error) is
+#   yielded in place of the row, so one bad resource never stops the run.
+#   Stage durations and outcomes are recorded in instrumentation.metrics.
+#
+#########################################################################################
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from instrumentation import metrics
+
+# Items started ahead of the one being emitted, per worker; bounds memory for large inputs
+READ_AHEAD_PER_WORKER = 4
+
+
+def run_pipeline(items, discover, price, failed_row, workers: int = 1, price_workers: int = None):
+    discover = _timed(discover, "discover")
+    price = _timed(price, "price")
+    workers = max(int(workers), 1)
+    price_workers = max(int(price_workers or workers), 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="discover") as discover_pool, \
+            ThreadPoolExecutor(max_workers=price_workers, thread_name_prefix="price") as price_pool:
+
+        def start(item) -> Future:
+            row = Future()
+
+            def on_priced(future):
+                error = future.exception()
+                if error is not None:
+                    row.set_exception(error)
+                else:
+                    row.set_result(future.result())
+
+            def on_discovered(future):
+                error = future.exception()
+                if error is not None:
+                    row.set_exception(error)
+                    return
+                price_pool.submit(price, item, future.result()).add_done_callback(on_priced)
+
+            discover_pool.submit(discover, item).add_done_callback(on_discovered)
+            return row
+
+        remaining = iter(items)
+        in_flight = deque((item, start(item)) for item in islice(remaining, workers * READ_AHEAD_PER_WORKER))
+        while in_flight:
+            item, row = in_flight.popleft()
+            try:
+                result = row.result()
+            except Exception as e:
+                metrics.incr("resources_total", outcome="failed")
+                yield failed_row(item, e)
+            else:
+                metrics.incr("resources_total", outcome="priced")
+                yield result
+            for next_item in islice(remaining, 1):
+                in_flight.append((next_item, start(next_item)))
+
+
+def _timed(stage, name: str):
+    def timed(*args):
+        with metrics.timer("pipeline_item_seconds", stage=name):
+            return stage(*args)
+    return timed
@@ -0,0 +1,123 @@
+#########################################################################################
+#
+#    Persistent on-disk cache for Azure Retail Prices API responses
+#    Used by AzureRetailPricesClient when a cache is passed in (opt-in):
+#
+#       from AzureRetailPricesApi import AzureRetailPricesClient
+#       from price_cache import PriceCache
+#       api = AzureRetailPricesClient(cache=PriceCache('.price_cache', ttl=86400))
+#
+#   Entries are keyed by the filter string that query() builds (which includes the
+#   currency code) and hold the raw price records of every page for that filter.
+#
+#########################################################################################
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class PriceCache:
+
+    # Init Function
+    def __init__(
+            self,
+            cache_dir: str = '.price_cache',
+            ttl: float = 7 * 24 * 3600,
+            max_bytes: int = 256 * 1024 * 1024,
+            stale_while_offline: bool = True
+            ) -> None:
+
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stale_while_offline = stale_while_offline
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'prices.sqlite3'), check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' key TEXT PRIMARY KEY,'
+            ' payload BLOB NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' stored_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+        self._db.commit()
+
+    def __str__(self) -> str:
+        return f'(cache_dir: {self.cache_dir}, ttl: {self.ttl}, max_bytes: {self.max_bytes}, stale_while_offline: {self.stale_while_offline})'
+
+    # Returns (records, is_stale) for a key, or None if nothing is cached.
+    # A stale entry is returned so the caller can revalidate it, and fall back to it if the API is unreachable.
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT payload, stored_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self._db.commit()
+        records = json.loads(zlib.decompress(row[0]))
+        is_stale = self.ttl is not None and now - row[1] > self.ttl
+        if is_stale:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return records, is_stale
+
+    # Counts a stale entry that was served because revalidation failed
+    def record_stale_hit(self) -> None:
+        with self._lock:
+            self.stale_hits += 1
+
+    def set(self, key: str, records: list) -> None:
+        payload = zlib.compress(json.dumps(records, separators=(',', ':')).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses (key, payload, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, payload, len(payload), now, now)
+            )
+            self._evict()
+            self._db.commit()
+
+    # Drop least recently used entries until the cache fits in max_bytes
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall():
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+            self._db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return dict({
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        })
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,252 @@
+#########################################################################################
+#
+#    Local price catalog kept current by delta syncs
+#    The first sync downloads every price record in scope (a service and/or regions, as for
+#    price_snapshot.py) into a SQLite file. Later syncs only ask the API for records whose
+#    effectiveStartDate is at or after the last sync's watermark, and upsert them:
+#
+#       python price_catalog.py --catalog catalogs/storage.sqlite3 --service-name Storage --region uksouth
+#
+#       from price_catalog import PriceCatalog
+#       catalog = PriceCatalog('catalogs/storage.sqlite3')
+#       report = catalog.sync(AzureRetailPricesClient(), regions=['uksouth'], serviceName='Storage')
+#       report['changes']   # [{'kind': 'changed', 'skuName': ..., 'old_price': ..., 'new_price': ...}, ...]
+#       prices = catalog.snapshot()   # a PriceSnapshot over the catalog, usable as api_client
+#
+#   Records are keyed by (meterId, skuId, type, tierMinimumUnits, reservationTerm); the record
+#   with the latest effectiveStartDate wins. reservationTerm is part of the key so that 1 and 3
+#   year reservations of a meter don't overwrite each other.
+#   A delta sync can't see meters that were retired, or records published late with an older
+#   effectiveStartDate; run with full=True (--full) now and then to catch those, which also
+#   removes records the API no longer returns.
+#
+#########################################################################################
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from AzureRetailPricesApi import AzureRetailPricesClient
+from price_snapshot import PriceSnapshot, SNAPSHOT_VERSION
+
+
+class PriceCatalog:
+
+    # Init Function
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS prices ('
+            ' meterId TEXT NOT NULL,'
+            ' skuId TEXT NOT NULL,'
+            ' type TEXT NOT NULL,'
+            ' tierMinimumUnits REAL NOT NULL,'
+            ' reservationTerm TEXT NOT NULL,'
+            ' effectiveStartDate TEXT NOT NULL,'
+            ' retailPrice REAL,'
+            ' record TEXT NOT NULL,'
+            ' synced_at REAL NOT NULL,'
+            ' PRIMARY KEY (meterId, skuId, type, tierMinimumUnits, reservationTerm))'
+        )
+        self._db.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._db.commit()
+
+    def __str__(self) -> str:
+        return f'(path: {self.path}, records: {len(self)}, watermark: {self.watermark})'
+
+    def __len__(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM prices').fetchone()[0]
+
+    # Latest effectiveStartDate applied so far (capped at the time of that sync), or None before the first sync
+    @property
+    def watermark(self) -> str:
+        return self._get_metadata('watermark')
+
+    @property
+    def scope(self) -> dict:
+        scope = self._get_metadata('scope')
+        return json.loads(scope) if scope else None
+
+    # Brings the catalog up to date. The first sync, and any sync with full=True, downloads everything in scope;
+    # others only fetch records at or after the watermark. The scope (currency, regions, service) is fixed by the
+    # first sync. Returns a report of what was fetched and which prices were added, changed or removed.
+    def sync(
+            self,
+            client: AzureRetailPricesClient,
+            regions: list = None,
+            serviceName: str = None,
+            serviceFamily: str = None,
+            full: bool = False
+            ) -> dict:
+
+        scope = {'currency_code': client.currency_code, 'regions': sorted(regions) if regions else None,
+                 'serviceName': serviceName, 'serviceFamily': serviceFamily}
+        if self.scope is not None and self.scope != scope:
+            raise ValueError(f"Catalog {self.path} holds {self.scope}, not {scope}; use another catalog file")
+        watermark = None if full else self.watermark
+        criterias = [f"effectiveStartDate ge {watermark}"] if watermark else []
+        if regions:
+            # All regions in one query, so a delta sync costs the same few requests for any number of regions
+            alternatives = " or ".join(f"armRegionName eq '{region}'" for region in scope['regions'])
+            criterias.append(f"({alternatives})" if len(regions) > 1 else alternatives)
+        started = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        initial = len(self) == 0
+        report = dict({
+            'mode': 'delta' if watermark else 'full',
+            'since': watermark,
+            'pages': 0,
+            'fetched': 0,
+            'added': 0,
+            'changed': 0,
+            'unchanged': 0,
+            'removed': 0,
+            'changes': []
+        })
+        seen = set()
+        latest = watermark
+        with self._db:
+            for page in client.iter_pages(*criterias, serviceName=serviceName, serviceFamily=serviceFamily):
+                report['pages'] += 1
+                report['fetched'] += len(page)
+                for record in page:
+                    key = record_key(record)
+                    seen.add(key)
+                    self._upsert(key, record, report, list_added=not initial)
+                    start = record.get('effectiveStartDate') or ''
+                    if latest is None or start > latest:
+                        latest = start
+            if not watermark:
+                self._remove_unseen(seen, report)
+            # Future-dated prices must not move the watermark past today, or the changes in between would be missed
+            if latest is not None:
+                self._set_metadata('watermark', min(latest, started))
+            self._set_metadata('scope', json.dumps(scope))
+            self._set_metadata('last_sync', started)
+        return report
+
+    # All records, as a PriceSnapshot that answers the same queries as the API client
+    def snapshot(self) -> PriceSnapshot:
+        items = [json.loads(record) for (record,) in self._db.execute('SELECT record FROM prices ORDER BY rowid')]
+        scope = self.scope or {}
+        metadata = {
+            'version': SNAPSHOT_VERSION,
+            'created': self._get_metadata('last_sync'),
+            'currency_code': scope.get('currency_code'),
+            'regions': scope.get('regions'),
+            'serviceName': scope.get('serviceName'),
+            'serviceFamily': scope.get('serviceFamily'),
+            'catalog': self.path,
+            'watermark': self.watermark
+        }
+        return PriceSnapshot(items, metadata)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _upsert(self, key: tuple, record: dict, report: dict, list_added: bool) -> None:
+        row = self._db.execute(
+            'SELECT effectiveStartDate, retailPrice, record FROM prices'
+            ' WHERE meterId = ? AND skuId = ? AND type = ? AND tierMinimumUnits = ? AND reservationTerm = ?', key
+        ).fetchone()
+        start = record.get('effectiveStartDate') or ''
+        payload = json.dumps(record, sort_keys=True, separators=(',', ':'))
+        if row is not None and (row[0] > start or row[2] == payload):
+            report['unchanged'] += 1 # an older record, or one we already have
+            return
+        self._db.execute(
+            'INSERT OR REPLACE INTO prices (meterId, skuId, type, tierMinimumUnits, reservationTerm, effectiveStartDate, retailPrice, record, synced_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            key + (start, record.get('retailPrice'), payload, time.time())
+        )
+        if row is None:
+            report['added'] += 1
+            if list_added:
+                report['changes'].append(_change('added', record, None, record.get('retailPrice')))
+        elif row[1] != record.get('retailPrice'):
+            report['changed'] += 1
+            report['changes'].append(_change('changed', record, row[1], record.get('retailPrice')))
+        else:
+            report['unchanged'] += 1 # same price, other fields updated
+
+    # After a full download: drops the records the API no longer returned
+    def _remove_unseen(self, seen: set, report: dict) -> None:
+        stale = [(key, record) for *key, record in self._db.execute(
+            'SELECT meterId, skuId, type, tierMinimumUnits, reservationTerm, record FROM prices') if tuple(key) not in seen]
+        for key, record in stale:
+            self._db.execute(
+                'DELETE FROM prices WHERE meterId = ? AND skuId = ? AND type = ? AND tierMinimumUnits = ? AND reservationTerm = ?', key)
+            record = json.loads(record)
+            report['removed'] += 1
+            report['changes'].append(_change('removed', record, record.get('retailPrice'), None))
+
+    def _get_metadata(self, name: str):
+        row = self._db.execute('SELECT value FROM metadata WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_metadata(self, name: str, value: str) -> None:
+        self._db.execute('INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)', (name, value))
+
+
+# Upsert key of a price record
+def record_key(record: dict) -> tuple:
+    return (
+        record.get('meterId') or '',
+        record.get('skuId') or '',
+        record.get('type') or '',
+        float(record.get('tierMinimumUnits') or 0.0),
+        record.get('reservationTerm') or ''
+    )
+
+
+def _change(kind: str, record: dict, old_price, new_price) -> dict:
+    return dict({
+        'kind': kind,
+        'armRegionName': record.get('armRegionName'),
+        'productName': record.get('productName'),
+        'skuName': record.get('skuName'),
+        'meterName': record.get('meterName'),
+        'type': record.get('type'),
+        'tierMinimumUnits': record.get('tierMinimumUnits'),
+        'effectiveStartDate': record.get('effectiveStartDate'),
+        'old_price': old_price,
+        'new_price': new_price
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or update a local price catalog from the Azure Retail Prices API")
+    parser.add_argument("--catalog", required=True, help="SQLite catalog file (created on the first sync)")
+    parser.add_argument("--service-name", help="serviceName to sync, e.g. Storage")
+    parser.add_argument("--service-family", help="serviceFamily to sync")
+    parser.add_argument("--region", action="append", dest="regions", help="armRegionName to sync (repeatable, default: all regions)")
+    parser.add_argument("--currency", default="USD", help="Currency code for prices")
+    parser.add_argument("--full", action="store_true", help="Download everything in scope again, also removing records the API no longer returns")
+    parser.add_argument("--show", type=int, default=50, help="Price changes to list (default: 50)")
+    parser.add_argument("--report", help="Also write the sync report, with every change, to this JSON file")
+    args = parser.parse_args()
+
+    from tabulate import tabulate
+    catalog = PriceCatalog(args.catalog)
+    report = catalog.sync(AzureRetailPricesClient(currency_code=args.currency), regions=args.regions,
+                          serviceName=args.service_name, serviceFamily=args.service_family, full=args.full)
+    print(f"[INFO] {report['mode'].capitalize()} sync{' since ' + report['since'] if report['since'] else ''}: "
+          f"{report['pages']} pages, {report['fetched']} records fetched, {report['added']} added, "
+          f"{report['changed']} changed, {report['removed']} removed; catalog {catalog}")
+    if report['changes']:
+        print(tabulate([[change['kind'], change['armRegionName'], change['productName'], change['skuName'], change['meterName'],
+                         change['tierMinimumUnits'], change['old_price'], change['new_price'], change['effectiveStartDate']]
+                        for change in report['changes'][:args.show]],
+                       headers=["Change", "Region", "Product", "SKU", "Meter", "Tier", "Old_Price", "New_Price", "Effective"]))
+        if len(report['changes']) > args.show:
+            print(f"[INFO] {len(report['changes']) - args.show} more changes not shown")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
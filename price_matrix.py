@@ -0,0 +1,108 @@
+#########################################################################################
+#
+#    Multi-region price matrix
+#    Fetches the price records of a few products for a list of regions in one pass: the
+#    (region, product) lookups go through query_batch(), which merges the regions of each
+#    product into a single "armRegionName eq 'a' or armRegionName eq 'b' ..." query. Adding a
+#    region therefore adds response data, not requests.
+#
+#       from price_matrix import PriceMatrix, DISK_PRODUCTS
+#       matrix = PriceMatrix.fetch(api_client, ['uksouth', 'ukwest', 'westeurope'], DISK_PRODUCTS)
+#       matrix.query(armRegionName='ukwest', skuName='P10 LRS', productName='Premium SSD Managed Disks')
+#       prices = matrix.pivot()   # {(productName, skuName, meterName, tierMinimumUnits): {region: retailPrice}}
+#
+#   A PriceMatrix is a PriceSnapshot, so it answers the same query()/iter_query() calls as the API
+#   client and can stand in for it in the pricing helpers. From the command line:
+#
+#       python price_matrix.py --region uksouth --region ukwest --product "Premium SSD Managed Disks"
+#
+#########################################################################################
+
+import argparse
+import time
+from AzureRetailPricesApi import AzureRetailPricesClient
+from price_snapshot import PriceSnapshot, SNAPSHOT_VERSION
+
+DISK_PRODUCTS = (
+    "Standard HDD Managed Disks",
+    "Standard SSD Managed Disks",
+    "Premium SSD Managed Disks",
+    "Azure Premium SSD v2",
+    "Ultra Disks",
+)
+
+BLOB_PRODUCTS = (
+    "General Block Blob",
+    "General Block Blob v2",
+    "Premium Block Blob",
+)
+
+
+class PriceMatrix(PriceSnapshot):
+
+    # Init Function
+    def __init__(self, items: list, regions: list, metadata: dict = None) -> None:
+        super().__init__(items, metadata)
+        self.regions = list(regions)
+
+    def __str__(self) -> str:
+        return f'(items: {len(self.items)}, regions: {self.regions})'
+
+    # One batched pass over every (region, product) pair
+    @classmethod
+    def fetch(cls, client, regions: list, products: list) -> 'PriceMatrix':
+        regions = [region.strip().lower() for region in regions if region.strip()]
+        lookups = [{'armRegionName': region, 'productName': product} for product in products for region in regions]
+        if hasattr(client, "query_batch"):
+            results = client.query_batch(lookups)
+        else:
+            results = [client.query(**lookup) for lookup in lookups]
+        items = [record for records in results for record in records]
+        metadata = {
+            'version': SNAPSHOT_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'currency_code': getattr(client, "currency_code", None),
+            'regions': regions,
+            'products': list(products)
+        }
+        return cls(items, regions, metadata)
+
+    # Consumption retail prices keyed by (productName, skuName, meterName, tierMinimumUnits), then by region
+    def pivot(self) -> dict:
+        prices = {}
+        for record in self.items:
+            if record.get("type", "Consumption") != "Consumption":
+                continue
+            key = (record.get("productName"), record.get("skuName"), record.get("meterName"), float(record.get("tierMinimumUnits") or 0.0))
+            prices.setdefault(key, {}).setdefault(record.get("armRegionName"), record.get("retailPrice"))
+        return prices
+
+    # One row per product/SKU/meter/tier with a price column per region (None where it is not sold)
+    def table(self, product_name: str = None) -> list:
+        return [list(key) + [by_region.get(region) for region in self.regions]
+                for key, by_region in sorted(self.pivot().items(), key=lambda item: tuple(str(part) for part in item[0]))
+                if product_name is None or key[0] == product_name]
+
+
+# Comma separated region list, as taken by the scripts' --regions option
+def parse_regions(value: str) -> list:
+    return [region.strip().lower() for region in value.split(",") if region.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a region x SKU price matrix from the Azure Retail Prices API")
+    parser.add_argument("--region", action="append", dest="regions", required=True, help="armRegionName to include (repeatable)")
+    parser.add_argument("--product", action="append", dest="products", help="productName to include (repeatable, default: managed disk products)")
+    parser.add_argument("--currency", default="USD", help="Currency code for prices")
+    parser.add_argument("--output", help="Also save the fetched records as a snapshot file (usable as PRICE_SNAPSHOT_FILE)")
+    args = parser.parse_args()
+
+    from tabulate import tabulate
+    matrix = PriceMatrix.fetch(AzureRetailPricesClient(currency_code=args.currency), args.regions, args.products or DISK_PRODUCTS)
+    print(tabulate(matrix.table(), headers=["Product", "SKU", "Meter", "Tier"] + matrix.regions))
+    if args.output:
+        matrix.save(args.output)
+        print(f"[INFO] Saved {len(matrix)} price records to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#########################################################################################
+#
+#    Compact, projected price records and the page parser that builds them
+#    When only a few fields of each price record are wanted (AzureRetailPricesClient.return_values),
+#    every item of a page is reduced to a tuple of those fields as soon as it is decoded, so
+#    neither the ~20-key dicts nor the decoded page stay alive:
+#
+#       items, next_page_link = read_page(response, fields=('skuName', 'retailPrice'))
+#       items[0]['retailPrice'], items[0].get('skuName'), dict(items[0])
+#
+#   The tuples are namedtuples that also behave like read-only mappings (record['field'],
+#   .get(), .keys(), .items(), dict(record)), so code written for dict records keeps working.
+#   Each page is decoded with the standard library's C JSON decoder and projected straight away.
+#   With AzureRetailPricesClient(stream_pages=True) (needs the optional ijson package with its C
+#   backend) the body is instead parsed incrementally as it is read from the socket, so not even
+#   one page is held in full. At the API's 100 items per page that is ~1.5x slower, so it is off by default.
+#
+#########################################################################################
+
+import collections
+import functools
+import json
+from operator import itemgetter
+
+try:
+    import ijson
+except ImportError:  # ijson is optional
+    ijson = None
+
+
+# ijson's pure Python backends are far slower than json.loads, so streaming needs its C backend
+def require_streaming() -> None:
+    if ijson is None or getattr(ijson, "backend", "") != "yajl2_c":
+        raise ImportError("Streamed page parsing needs ijson with its C backend (yajl2_c): pip install ijson")
+
+
+# Record class for a tuple of field names; created once per distinct projection
+@functools.lru_cache(maxsize=None)
+def record_type(fields: tuple):
+    fields = tuple(fields)
+    index = {name: position for position, name in enumerate(fields)}
+    getter = itemgetter(*fields) if len(fields) > 1 else (lambda mapping: (mapping[fields[0]],))
+
+    class PriceRecord(collections.namedtuple("PriceRecord", fields, rename=True)):
+        __slots__ = ()
+
+        def __getitem__(self, key):
+            if isinstance(key, str):
+                try:
+                    return tuple.__getitem__(self, index[key])
+                except KeyError:
+                    raise KeyError(key) from None
+            return tuple.__getitem__(self, key)
+
+        def __contains__(self, key) -> bool:
+            return key in index
+
+        def get(self, key, default=None):
+            position = index.get(key)
+            return default if position is None else tuple.__getitem__(self, position)
+
+        def keys(self):
+            return index.keys()
+
+        def values(self) -> list:
+            return list(self)
+
+        def items(self):
+            return zip(fields, self)
+
+        # Missing fields become None, like dict.get
+        @classmethod
+        def from_mapping(cls, mapping: dict) -> 'PriceRecord':
+            try:
+                return tuple.__new__(cls, getter(mapping))
+            except KeyError:
+                return tuple.__new__(cls, tuple(mapping.get(field) for field in fields))
+
+    PriceRecord.fields = fields
+    return PriceRecord
+
+
+# (items, NextPageLink) of one successful API response. Without fields the items are the raw dicts.
+# With stream, a response requested with stream=True is parsed incrementally (see require_streaming()).
+def read_page(response, fields: tuple = None, stream: bool = False):
+    if fields is None:
+        page = response.json()
+        return page['Items'], page.get('NextPageLink')
+    if stream and getattr(response, "raw", None) is not None and not getattr(response, "_content_consumed", False):
+        response.raw.decode_content = True  # let urllib3 undo gzip
+        return parse_page_stream(response.raw, fields)
+    return parse_page(response.content, fields)
+
+
+def parse_page(content, fields: tuple):
+    page = json.loads(content)
+    make = record_type(tuple(fields)).from_mapping
+    return [make(item) for item in page['Items']], page.get('NextPageLink')
+
+
+# Event based: only the wanted fields of each item are read, straight from the parser's events while the body is
+# still being read; other keys are skipped without building a dict. A wanted field holding a list or object
+# (e.g. savingsPlan) is built on its own.
+def parse_page_stream(fileobj, fields: tuple):
+    record = record_type(tuple(fields))
+    positions = {f"Items.item.{field}": position for position, field in enumerate(fields)}
+    items, next_link, values, builder, built = [], None, None, None, None
+    for prefix, event, value in ijson.parse(fileobj, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == built and event in ('end_map', 'end_array'):
+                values[positions[built]] = builder.value
+                builder = None
+        elif values is not None:
+            if prefix == 'Items.item' and event == 'end_map':
+                items.append(record._make(values))
+                values = None
+            elif prefix in positions:
+                if event in ('start_map', 'start_array'):
+                    builder, built = ijson.ObjectBuilder(), prefix
+                    builder.event(event, value)
+                elif event != 'map_key':
+                    values[positions[prefix]] = value
+        elif prefix == 'Items.item' and event == 'start_map':
+            values = [None] * len(fields)
+        elif prefix == 'NextPageLink' and event in ('string', 'null'):
+            next_link = value
+    return items, next_link
@@ -0,0 +1,396 @@
+#########################################################################################
+#
+#    Long-running local price service
+#    Keeps a warm, in-memory price index and one pooled API client in a daemon, so that
+#    every script run (and every team) shares them instead of paying imports, TLS handshakes
+#    and the same price downloads again:
+#
+#       python price_service.py --port 8765 --warm-region uksouth --warm-region ukwest
+#
+#   and then, in the scripts:
+#
+#       python compare_disk_prices.py --price-service http://127.0.0.1:8765
+#
+#   or from Python, anywhere the API client is used (get_disk_price, get_premiumv2_price,
+#   get_blob_price, the SKU optimizer, PriceMatrix.fetch):
+#
+#       from price_service import PriceServiceClient
+#       api = PriceServiceClient("http://127.0.0.1:8765")
+#       api.query(armRegionName='uksouth', skuName='P10 LRS', productName='Premium SSD Managed Disks')
+#       api.query_batch([{'armRegionName': 'uksouth', 'skuName': 'P10 LRS', 'productName': ...}, ...])
+#
+#   The index is split by (armRegionName, productName). A pair is loaded once, the first time a
+#   query names it (or at start with --warm-region/--product), and every later query for it is
+#   answered from memory. Pairs missing from one query_batch call are loaded together, in one
+#   batched pass. Concurrent callers asking for the same pair share one load, whether they ask for
+#   it alone or in a batch. Regions and products are matched case-insensitively, the other filters
+#   exactly. Queries that don't name both a region and a product go to the API and are memoized.
+#   Everything is reloaded every --refresh seconds in the background, bypassing any --cache-dir, so
+#   the service never serves a cold or outdated index.
+#
+#   Endpoints (JSON in, JSON out):
+#       POST /query         {"filters": {...}}           -> {"Items": [...]}
+#       POST /query_batch   {"lookups": [{...}, ...]}    -> {"Results": [[...], ...]}
+#       GET  /health, /stats, /metrics (Prometheus text, see instrumentation.py)
+#
+#########################################################################################
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from AzureRetailPricesApi import AzureRetailPricesClient
+from price_snapshot import PriceSnapshot
+from price_matrix import DISK_PRODUCTS, BLOB_PRODUCTS
+from single_flight import SingleFlight, normalize
+from instrumentation import metrics
+
+PRICE_SERVICE_PORT = 8765
+REFRESH_INTERVAL = 6 * 3600  # seconds between background reloads of the index
+WARM_PRODUCTS = DISK_PRODUCTS + BLOB_PRODUCTS
+ENDPOINTS = ("/query", "/query_batch", "/health", "/stats", "/metrics")
+
+
+class PriceService:
+
+    # Init Function. client is anything with query()/query_batch(), e.g. AzureRetailPricesClient or PriceSnapshot.
+    def __init__(
+            self,
+            client=None,
+            host: str = "127.0.0.1",
+            port: int = PRICE_SERVICE_PORT,
+            refresh_interval: float = REFRESH_INTERVAL
+            ) -> None:
+
+        self.client = client if client is not None else AzureRetailPricesClient(pool_size=32)
+        self.refresh_interval = refresh_interval
+        self.started = time.time()
+        self._shards = {}  # (region, product) casefolded -> PriceSnapshot of that pair's records
+        self._pairs = {}  # same keys -> (region, product) as first asked for
+        self._loading = SingleFlight()  # one load per pair, shared by concurrent callers and batches
+        self._queries = SingleFlight()  # memoized queries the index can't answer
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+        self.reset_stats()
+
+    def __str__(self) -> str:
+        return f'(url: {self.url}, pairs: {len(self._shards)}, records: {self.records()}, refresh_interval: {self.refresh_interval})'
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'PriceService':
+        self._thread = threading.Thread(target=self._server.serve_forever, name="price-service", daemon=True)
+        self._thread.start()
+        if self.refresh_interval:
+            self._refresher = threading.Thread(target=self._refresh_loop, name="price-service-refresh", daemon=True)
+            self._refresher.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def records(self) -> int:
+        return sum(len(shard) for shard in list(self._shards.values()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'pairs': len(self._shards),
+            'records': self.records(),
+            'memoized_queries': self._queries.stats()['entries'],
+            'uptime_seconds': time.time() - self.started
+        })
+        return stats
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = dict({'queries': 0, 'index_hits': 0, 'pair_loads': 0, 'upstream_queries': 0, 'refreshes': 0, 'errors': 0})
+
+    # Loads the given regions x products into the index in one batched pass
+    def warm(self, regions: list, products: list = WARM_PRODUCTS) -> None:
+        self._load([(region, product) for region in regions for product in products])
+
+    # Same filters and result as AzureRetailPricesClient.query()
+    def query(self, **filters) -> list:
+        return self.query_batch([filters])[0]
+
+    # One list of records per lookup, in input order
+    def query_batch(self, lookups: list) -> list:
+        lookups = [{name: value for name, value in lookup.items() if value is not None} for lookup in lookups]
+        for lookup in lookups:
+            AzureRetailPricesClient._check_filters(lookup)
+        missing = {}
+        for lookup in lookups:
+            pair = _pair(lookup)
+            if pair is not None and _pair_key(pair) not in self._shards:
+                missing.setdefault(_pair_key(pair), pair)
+        if missing:
+            self._load(list(missing.values()))
+        results = []
+        for lookup in lookups:
+            pair = _pair(lookup)
+            if pair is None:
+                with self._lock:
+                    self._stats['upstream_queries'] += 1
+                results.append(self._queries.do(normalize(lookup), lambda lookup=lookup: self._fetch([lookup])[0]))
+                continue
+            key = _pair_key(pair)
+            shard = self._shards[key]
+            if key not in missing:
+                with self._lock:
+                    self._stats['index_hits'] += 1
+            # The shard only holds this pair's records, so only the other filters are matched (exactly, as in PriceSnapshot)
+            results.append(shard.query(**{name: value for name, value in lookup.items() if name not in ('armRegionName', 'productName')}))
+        with self._lock:
+            self._stats['queries'] += len(lookups)
+        return results
+
+    # Loads the pairs not loaded yet in one batched pass; pairs another caller is already loading are waited for
+    def _load(self, pairs: list) -> None:
+        by_key = {_pair_key(pair): pair for pair in pairs}
+        self._loading.do_many(list(by_key), lambda keys: self._load_pairs([by_key[key] for key in keys]))
+
+    # Fetches every record of the given (region, product) pairs and swaps them into the index; returns their shards
+    def _load_pairs(self, pairs: list, refresh: bool = False) -> list:
+        lookups = [{'armRegionName': region, 'productName': product} for region, product in pairs]
+        with metrics.timer("price_service_load_seconds"):
+            results = self._fetch(lookups, refresh)
+        shards = []
+        for pair, records in zip(pairs, results):
+            key = _pair_key(pair)
+            self._pairs.setdefault(key, pair)
+            self._shards[key] = PriceSnapshot(list(records), {'armRegionName': pair[0], 'productName': pair[1]})
+            shards.append(self._shards[key])
+        with self._lock:
+            self._stats['pair_loads'] += len(pairs)
+        return shards
+
+    # Answers lookups from the client. With refresh, a client's response cache (e.g. --cache-dir) is bypassed,
+    # so that a refresh gets current prices rather than the cached ones.
+    def _fetch(self, lookups: list, refresh: bool = False) -> list:
+        if not hasattr(self.client, "query_batch"):
+            return [self.client.query(**lookup) for lookup in lookups]
+        if refresh and getattr(self.client, "cache", None) is not None:
+            return self.client.query_batch(lookups, refresh=True)
+        return self.client.query_batch(lookups)
+
+    # Reloads every loaded pair and every memoized query from upstream
+    def refresh(self) -> None:
+        self._load_pairs(list(self._pairs.values()), refresh=True)
+        self._loading.clear()
+        keys = self._queries.keys()
+        results = self._fetch([dict(key) for key in keys], refresh=True)
+        self._queries.clear()
+        for key, records in zip(keys, results):
+            self._queries.do(key, lambda records=records: records)
+        with self._lock:
+            self._stats['refreshes'] += 1
+
+    # Calls refresh() every refresh_interval seconds
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[WARN] Price index refresh failed, keeping the current one: {e}")
+
+    def _respond(self, method: str, path: str, body: bytes):
+        start = time.perf_counter()
+        try:
+            if method == "GET" and path == "/health":
+                return 200, {'status': 'ok', 'currency_code': getattr(self.client, "currency_code", None)}
+            if method == "GET" and path == "/stats":
+                return 200, self.stats()
+            if method == "GET" and path == "/metrics":
+                return 200, metrics.to_prometheus()
+            if method == "POST" and path == "/query":
+                return 200, {'Items': self.query(**json.loads(body).get('filters', {}))}
+            if method == "POST" and path == "/query_batch":
+                return 200, {'Results': self.query_batch(json.loads(body).get('lookups', []))}
+            return 404, {'error': f"No such endpoint {method} {path}"}
+        except (TypeError, ValueError, AttributeError) as e:  # unknown filters, bad JSON
+            with self._lock:
+                self._stats['errors'] += 1
+            return 400, {'error': str(e)}
+        except requests.RequestException as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            return 502, {'error': f"Retail Prices API: {e}"}
+        finally:
+            metrics.observe("price_service_request_seconds", time.perf_counter() - start, endpoint=path if path in ENDPOINTS else "other")
+
+    def _handler_class(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body are separate writes; don't wait for the client's delayed ACK
+
+            def do_GET(self):
+                self._reply(*service._respond("GET", urlsplit(self.path).path, b""))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self._reply(*service._respond("POST", urlsplit(self.path).path, self.rfile.read(length)))
+
+            def _reply(self, status, body):
+                if isinstance(body, str):
+                    payload, content_type = body.encode(), "text/plain; version=0.0.4"
+                else:
+                    payload, content_type = json.dumps(body, separators=(',', ':')).encode(), "application/json"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+# Thin client for a running PriceService. Answers query(), iter_query(), iter_pages() and query_batch()
+# like AzureRetailPricesClient, so it can be used as the scripts' api_client.
+class PriceServiceClient:
+
+    # Init Function
+    def __init__(
+            self,
+            url: str = f"http://127.0.0.1:{PRICE_SERVICE_PORT}",
+            session: requests.Session = None,
+            timeout = (2, 300),
+            pool_size: int = 10
+            ) -> None:
+
+        self.url = url.rstrip("/")
+        self.timeout = timeout # (connect, read) seconds; a read may wait for the service to load a pair
+        self.return_values = None
+        self.session = session if session is not None else self._create_session(pool_size)
+        self._currency_code = None
+
+    def __str__(self) -> str:
+        return f'(url: {self.url}, return_values: {self.return_values})'
+
+    # Currency of the service's prices, asked for once
+    @property
+    def currency_code(self) -> str:
+        if self._currency_code is None:
+            self._currency_code = self._get("/health").get('currency_code')
+        return self._currency_code
+
+    def query(self, **filters) -> list:
+        return self._project(self._post("/query", {'filters': filters})['Items'])
+
+    def iter_pages(self, **filters):
+        yield self.query(**filters)
+
+    # The predicate runs here, on the records the service returns
+    def iter_query(self, predicate=None, **filters):
+        for record in self._post("/query", {'filters': filters})['Items']:
+            if predicate is not None and not predicate(record):
+                continue
+            yield self._project([record])[0]
+
+    def query_batch(self, lookups: list, max_url_length: int = None) -> list:
+        return [self._project(records) for records in self._post("/query_batch", {'lookups': list(lookups)})['Results']]
+
+    def stats(self) -> dict:
+        return self._get("/stats")
+
+    def _project(self, records: list) -> list:
+        if not self.return_values:
+            return records
+        return [{key: record.get(key) for key in self.return_values} for record in records]
+
+    def _get(self, path: str) -> dict:
+        response = self.session.get(self.url + path, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, path: str, body: dict) -> dict:
+        response = self.session.post(self.url + path, data=json.dumps(body), headers={'Content-Type': 'application/json'}, timeout=self.timeout)
+        if response.status_code == 400:
+            raise TypeError(response.json().get('error'))  # e.g. an unknown filter, as the API client raises
+        response.raise_for_status()
+        return response.json()
+
+    # Keep-alive connections, so a lookup costs one local round trip
+    @staticmethod
+    def _create_session(pool_size: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+
+# (region, product) a lookup names, or None if it doesn't name both
+def _pair(lookup: dict):
+    region, product = lookup.get('armRegionName'), lookup.get('productName')
+    if isinstance(region, str) and isinstance(product, str):
+        return region, product
+    return None
+
+
+def _pair_key(pair: tuple) -> tuple:
+    return pair[0].casefold(), pair[1].casefold()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Azure retail prices from a warm in-memory index")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PRICE_SERVICE_PORT)
+    parser.add_argument("--warm-region", action="append", dest="warm_regions", default=[], help="Region to load at start (repeatable)")
+    parser.add_argument("--product", action="append", dest="products", help="productName to load for each --warm-region (repeatable, default: disk and blob products)")
+    parser.add_argument("--refresh", type=float, default=REFRESH_INTERVAL, help=f"Seconds between reloads of the index (default: {REFRESH_INTERVAL}, 0 to never reload)")
+    parser.add_argument("--currency", default="USD", help="Currency code for prices")
+    parser.add_argument("--url", default="https://prices.azure.com/api/retail/prices", help="Retail Prices API endpoint")
+    parser.add_argument("--cache-dir", help="Also keep API responses in an on-disk PriceCache here")
+    parser.add_argument("--catalog", help="Serve a local price catalog (price_catalog.py) instead of the API")
+    args = parser.parse_args()
+
+    if args.catalog:
+        from price_catalog import PriceCatalog
+        client = PriceCatalog(args.catalog).snapshot()
+    else:
+        from price_cache import PriceCache
+        client = AzureRetailPricesClient(url=args.url, currency_code=args.currency, pool_size=32,
+                                         cache=PriceCache(args.cache_dir) if args.cache_dir else None)
+    service = PriceService(client, host=args.host, port=args.port, refresh_interval=args.refresh)
+    if args.warm_regions:
+        print(f"[INFO] Warming {len(args.warm_regions)} region(s)...")
+        service.warm(args.warm_regions, args.products or WARM_PRODUCTS)
+    service.start()
+    print(f"[INFO] Serving prices at {service.url}: {service}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        print(f"[INFO] {service.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#########################################################################################
+#
+#    Local snapshot of the Azure Retail Prices catalog
+#    Downloads every price record for a service (e.g. serviceName 'Storage') in a set of
+#    regions once, saves it to a versioned JSON file, and answers the same filters as
+#    AzureRetailPricesClient.query() locally, without any network calls:
+#
+#       python price_snapshot.py --service-name Storage --region uksouth --region ukwest
+#
+#       from price_snapshot import PriceSnapshot
+#       prices = PriceSnapshot.load('snapshots/prices-Storage-20240101T000000Z.json')
+#       data = prices.query(armRegionName='uksouth', skuName='P10 LRS', productName='Premium SSD Managed Disks')
+#
+#########################################################################################
+
+import argparse
+import json
+import os
+import time
+from AzureRetailPricesApi import AzureRetailPricesClient, FILTER_RECORD_FIELDS
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR = "snapshots"
+
+
+class PriceSnapshot:
+
+    # Init Function
+    def __init__(self, items: list, metadata: dict = None) -> None:
+        self.items = items
+        self.metadata = metadata or {}
+        self.return_values = None
+        self._indexes = {}
+
+    def __str__(self) -> str:
+        return f'(items: {len(self.items)}, metadata: {self.metadata})'
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    # Pulls the full catalog for the given service filters, once per region (or once overall if no regions are given)
+    @classmethod
+    def download(
+            cls,
+            client: AzureRetailPricesClient,
+            regions: list = None,
+            serviceName: str = None,
+            serviceFamily: str = None
+            ) -> 'PriceSnapshot':
+
+        items = []
+        for region in regions or [None]:
+            for page in client.iter_pages(armRegionName=region, serviceName=serviceName, serviceFamily=serviceFamily):
+                items.extend(page)
+        metadata = {
+            'version': SNAPSHOT_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'currency_code': client.currency_code,
+            'regions': list(regions) if regions else None,
+            'serviceName': serviceName,
+            'serviceFamily': serviceFamily
+        }
+        return cls(items, metadata)
+
+    @classmethod
+    def load(cls, path: str) -> 'PriceSnapshot':
+        with open(path) as f:
+            data = json.load(f)
+        version = data.get('metadata', {}).get('version')
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported price snapshot version {version} in {path} (expected {SNAPSHOT_VERSION})")
+        return cls(data['items'], data['metadata'])
+
+    # Writes to a temporary file first so an interrupted save never leaves a truncated snapshot behind
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'metadata': self.metadata, 'items': self.items}, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    # Default file name, versioned by service and creation time
+    def default_path(self) -> str:
+        service = self.metadata.get('serviceName') or self.metadata.get('serviceFamily') or 'all'
+        created = self.metadata.get('created', '').replace('-', '').replace(':', '')
+        return os.path.join(SNAPSHOT_DIR, f"prices-{service.replace(' ', '_')}-{created}.json")
+
+    # Same filters and matching as AzureRetailPricesClient.query(), answered from the snapshot.
+    # Regions or services that were not downloaded simply return no records.
+    def query(self, **filters) -> list:
+        return list(self.iter_query(**filters))
+
+    def iter_pages(self, **filters):
+        yield self.query(**filters)
+
+    def iter_query(self, predicate=None, **filters):
+        AzureRetailPricesClient._check_filters(filters)
+        filters = {FILTER_RECORD_FIELDS.get(name, name): value for name, value in filters.items() if value is not None}
+        for record in self._lookup(filters):
+            if predicate is not None and not predicate(record):
+                continue
+            yield {key: record[key] for key in self.return_values} if self.return_values else record
+
+    # Records are indexed lazily by each distinct combination of filter names that is queried
+    def _lookup(self, filters: dict) -> list:
+        if not filters:
+            return self.items
+        fields = tuple(sorted(filters))
+        index = self._indexes.get(fields)
+        if index is None:
+            index = {}
+            for record in self.items:
+                index.setdefault(tuple(_normalize(field, record.get(field)) for field in fields), []).append(record)
+            self._indexes[fields] = index
+        return index.get(tuple(_normalize(field, filters[field]) for field in fields), [])
+
+
+# tierMinimumUnits is compared numerically, everything else as a string
+def _normalize(field, value):
+    if field == 'tierMinimumUnits' and value is not None:
+        return float(value)
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download a local snapshot of the Azure Retail Prices catalog")
+    parser.add_argument("--service-name", help="serviceName to download, e.g. 'Storage'")
+    parser.add_argument("--service-family", help="serviceFamily to download, e.g. 'Storage'")
+    parser.add_argument("--region", action="append", dest="regions", help="armRegionName to include (repeatable)")
+    parser.add_argument("--currency", default="USD", help="Currency code for prices")
+    parser.add_argument("--output", help="Snapshot file to write (default: versioned file under snapshots/)")
+    args = parser.parse_args()
+    if not args.service_name and not args.service_family:
+        parser.error("one of --service-name or --service-family is required")
+
+    client = AzureRetailPricesClient(currency_code=args.currency)
+    snapshot = PriceSnapshot.download(client, regions=args.regions, serviceName=args.service_name, serviceFamily=args.service_family)
+    path = args.output or snapshot.default_path()
+    snapshot.save(path)
+    print(f"[INFO] Saved {len(snapshot)} price records to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#########################################################################################
+#
+#    Memory-mapped columnar price store
+#    A compact, read-only file built from a price snapshot (see price_snapshot.py):
+#
+#       python price_store.py --snapshot snapshots/prices-Storage-20240101T000000Z.json --output snapshots/storage.pstore
+#
+#       from price_store import PriceStore
+#       store = PriceStore('snapshots/storage.pstore')
+#       store.price('uksouth', 'Premium SSD Managed Disks', 'P10 LRS', 'P10 LRS Disk')
+#
+#   Strings are interned into one table, sorted so a string's id is found by bisecting it, and every
+#   column is a flat array, so opening a store only maps the file; worker processes that open the
+#   same file share its pages.
+#   Rows are sorted by (armRegionName, productName, skuName, meterName, type, tierMinimumUnits) and a
+#   hash table over the first five fields gives constant-time access to each meter's price tiers.
+#
+#########################################################################################
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from AzureRetailPricesApi import AzureRetailPricesClient, FILTER_RECORD_FIELDS
+from price_snapshot import PriceSnapshot
+
+MAGIC = b'AZPRICE1'
+STORE_VERSION = 2
+KEY_FIELDS = ('armRegionName', 'productName', 'skuName', 'meterName', 'type')
+STRING_FIELDS = KEY_FIELDS + (
+    'location', 'meterId', 'productId', 'skuId', 'serviceName', 'serviceId', 'serviceFamily',
+    'armSkuName', 'unitOfMeasure', 'currencyCode', 'effectiveStartDate', 'effectiveEndDate'
+)
+FLOAT_FIELDS = ('retailPrice', 'unitPrice', 'tierMinimumUnits')
+NO_STRING = -1
+
+
+# Deterministic 64-bit FNV-1a style hash over string ids (Python's own str hash is randomised per process)
+def _hash_ids(ids) -> int:
+    h = 0xcbf29ce484222325
+    for value in ids:
+        h = ((h ^ (value & 0xffffffff)) * 0x100000001b3) & 0xffffffffffffffff
+    return h
+
+
+class PriceStore:
+
+    # Opens (memory-maps) an existing store file
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.return_values = None
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a price store")
+        (header_length,) = struct.unpack_from('<I', self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._mm[start:start + header_length])
+        if self.header['version'] != STORE_VERSION:
+            raise ValueError(f"Unsupported price store version {self.header['version']} in {path} (expected {STORE_VERSION})")
+        self.rows = self.header['rows']
+        self.metadata = self.header.get('metadata', {})
+
+        view = memoryview(self._mm)
+        swap = self.header['byteorder'] != sys.byteorder
+        self._sections = {}
+        for name, (offset, length, typecode) in self.header['sections'].items():
+            section = view[offset:offset + length]
+            if typecode != 'B':
+                section = section.cast(typecode)
+                if swap:
+                    section = array(typecode, section)
+                    section.byteswap()
+            self._sections[name] = section
+        self._string_ids = {}
+        self._indexes = {}
+
+    def __str__(self) -> str:
+        return f'(path: {self.path}, rows: {self.rows}, strings: {self.header["strings"]}, metadata: {self.metadata})'
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def close(self) -> None:
+        self._sections = {}
+        self._indexes = {}
+        self._mm.close()
+        self._file.close()
+
+    # Writes a store file for the given price records
+    @staticmethod
+    def build(records: list, path: str, metadata: dict = None) -> None:
+        # String ids follow the UTF-8 byte order of the strings, so readers can bisect the table
+        encoded = sorted({str(record[field]).encode('utf-8') for record in records for field in STRING_FIELDS
+                          if record.get(field) is not None})
+        strings = {value.decode('utf-8'): string_id for string_id, value in enumerate(encoded)}
+        def intern(value):
+            return NO_STRING if value is None else strings[str(value)]
+
+        def sort_key(record):
+            return tuple((record.get(field) is None, str(record.get(field))) for field in KEY_FIELDS) + (float(record.get('tierMinimumUnits') or 0.0),)
+
+        columns = {field: array('i') for field in STRING_FIELDS}
+        columns.update({field: array('d') for field in FLOAT_FIELDS})
+        group_starts = array('i')
+        group_keys = []
+        previous_key = None
+        for row, record in enumerate(sorted(records, key=sort_key)):
+            for field in STRING_FIELDS:
+                columns[field].append(intern(record.get(field)))
+            for field in FLOAT_FIELDS:
+                value = record.get(field)
+                columns[field].append(float(value) if value is not None else float('nan'))
+            key = tuple(columns[field][row] for field in KEY_FIELDS)
+            if key != previous_key:
+                group_starts.append(row)
+                group_keys.append(key)
+                previous_key = key
+        group_starts.append(len(records)) # sentinel: end of the last group
+
+        # Open addressing hash table mapping a key to its group number, at most half full
+        slots = 1
+        while slots < 2 * len(group_keys):
+            slots *= 2
+        hash_table = array('i', [-1]) * slots
+        for group, key in enumerate(group_keys):
+            slot = _hash_ids(key) & (slots - 1)
+            while hash_table[slot] != -1:
+                slot = (slot + 1) & (slots - 1)
+            hash_table[slot] = group
+
+        string_offsets = array('q', [0])
+        for value in encoded:
+            string_offsets.append(string_offsets[-1] + len(value))
+
+        sections = [('string_offsets', string_offsets), ('string_data', b''.join(encoded)),
+                    ('group_starts', group_starts), ('hash_table', hash_table)]
+        sections += [(f'column:{field}', columns[field]) for field in STRING_FIELDS + FLOAT_FIELDS]
+
+        # Section offsets depend on the header length, so lay them out relative to the data start first
+        layout = {}
+        position = 0
+        for name, data in sections:
+            length = len(data) * data.itemsize if isinstance(data, array) else len(data)
+            layout[name] = [position, length, data.typecode if isinstance(data, array) else 'B']
+            position += length + (-length % 8)
+        header = {'version': STORE_VERSION, 'byteorder': sys.byteorder, 'rows': len(records), 'strings': len(strings),
+                  'metadata': metadata or {}, 'sections': layout}
+        # The header is padded with spaces up to data_start; grow the reservation until the offsets fit
+        data_start = 0
+        while True:
+            header_bytes = json.dumps(header).encode('utf-8')
+            if len(MAGIC) + 4 + len(header_bytes) <= data_start:
+                break
+            shift = len(MAGIC) + 4 + len(header_bytes) + 64
+            shift += -shift % 8
+            for entry in layout.values():
+                entry[0] += shift - data_start
+            data_start = shift
+        header_bytes = header_bytes.ljust(data_start - len(MAGIC) - 4)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            for name, data in sections:
+                f.write(b'\0' * (layout[name][0] - f.tell()))
+                f.write(data.tobytes() if isinstance(data, array) else data)
+        os.replace(tmp_path, path)
+
+    # All price tiers of one meter, ordered by tierMinimumUnits
+    def lookup(self, armRegionName: str, productName: str, skuName: str, meterName: str, type: str = 'Consumption') -> list:
+        group = self._find_group((armRegionName, productName, skuName, meterName, type))
+        if group is None:
+            return []
+        starts = self._sections['group_starts']
+        return [self._record(row) for row in range(starts[group], starts[group + 1])]
+
+    # retailPrice of the tier that applies to `quantity` units, or None if the meter is not in the store
+    def price(self, armRegionName: str, productName: str, skuName: str, meterName: str, type: str = 'Consumption', quantity: float = 0.0):
+        group = self._find_group((armRegionName, productName, skuName, meterName, type))
+        if group is None:
+            return None
+        starts = self._sections['group_starts']
+        start, end = starts[group], starts[group + 1]
+        tiers = self._sections['column:tierMinimumUnits'][start:end]
+        row = start + max(bisect.bisect_right(tiers, quantity) - 1, 0)
+        return self._sections['column:retailPrice'][row]
+
+    # Same filters as AzureRetailPricesClient.query(), answered from the store
+    def query(self, **filters) -> list:
+        return list(self.iter_query(**filters))
+
+    def iter_pages(self, **filters):
+        yield self.query(**filters)
+
+    def iter_query(self, predicate=None, **filters):
+        AzureRetailPricesClient._check_filters(filters)
+        filters = {FILTER_RECORD_FIELDS.get(name, name): value for name, value in filters.items() if value is not None}
+        for row in self._matching_rows(filters):
+            record = self._record(row)
+            if predicate is not None and not predicate(record):
+                continue
+            yield {key: record[key] for key in self.return_values} if self.return_values else record
+
+    def _matching_rows(self, filters: dict):
+        tier = filters.pop('tierMinimumUnits', None)
+        if set(filters) == set(KEY_FIELDS):
+            group = self._find_group(tuple(filters[field] for field in KEY_FIELDS))
+            if group is None:
+                return []
+            starts = self._sections['group_starts']
+            rows = range(starts[group], starts[group + 1])
+        elif filters:
+            index = self._secondary_index(tuple(sorted(filters)))
+            ids = tuple(self._string_id(filters[field]) for field in sorted(filters))
+            if NO_STRING in ids:  # not in the string table, so no row has it (NO_STRING also marks missing values)
+                return []
+            rows = index.get(ids, [])
+        else:
+            rows = range(self.rows)
+        if tier is not None:
+            tiers = self._sections['column:tierMinimumUnits']
+            rows = [row for row in rows if tiers[row] == float(tier)]
+        return rows
+
+    # Lazily built index for filter combinations other than the full meter key
+    def _secondary_index(self, fields: tuple) -> dict:
+        index = self._indexes.get(fields)
+        if index is None:
+            unknown = [field for field in fields if field not in STRING_FIELDS]
+            if unknown:
+                raise TypeError(f"Price store has no column(s): {', '.join(unknown)}")
+            columns = [self._sections[f'column:{field}'] for field in fields]
+            index = {}
+            for row in range(self.rows):
+                index.setdefault(tuple(column[row] for column in columns), []).append(row)
+            self._indexes[fields] = index
+        return index
+
+    def _find_group(self, key: tuple):
+        ids = tuple(self._string_id(value) for value in key)
+        if NO_STRING in ids:
+            return None
+        hash_table = self._sections['hash_table']
+        starts = self._sections['group_starts']
+        columns = [self._sections[f'column:{field}'] for field in KEY_FIELDS]
+        mask = len(hash_table) - 1
+        slot = _hash_ids(ids) & mask
+        while hash_table[slot] != -1:
+            group = hash_table[slot]
+            row = starts[group]
+            if all(column[row] == value for column, value in zip(columns, ids)):
+                return group
+            slot = (slot + 1) & mask
+        return None
+
+    # Id of a string, bisected from the sorted string table; only the strings looked up are remembered
+    def _string_id(self, value) -> int:
+        value = str(value)
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            encoded = value.encode('utf-8')
+            low, high = 0, self.header['strings']
+            while low < high:
+                middle = (low + high) // 2
+                if self._string_bytes(middle) < encoded:
+                    low = middle + 1
+                else:
+                    high = middle
+            string_id = low if low < self.header['strings'] and self._string_bytes(low) == encoded else NO_STRING
+            self._string_ids[value] = string_id
+        return string_id
+
+    def _string(self, string_id: int) -> str:
+        return self._string_bytes(string_id).decode('utf-8')
+
+    def _string_bytes(self, string_id: int) -> bytes:
+        offsets = self._sections['string_offsets']
+        return bytes(self._sections['string_data'][offsets[string_id]:offsets[string_id + 1]])
+
+    def _record(self, row: int) -> dict:
+        record = {}
+        for field in STRING_FIELDS:
+            string_id = self._sections[f'column:{field}'][row]
+            if string_id != NO_STRING:
+                record[field] = self._string(string_id)
+        for field in FLOAT_FIELDS:
+            value = self._sections[f'column:{field}'][row]
+            if value == value: # skip NaN (missing)
+                record[field] = value
+        return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a memory-mapped price store from a price snapshot")
+    parser.add_argument("--snapshot", required=True, help="Snapshot file written by price_snapshot.py")
+    parser.add_argument("--output", required=True, help="Price store file to write")
+    args = parser.parse_args()
+
+    snapshot = PriceSnapshot.load(args.snapshot)
+    PriceStore.build(snapshot.items, args.output, snapshot.metadata)
+    print(f"[INFO] Wrote {len(snapshot)} price records to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#########################################################################################
+#
+#    Vectorized what-if cost engine for managed disks (requires numpy)
+#    Prices are resolved once per region, after which whole fleets and parameter sweeps are
+#    costed with array arithmetic instead of one Python call per disk:
+#
+#       from pricing_engine import PremiumV2PriceTable, premiumv2_costs, premiumv2_sweep
+#       table = PremiumV2PriceTable.resolve(api_client, 'uksouth')
+#       costs = premiumv2_costs(size_gb, iops, throughput, table)         # per-disk arrays + 'total'
+#       grid = premiumv2_sweep(size_gb, iops, throughput, table, iops_grid=[3000, 5000, 10000], throughput_grid=[125, 250])
+#
+#   What-if over the disks of the last compare_disk_prices.py run:
+#
+#       python pricing_engine.py --iops 3000,5000,10000 --throughput 125,250
+#
+#   All costs are monthly, in GBP, using the same 0.75 USD->GBP rate and 730 hours per month as compare_disk_prices.py.
+#
+#########################################################################################
+
+import argparse
+import json
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; only this module needs it
+    np = None
+
+USD_TO_GBP = 0.75
+HOURS_PER_MONTH = 730.0
+PREMIUM_V2_PRODUCT = "Azure Premium SSD v2"
+PREMIUM_V2_SKU = "Premium LRS"
+PREMIUM_V2_FREE_IOPS = 3000.0
+PREMIUM_V2_FREE_MBPS = 125.0
+DISK_RESULTS_FILE = "results/disk_price_results.json"
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("pricing_engine needs numpy: pip install numpy")
+
+
+class PremiumV2PriceTable:
+
+    # Hourly prices in GBP per provisioned GiB, IOPS and MBps
+    def __init__(self, capacity: float, iops: float, throughput: float) -> None:
+        self.capacity = capacity
+        self.iops = iops
+        self.throughput = throughput
+
+    def __str__(self) -> str:
+        return f'(capacity: {self.capacity}, iops: {self.iops}, throughput: {self.throughput})'
+
+    # Looks up the three Premium SSD v2 meters for a region with a single query.
+    # IOPS and throughput have a free tier, so their highest (paid) tier is used.
+    @classmethod
+    def resolve(cls, client, region: str) -> 'PremiumV2PriceTable':
+        prices = {}
+        tiers = {}
+        for item in client.iter_query(armRegionName=region, skuName=PREMIUM_V2_SKU, productName=PREMIUM_V2_PRODUCT):
+            if item.get("type") != "Consumption":
+                continue
+            meter = item.get("meterName", "")
+            for component in ("Provisioned Capacity", "Provisioned IOPS", "Provisioned Throughput"):
+                tier = float(item.get("tierMinimumUnits") or 0.0)
+                if component in meter and tier >= tiers.get(component, -1.0):
+                    tiers[component] = tier
+                    prices[component] = float(item.get("retailPrice", 0.0)) * USD_TO_GBP
+        missing = [component for component in ("Provisioned Capacity", "Provisioned IOPS", "Provisioned Throughput") if component not in prices]
+        if missing:
+            raise LookupError(f"No Premium SSD v2 price for {', '.join(missing)} in region {region}")
+        return cls(prices["Provisioned Capacity"], prices["Provisioned IOPS"], prices["Provisioned Throughput"])
+
+
+# Per-disk monthly costs; inputs are arrays (or anything numpy can broadcast). Returns a dict of arrays.
+def premiumv2_costs(size_gb, iops, throughput, table: PremiumV2PriceTable) -> dict:
+    _require_numpy()
+    size_gb = np.asarray(size_gb, dtype=float)
+    iops = np.asarray(iops, dtype=float)
+    throughput = np.asarray(throughput, dtype=float)
+    capacity_cost = table.capacity * size_gb * HOURS_PER_MONTH
+    iops_cost = table.iops * np.maximum(iops - PREMIUM_V2_FREE_IOPS, 0.0) * HOURS_PER_MONTH
+    throughput_cost = table.throughput * np.maximum(throughput - PREMIUM_V2_FREE_MBPS, 0.0) * HOURS_PER_MONTH
+    return {
+        "capacity": capacity_cost,
+        "iops": iops_cost,
+        "throughput": throughput_cost,
+        "total": capacity_cost + iops_cost + throughput_cost,
+    }
+
+
+def fleet_totals(costs: dict) -> dict:
+    return {component: float(np.sum(values)) for component, values in costs.items()}
+
+
+# Fleet totals for every (IOPS, throughput) pair in the grids, as an array of shape (len(iops_grid), len(throughput_grid)).
+# With floor=True each disk is provisioned at max(its own value, grid value), otherwise exactly at the grid value.
+# The cost components are independent, so each axis is computed separately and combined with an outer sum.
+def premiumv2_sweep(size_gb, iops, throughput, table: PremiumV2PriceTable, iops_grid, throughput_grid, floor: bool = True):
+    _require_numpy()
+    size_gb = np.asarray(size_gb, dtype=float)
+    iops = np.asarray(iops, dtype=float).reshape(-1, 1)
+    throughput = np.asarray(throughput, dtype=float).reshape(-1, 1)
+    iops_grid = np.asarray(iops_grid, dtype=float).reshape(1, -1)
+    throughput_grid = np.asarray(throughput_grid, dtype=float).reshape(1, -1)
+    provisioned_iops = np.maximum(iops, iops_grid) if floor else np.broadcast_to(iops_grid, (len(iops), iops_grid.shape[1]))
+    provisioned_mbps = np.maximum(throughput, throughput_grid) if floor else np.broadcast_to(throughput_grid, (len(throughput), throughput_grid.shape[1]))
+    capacity_total = table.capacity * float(np.sum(size_gb)) * HOURS_PER_MONTH
+    iops_totals = table.iops * np.sum(np.maximum(provisioned_iops - PREMIUM_V2_FREE_IOPS, 0.0), axis=0) * HOURS_PER_MONTH
+    throughput_totals = table.throughput * np.sum(np.maximum(provisioned_mbps - PREMIUM_V2_FREE_MBPS, 0.0), axis=0) * HOURS_PER_MONTH
+    return capacity_total + iops_totals[:, None] + throughput_totals[None, :]
+
+
+# Resolves monthly GBP prices for every tier of a tiered disk family (e.g. disk_tiers.PREMIUM_SSD_TIERS) in one batched query
+def resolve_tier_prices(client, region: str, product_name: str, tiers: list, redundancy: str = "LRS"):
+    _require_numpy()
+    lookups = [{
+        'armRegionName': region,
+        'productName': product_name,
+        'skuName': f"{tier} {redundancy}",
+        'meterName': f"{tier} {redundancy} Disk"
+    } for _, tier, _, _ in tiers]
+    if hasattr(client, "query_batch"):
+        results = client.query_batch(lookups)
+    else:
+        results = [client.query(**lookup) for lookup in lookups]
+    prices = np.full(len(tiers), np.nan)
+    for index, records in enumerate(results):
+        for item in records:
+            if item.get("type", "Consumption") == "Consumption":
+                prices[index] = float(item.get("retailPrice", 0.0)) * USD_TO_GBP
+                break
+    return prices
+
+
+# Monthly cost of each disk on a tiered family: the smallest tier that fits its size (NaN if it fits none or has no price)
+def tiered_disk_costs(size_gb, tiers: list, tier_prices):
+    _require_numpy()
+    max_sizes = np.array([max_size for max_size, _, _, _ in tiers], dtype=float)
+    index = np.searchsorted(max_sizes, np.asarray(size_gb, dtype=float), side="left")
+    padded = np.append(np.asarray(tier_prices, dtype=float), np.nan)
+    return padded[index]
+
+
+def _parse_grid(value: str):
+    return [float(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="What-if Premium SSD v2 costs for the disks of the last compare_disk_prices.py run")
+    parser.add_argument("--results", default=DISK_RESULTS_FILE, help="Disk results written by compare_disk_prices.py")
+    parser.add_argument("--region", default="uksouth")
+    parser.add_argument("--iops", type=_parse_grid, default=[PREMIUM_V2_FREE_IOPS], help="Comma separated IOPS values to provision")
+    parser.add_argument("--throughput", type=_parse_grid, default=[PREMIUM_V2_FREE_MBPS], help="Comma separated MBps values to provision")
+    parser.add_argument("--exact", action="store_true", help="Provision exactly the grid values instead of at least the observed values")
+    args = parser.parse_args()
+    _require_numpy()
+
+    from tabulate import tabulate
+    from AzureRetailPricesApi import AzureRetailPricesClient
+
+    with open(args.results) as f:
+        rows = [row for row in json.load(f) if row[1] != "N/A"]
+    # Disk result columns: Disk_Name, Size_GB, SKU, IOPS, Throughput_MBps, ...
+    def number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+    size_gb = np.array([number(row[1]) for row in rows])
+    iops = np.array([number(row[3]) for row in rows])
+    throughput = np.array([number(row[4]) for row in rows])
+
+    table = PremiumV2PriceTable.resolve(AzureRetailPricesClient(), args.region)
+    current = fleet_totals(premiumv2_costs(size_gb, iops, throughput, table))
+    print(f"[RESULT] {len(rows)} disks as Premium SSD v2 at their current IOPS/throughput: {current['total']:.2f} GBP/month")
+    grid = premiumv2_sweep(size_gb, iops, throughput, table, args.iops, args.throughput, floor=not args.exact)
+    print(tabulate([[f"{value:g}"] + [f"{total:.2f}" for total in grid[i]] for i, value in enumerate(args.iops)],
+                   headers=["IOPS \\ MBps"] + [f"{value:g}" for value in args.throughput]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#########################################################################################
+#
+#    Client-wide rate control for the Azure Retail Prices API
+#    One RateController is shared by every thread using an AzureRetailPricesClient:
+#
+#       - a token bucket paces requests; its rate adapts to throttling (halved on every 429,
+#         raised again slowly after each successful response)
+#       - a 429 Retry-After pauses all callers, not just the one that was throttled
+#       - failed requests are retried with exponential backoff and full jitter, up to max_retries
+#
+#########################################################################################
+
+import random
+import threading
+import time
+from instrumentation import metrics
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class RateController:
+
+    # Init Function
+    def __init__(
+            self,
+            rate: float = 10.0,
+            burst: int = 10,
+            min_rate: float = 0.5,
+            max_rate: float = 50.0,
+            increase: float = 0.5,
+            max_retries: int = 6,
+            base_delay: float = 1.0,
+            max_delay: float = 60.0
+            ) -> None:
+
+        self.rate = rate                # requests per second currently allowed
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase        # rate added back per second of successful responses
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requests = 0
+        self.throttles = 0
+        self.retries = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return f'(rate: {self.rate:.2f}/s, burst: {self.burst}, max_retries: {self.max_retries})'
+
+    # Blocks until the caller may send a request
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.requests += 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    # Additive increase: each success raises the rate by increase / rate, i.e. `increase` per second of steady traffic
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+        metrics.set_gauge("price_api_rate", self.rate)
+
+    # Multiplicative decrease, and a pause for every caller if the API said how long to wait
+    def on_throttle(self, retry_after: float = None) -> None:
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        metrics.incr("price_api_throttles_total")
+        metrics.set_gauge("price_api_rate", self.rate)
+
+    # Seconds to wait before retry number `attempt` (0-based): Retry-After when given, otherwise capped exponential backoff with full jitter
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        with self._lock:
+            self.retries += 1
+        metrics.incr("price_api_retries_total")
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def stats(self) -> dict:
+        return dict({'rate': self.rate, 'requests': self.requests, 'throttles': self.throttles, 'retries': self.retries})
+
+
+# Retry-After is either a number of seconds or an HTTP date
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
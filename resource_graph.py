@@ -0,0 +1,107 @@
+#########################################################################################
+#
+#    Batch resource discovery via Azure Resource Graph
+#    Resolves a whole disks.json / blobs.json with a few paged `az graph query` calls instead
+#    of one `az disk show` / `az storage account show` subprocess per resource:
+#
+#       from resource_graph import discover_disks
+#       details = discover_disks(disks)   # one entry per input item, None if it was not found
+#
+#   The returned dicts have the same fields the scripts read from the per-resource commands
+#   (diskSizeGB, sku, tier, diskIOPSReadWrite, diskMBpsReadWrite, kind, location), so items that
+#   come back as None can still be looked up one by one as a fallback.
+#   Requires the `resource-graph` Azure CLI extension.
+#
+#########################################################################################
+
+import re
+from az_cli import run_az, AzCliError
+
+GRAPH_BATCH_SIZE = 200   # resources named in one query
+GRAPH_PAGE_SIZE = 1000   # rows per page (the maximum `az graph query --first` allows)
+
+DISK_QUERY = """Resources
+| where type =~ 'microsoft.compute/disks'
+| where name in~ ({names})
+| project name, resourceGroup, subscriptionId, location, sku,
+    diskSizeGB = properties.diskSizeGB, tier = properties.tier,
+    diskIOPSReadWrite = properties.diskIOPSReadWrite, diskMBpsReadWrite = properties.diskMBpsReadWrite"""
+
+STORAGE_ACCOUNT_QUERY = """Resources
+| where type =~ 'microsoft.storage/storageaccounts'
+| where name in~ ({names})
+| project id, name, resourceGroup, subscriptionId, location, sku, kind"""
+
+SUBSCRIPTION_ID = re.compile(r"^[0-9a-fA-F]{8}-([0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}$")
+
+
+# Runs a Resource Graph query, following skip tokens until all rows have been returned
+def graph_query(query: str, subscriptions: list = None, debug: bool = False) -> list:
+    rows = []
+    skip_token = None
+    while True:
+        args = ["graph", "query", "-q", query, "--first", str(GRAPH_PAGE_SIZE)]
+        if subscriptions:
+            args += ["--subscriptions"] + list(subscriptions)
+        if skip_token:
+            args += ["--skip-token", skip_token]
+        result = run_az(args, debug=debug)
+        rows.extend(result.get("data", []))
+        skip_token = result.get("skip_token")
+        if not skip_token:
+            return rows
+
+
+def discover_disks(disks: list, debug: bool = False) -> list:
+    items = [(disk.get("diskname") or disk.get("name"),
+              disk.get("resourcegroup") or disk.get("resourceGroup"),
+              disk.get("subscription") or disk.get("subscriptionId")) for disk in disks]
+    return _discover(DISK_QUERY, items, debug)
+
+
+def discover_storage_accounts(accounts: list, debug: bool = False) -> list:
+    items = [(acc.get("name") or acc.get("storageAccountName"),
+              acc.get("resourceGroup") or acc.get("resourcegroup"),
+              acc.get("subscriptionId") or acc.get("subscription")) for acc in accounts]
+    return _discover(STORAGE_ACCOUNT_QUERY, items, debug)
+
+
+# Returns one details dict (or None) per (name, resource group, subscription) item, in input order
+def _discover(query_template: str, items: list, debug: bool) -> list:
+    found = {}
+    for start in range(0, len(items), GRAPH_BATCH_SIZE):
+        batch = [item for item in items[start:start + GRAPH_BATCH_SIZE] if item[0]]
+        if not batch:
+            continue
+        names = ", ".join(_kql_string(name) for name in sorted({name for name, _, _ in batch}))
+        subscriptions = sorted({subscription for _, _, subscription in batch if subscription})
+        # --subscriptions only accepts ids; with subscription names, query everything the login can see
+        if not all(SUBSCRIPTION_ID.match(subscription) for subscription in subscriptions):
+            subscriptions = None
+        try:
+            rows = graph_query(query_template.format(names=names), subscriptions, debug)
+        except (AzCliError, ValueError) as e:
+            if debug:
+                print(f"[WARN] Resource Graph query failed, falling back to per-resource lookups: {e}")
+            continue
+        for row in rows:
+            found.setdefault((row["name"].lower(), row["resourceGroup"].lower()), []).append(row)
+
+    details = []
+    for name, resource_group, subscription in items:
+        candidates = found.get(((name or "").lower(), (resource_group or "").lower()), [])
+        # The same name and resource group can exist in several subscriptions
+        matches = [row for row in candidates if (row.get("subscriptionId") or "").lower() == (subscription or "").lower()]
+        if not matches and len(candidates) == 1 and not SUBSCRIPTION_ID.match(subscription or ""):
+            matches = candidates
+        details.append(_drop_nulls(matches[0]) if matches else None)
+    return details
+
+
+def _kql_string(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+# Resource Graph projects missing properties as null, whereas the show commands omit them
+def _drop_nulls(row: dict) -> dict:
+    return {key: value for key, value in row.items() if value is not None}
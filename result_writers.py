@@ -0,0 +1,269 @@
+#########################################################################################
+#
+#    Streaming output sinks for the compare_*_prices scripts
+#    Rows are written as they are produced, against a fixed list of column headers, so long
+#    runs leave usable partial output behind and never hold every row in memory:
+#
+#       from result_writers import open_writer
+#       with open_writer("csv", "results/disks.csv", headers) as writer:
+#           for row in rows:
+#               writer.write(row)
+#
+#   Formats:
+#       table     tabulate table printed (or written to path) when the writer is closed; the default, buffers rows
+#       ndjson    one JSON object per row, keyed by the headers
+#       csv       header line, then one line per row
+#       parquet   columnar, one row group per row_group_size rows (needs pyarrow)
+#       arrow     Arrow IPC stream, one record batch per row_group_size rows (needs pyarrow);
+#                 unlike Parquet it can be read back up to the last complete batch after a crash
+#
+#   Every row has exactly the header's columns, in the header's order: short rows are padded
+#   with nulls. Text formats are flushed every flush_every rows or flush_interval seconds;
+#   without a path they go to stdout. Run the script inside rows_on_stdout() so that anything
+#   else it prints meanwhile goes to stderr and the output stays valid CSV / NDJSON.
+#
+#########################################################################################
+
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; only the parquet and arrow formats need it
+    pa = None
+
+FORMATS = ("table", "ndjson", "csv", "parquet", "arrow")
+FLUSH_EVERY = 100  # rows
+FLUSH_INTERVAL = 2.0  # seconds
+ROW_GROUP_SIZE = 10000  # rows per Parquet row group / Arrow record batch
+STREAMED_FORMATS = ("ndjson", "csv")  # formats that write rows to stdout as they come when there is no path
+
+_rows_stdout = None  # the real stdout while rows_on_stdout() sends other output to stderr
+
+
+class ResultWriter:
+
+    # Init Function
+    def __init__(self, headers: list) -> None:
+        self.headers = list(headers)
+        self.rows_written = 0
+
+    def __str__(self) -> str:
+        return f'({type(self).__name__}, columns: {len(self.headers)}, rows_written: {self.rows_written})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, row: list) -> None:
+        self._write(self._fit(row))
+        self.rows_written += 1
+
+    def close(self) -> None:
+        pass
+
+    # Pads a row to the header's columns; a longer row means the headers are wrong
+    def _fit(self, row: list) -> list:
+        row = list(row)
+        if len(row) > len(self.headers):
+            raise ValueError(f"Row has {len(row)} values for {len(self.headers)} columns: {row}")
+        return row + [None] * (len(self.headers) - len(row))
+
+    def _write(self, row: list) -> None:
+        raise NotImplementedError
+
+
+# Collects the rows and prints them as one tabulate table, as the scripts always did
+class TableWriter(ResultWriter):
+
+    # Init Function
+    def __init__(self, headers: list, path: str = None, title: str = None) -> None:
+        super().__init__(headers)
+        self.path = path
+        self.title = title
+        self.rows = []
+
+    def _write(self, row: list) -> None:
+        self.rows.append(row)
+
+    def close(self) -> None:
+        if self.rows is None:
+            return
+        from tabulate import tabulate
+        table = tabulate(self.rows, headers=self.headers)
+        self.rows = None
+        if self.path:
+            with _open_text(self.path) as f:
+                f.write(table + "\n")
+            return
+        if self.title:
+            print(self.title)
+        print(table)
+
+
+# Base for the line based formats: an open text file (or stdout) flushed in batches
+class _TextWriter(ResultWriter):
+
+    # Init Function
+    def __init__(self, headers: list, path: str = None, flush_every: int = FLUSH_EVERY, flush_interval: float = FLUSH_INTERVAL) -> None:
+        super().__init__(headers)
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._file = _open_text(path) if path else (_rows_stdout or sys.stdout)
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, row: list) -> None:
+        super().write(row)
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.flush()
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.flush()
+        if self.path:
+            self._file.close()
+        self._file = None
+
+
+class NdjsonWriter(_TextWriter):
+
+    def _write(self, row: list) -> None:
+        self._file.write(json.dumps(dict(zip(self.headers, row)), separators=(',', ':')) + "\n")
+
+
+class CsvWriter(_TextWriter):
+
+    # Init Function
+    def __init__(self, headers: list, path: str = None, **kwargs) -> None:
+        super().__init__(headers, path, **kwargs)
+        self._csv = csv.writer(self._file)
+        self._csv.writerow(self.headers)
+
+    def _write(self, row: list) -> None:
+        self._csv.writerow(row)
+
+
+# Base for the pyarrow formats: rows are buffered column-wise and written row_group_size at a time.
+# Every column is a nullable string, since rows mix numbers with markers such as "N/A" and "?".
+class _ArrowWriter(ResultWriter):
+
+    # Init Function
+    def __init__(self, headers: list, path: str, row_group_size: int = ROW_GROUP_SIZE) -> None:
+        _require_pyarrow(type(self).__name__)
+        if not path:
+            raise ValueError(f"{type(self).__name__} needs an output path")
+        super().__init__(headers)
+        self.path = path
+        self.row_group_size = row_group_size
+        self.schema = pa.schema([pa.field(header, pa.string()) for header in self.headers])
+        self._columns = [[] for _ in self.headers]
+        self._writer = self._open(path)
+
+    def _write(self, row: list) -> None:
+        for column, value in zip(self._columns, row):
+            column.append(None if value is None else str(value))
+        if len(self._columns[0]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._columns and self._columns[0]:
+            self._writer.write_table(pa.Table.from_arrays([pa.array(column, pa.string()) for column in self._columns], schema=self.schema))
+            self._columns = [[] for _ in self.headers]
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        self.flush()
+        self._writer.close()
+        self._writer = None
+
+    def _open(self, path: str):
+        raise NotImplementedError
+
+
+class ParquetWriter(_ArrowWriter):
+
+    def _open(self, path: str):
+        _make_parent(path)
+        return pq.ParquetWriter(path, self.schema)
+
+
+class ArrowStreamWriter(_ArrowWriter):
+
+    def _open(self, path: str):
+        _make_parent(path)
+        self._sink = pa.OSFile(path, "wb")
+        return pa.ipc.new_stream(self._sink, self.schema)
+
+    def flush(self) -> None:
+        super().flush()
+        self._sink.flush()
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        super().close()
+        self._sink.close()
+
+
+# Writer for one of FORMATS. title is only printed by the table format.
+def open_writer(format: str, path: str = None, headers: list = (), title: str = None, **kwargs) -> ResultWriter:
+    if format == "table":
+        return TableWriter(headers, path, title=title)
+    if format == "ndjson":
+        return NdjsonWriter(headers, path, **kwargs)
+    if format == "csv":
+        return CsvWriter(headers, path, **kwargs)
+    if format == "parquet":
+        return ParquetWriter(headers, path, **kwargs)
+    if format == "arrow":
+        return ArrowStreamWriter(headers, path, **kwargs)
+    raise ValueError(f"Unknown output format '{format}', expected one of: {', '.join(FORMATS)}")
+
+
+# While rows of a streamed format go to stdout, sends everything else printed to stderr
+@contextlib.contextmanager
+def rows_on_stdout(format: str, path: str = None):
+    global _rows_stdout
+    if path or format not in STREAMED_FORMATS:
+        yield
+        return
+    _rows_stdout = sys.stdout
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+    finally:
+        _rows_stdout = None
+
+
+def _require_pyarrow(name: str) -> None:
+    if pa is None:
+        raise ImportError(f"{name} needs pyarrow: pip install pyarrow")
+
+
+def _make_parent(path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+def _open_text(path: str):
+    _make_parent(path)
+    return open(path, "w", newline="")
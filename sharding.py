@@ -0,0 +1,77 @@
+#########################################################################################
+#
+#    Deterministic sharding of a run across processes or machines
+#    Each resource goes to one of N shards by a stable hash of its resume key (the same key
+#    the checkpoint journal uses), so every machine given the same input file and --shard i/N
+#    works on the same resources, and a rerun of a shard resumes from its own journal:
+#
+#       python compare_disk_prices.py --shard 1/4      # on four machines: 1/4, 2/4, 3/4, 4/4
+#       python compare_disk_prices.py --merge 4        # once all shards are done, with their journals copied back
+#
+#   A shard saves its progress to the script's journal and results files with ".shard-i-of-N"
+#   before the extension. The merge reads the input file again and takes each resource's row
+#   from its shard's journal, so the merged results are in input order whatever order the
+#   shards finished in. The merged journal is built under temporary names and only replaces the
+#   script's journal and results files once it is complete.
+#
+#########################################################################################
+
+import argparse
+import hashlib
+import os
+from checkpoint import CheckpointJournal
+
+
+# "i/N" with 1 <= i <= N, as taken by the scripts' --shard option; returns (i, N)
+def parse_shard(value: str) -> tuple:
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a shard as i/N, e.g. 1/4, not '{value}'") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"Shard {index}/{count} is out of range, expected 1/{count} to {count}/{count}")
+    return index, count
+
+
+# Shard number (1 to count) of a key; stable across processes, machines and Python versions
+def shard_of(key: str, count: int) -> int:
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def in_shard(key: str, shard: tuple) -> bool:
+    index, count = shard
+    return shard_of(key, count) == index
+
+
+# Per-shard variant of a journal or results path: results/x.jsonl -> results/x.shard-2-of-4.jsonl (unchanged without a shard)
+def shard_path(path: str, shard: tuple) -> str:
+    if not path or shard is None:
+        return path
+    index, count = shard
+    root, extension = os.path.splitext(path)
+    return f"{root}.shard-{index}-of-{count}{extension}"
+
+
+# Yields (key, row) for each distinct key in input order, the row read from its shard's journal
+# (None if that shard has not saved it). Each shard journal is read sequentially, one row at a time.
+def merge_shards(keys, journal_path: str, count: int):
+    keys = list(dict.fromkeys(keys))
+    keys_by_shard = {index: [] for index in range(1, count + 1)}
+    order = []
+    for key in keys:
+        index = shard_of(key, count)
+        keys_by_shard[index].append(key)
+        order.append(index)
+    rows = {index: CheckpointJournal(shard_path(journal_path, (index, count))).rows(shard_keys)
+            for index, shard_keys in keys_by_shard.items()}
+    for key, index in zip(keys, order):
+        yield key, next(rows[index])
+
+
+# First saved row of any of the shard journals (None if none has one), e.g. to check the merge's columns before it starts
+def first_shard_row(journal_path: str, count: int):
+    for index in range(1, count + 1):
+        for _, row in CheckpointJournal(shard_path(journal_path, (index, count))).iter_entries():
+            return row
+    return None
@@ -0,0 +1,166 @@
+#########################################################################################
+#
+#    In-process, single-flight memoization for the pricing helpers
+#
+#       from single_flight import memoize
+#
+#       @memoize(ignore=("size_gb",))
+#       def get_disk_price(sku, size_gb, product_name, region="uksouth"):
+#           ...
+#
+#   Calls are keyed on their normalized arguments (positional and keyword arguments are
+#   bound to parameter names, defaults applied, numbers compared as floats and strings
+#   stripped). While a call for a key is running, other threads asking for the same key
+#   wait for it and share its result instead of issuing a duplicate request.
+#   Exceptions are passed to every waiting caller but are not cached. do_many() does the same for
+#   a batch of keys, computing all the missing ones in one call.
+#
+#########################################################################################
+
+import functools
+import inspect
+import threading
+
+
+class SingleFlight:
+
+    # Init Function
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._results = {}
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                return self._results[key]
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                self.misses += 1
+                call = self._in_flight[key] = _Call()
+            else:
+                self.hits += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as error:
+            call.error = error
+            raise
+        else:
+            with self._lock:
+                self._results[key] = call.result
+            return call.result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    # do() for many keys in one call: func(keys) runs once for the keys that have no result and are not being
+    # computed, and returns their results in the same order; keys another caller is computing are waited for.
+    # Returns the result of each key, in the order given.
+    def do_many(self, keys: list, func) -> list:
+        known, calls, led = {}, {}, []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                if key in self._results:
+                    self.hits += 1
+                    known[key] = self._results[key]
+                    continue
+                call = self._in_flight.get(key)
+                if call is None:
+                    self.misses += 1
+                    call = self._in_flight[key] = _Call()
+                    led.append(key)
+                else:
+                    self.hits += 1
+                calls[key] = call
+
+        if led:
+            try:
+                results = func(led)
+            except BaseException as error:
+                for key in led:
+                    calls[key].error = error
+                raise
+            else:
+                with self._lock:
+                    for key, result in zip(led, results):
+                        calls[key].result = self._results[key] = result
+            finally:
+                with self._lock:
+                    for key in led:
+                        del self._in_flight[key]
+                for key in led:
+                    calls[key].done.set()
+
+        for key, call in calls.items():
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            known[key] = call.result
+        return [known[key] for key in keys]
+
+    # Keys that have a result
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._results)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+    def stats(self) -> dict:
+        return dict({'hits': self.hits, 'misses': self.misses, 'entries': len(self._results)})
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def normalize(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return tuple(sorted((key, normalize(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(item) for item in value)
+    return value
+
+
+# Decorator; arguments named in `ignore` are left out of the key (e.g. ones the result does not depend on)
+def memoize(func=None, ignore=()):
+    if func is None:
+        return functools.partial(memoize, ignore=ignore)
+
+    signature = inspect.signature(func)
+    flight = SingleFlight()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = tuple((name, normalize(value)) for name, value in bound.arguments.items() if name not in ignore)
+        return flight.do(key, func, *args, **kwargs)
+
+    wrapper.cache_clear = flight.clear
+    wrapper.cache_stats = flight.stats
+    return wrapper
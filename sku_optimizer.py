@@ -0,0 +1,185 @@
+#########################################################################################
+#
+#    Cheapest managed disk SKU for a given size, IOPS and throughput
+#    Prices for every tier of Standard HDD (S), Standard SSD (E) and Premium SSD (P), plus the
+#    Premium SSD v2 and Ultra Disk meters, are resolved once per region (a handful of batched
+#    queries). Each disk is then placed by bisection, without any further queries:
+#
+#       from sku_optimizer import DiskOptimizer
+#       optimizer = DiskOptimizer.build(api_client, 'uksouth')
+#       sku, monthly_gbp = optimizer.cheapest(size_gb=1000, iops=5000, mbps=200)
+#
+#   For the tiered families the tier limits never decrease with size, so the first tier that
+#   fits a disk is the largest of three bisections (size, IOPS, MBps). A suffix minimum over
+#   tier prices (the price/performance frontier) then gives the cheapest tier from there up.
+#   Premium SSD v2 and Ultra are priced from their per-GiB/IOPS/MBps meters after raising the
+#   provisioned values to what each disk type needs to deliver the requirement.
+#
+#########################################################################################
+
+import bisect
+import math
+from disk_tiers import STANDARD_HDD_TIERS, STANDARD_SSD_TIERS, PREMIUM_SSD_TIERS
+from pricing_engine import PremiumV2PriceTable, USD_TO_GBP, HOURS_PER_MONTH, PREMIUM_V2_FREE_IOPS, PREMIUM_V2_FREE_MBPS
+
+TIERED_FAMILIES = (
+    ("Standard HDD Managed Disks", STANDARD_HDD_TIERS),
+    ("Standard SSD Managed Disks", STANDARD_SSD_TIERS),
+    ("Premium SSD Managed Disks", PREMIUM_SSD_TIERS),
+)
+
+# Premium SSD v2 limits
+PREMIUM_V2_MAX_SIZE_GB = 65536
+PREMIUM_V2_IOPS_PER_GB = 500
+PREMIUM_V2_MAX_IOPS = 80000
+PREMIUM_V2_MAX_MBPS = 1200
+PREMIUM_V2_MBPS_PER_IOPS = 0.25
+
+# Ultra Disk limits; capacity is billed in these sizes
+ULTRA_PRODUCT = "Ultra Disks"
+ULTRA_SIZES_GB = [4, 8, 16, 32, 64, 128, 256, 512] + [1024 * n for n in range(1, 65)]
+ULTRA_IOPS_PER_GB = 300
+ULTRA_MIN_IOPS = 100
+ULTRA_MAX_IOPS = 400000
+ULTRA_MAX_MBPS = 10000
+ULTRA_MBPS_PER_IOPS = 0.25
+
+
+class TierFrontier:
+
+    # tiers: [(max_size_gb, tier, max_iops, max_mbps)], prices: monthly GBP per tier (None if not sold in the region)
+    def __init__(self, tiers: list, prices: list, redundancy: str) -> None:
+        self.names = [f"{tier} {redundancy}" for _, tier, _, _ in tiers]
+        self.prices = prices
+        # Running maxima keep the limits sorted for bisection even if a table has a dip
+        self.sizes, self.iops, self.mbps = [], [], []
+        for max_size, _, max_iops, max_mbps in tiers:
+            self.sizes.append(max(max_size, self.sizes[-1] if self.sizes else 0))
+            self.iops.append(max(max_iops, self.iops[-1] if self.iops else 0))
+            self.mbps.append(max(max_mbps, self.mbps[-1] if self.mbps else 0))
+        # best[i]: index of the cheapest priced tier at or above tier i
+        self.best = [None] * (len(tiers) + 1)
+        for i in range(len(tiers) - 1, -1, -1):
+            following = self.best[i + 1]
+            if prices[i] is not None and (following is None or prices[i] <= prices[following]):
+                self.best[i] = i
+            else:
+                self.best[i] = following
+
+    def cheapest(self, size_gb: float, iops: float, mbps: float):
+        start = max(bisect.bisect_left(self.sizes, size_gb),
+                    bisect.bisect_left(self.iops, iops),
+                    bisect.bisect_left(self.mbps, mbps))
+        best = self.best[min(start, len(self.names))]
+        if best is None:
+            return None
+        return self.names[best], self.prices[best]
+
+
+class DiskOptimizer:
+
+    # premiumv2 / ultra: PremiumV2PriceTable-like objects with hourly GBP capacity/iops/throughput prices, or None
+    def __init__(self, frontiers: list, premiumv2=None, ultra=None, redundancy: str = "LRS") -> None:
+        self.frontiers = frontiers
+        self.premiumv2 = premiumv2
+        self.ultra = ultra
+        self.redundancy = redundancy
+
+    # Resolves all prices for a region. Families that are not sold there are left out.
+    @classmethod
+    def build(cls, client, region: str, redundancy: str = "LRS") -> 'DiskOptimizer':
+        lookups = []
+        for product_name, tiers in TIERED_FAMILIES:
+            lookups += [{
+                'armRegionName': region,
+                'productName': product_name,
+                'skuName': f"{tier} {redundancy}",
+                'meterName': f"{tier} {redundancy} Disk"
+            } for _, tier, _, _ in tiers]
+        if hasattr(client, "query_batch"):
+            results = client.query_batch(lookups)
+        else:
+            results = [client.query(**lookup) for lookup in lookups]
+        frontiers = []
+        position = 0
+        for _, tiers in TIERED_FAMILIES:
+            prices = [_consumption_price(records) for records in results[position:position + len(tiers)]]
+            position += len(tiers)
+            frontiers.append(TierFrontier(tiers, prices, redundancy))
+
+        premiumv2 = ultra = None
+        if redundancy == "LRS":
+            try:
+                premiumv2 = PremiumV2PriceTable.resolve(client, region)
+            except LookupError:
+                pass
+            ultra = _resolve_ultra(client, region)
+        return cls(frontiers, premiumv2, ultra, redundancy)
+
+    # (skuName, monthly GBP) of the cheapest disk that meets the requirement, or None if nothing does
+    def cheapest(self, size_gb: float, iops: float = 0.0, mbps: float = 0.0):
+        size_gb, iops, mbps = float(size_gb), float(iops or 0.0), float(mbps or 0.0)
+        candidates = [frontier.cheapest(size_gb, iops, mbps) for frontier in self.frontiers]
+        candidates.append(self.premiumv2_cost(size_gb, iops, mbps))
+        candidates.append(self.ultra_cost(size_gb, iops, mbps))
+        candidates = [candidate for candidate in candidates if candidate is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda candidate: candidate[1])
+
+    def cheapest_many(self, disks) -> list:
+        return [self.cheapest(size_gb, iops, mbps) for size_gb, iops, mbps in disks]
+
+    # Premium SSD v2: IOPS must be provisioned for the throughput (0.25 MBps per IOPS) and capacity for the IOPS (500 per GiB)
+    def premiumv2_cost(self, size_gb: float, iops: float, mbps: float):
+        if self.premiumv2 is None or iops > PREMIUM_V2_MAX_IOPS or mbps > PREMIUM_V2_MAX_MBPS:
+            return None
+        provisioned_iops = max(iops, PREMIUM_V2_FREE_IOPS, mbps / PREMIUM_V2_MBPS_PER_IOPS)
+        if provisioned_iops > PREMIUM_V2_MAX_IOPS:
+            return None
+        provisioned_size = max(math.ceil(size_gb), 1)
+        if provisioned_iops > PREMIUM_V2_FREE_IOPS:
+            provisioned_size = max(provisioned_size, math.ceil(provisioned_iops / PREMIUM_V2_IOPS_PER_GB))
+        if provisioned_size > PREMIUM_V2_MAX_SIZE_GB:
+            return None
+        hourly = (self.premiumv2.capacity * provisioned_size
+                  + self.premiumv2.iops * max(provisioned_iops - PREMIUM_V2_FREE_IOPS, 0.0)
+                  + self.premiumv2.throughput * max(mbps - PREMIUM_V2_FREE_MBPS, 0.0))
+        return f"Premium SSD v2 {self.redundancy}", hourly * HOURS_PER_MONTH
+
+    # Ultra Disk: capacity rounds up to a billed size that allows the IOPS (300 per GiB); IOPS must cover the throughput
+    def ultra_cost(self, size_gb: float, iops: float, mbps: float):
+        if self.ultra is None or mbps > ULTRA_MAX_MBPS:
+            return None
+        provisioned_iops = max(iops, ULTRA_MIN_IOPS, mbps / ULTRA_MBPS_PER_IOPS)
+        if provisioned_iops > ULTRA_MAX_IOPS:
+            return None
+        index = bisect.bisect_left(ULTRA_SIZES_GB, max(size_gb, provisioned_iops / ULTRA_IOPS_PER_GB))
+        if index == len(ULTRA_SIZES_GB):
+            return None
+        hourly = (self.ultra.capacity * ULTRA_SIZES_GB[index]
+                  + self.ultra.iops * provisioned_iops
+                  + self.ultra.throughput * max(mbps, 1.0))
+        return f"Ultra {self.redundancy}", hourly * HOURS_PER_MONTH
+
+
+def _consumption_price(records: list):
+    for item in records:
+        if item.get("type", "Consumption") == "Consumption":
+            return float(item.get("retailPrice", 0.0)) * USD_TO_GBP
+    return None
+
+
+# Ultra Disk meters (hourly, per GiB / IOPS / MBps), or None if Ultra is not sold in the region
+def _resolve_ultra(client, region: str):
+    prices = {}
+    for item in client.iter_query(armRegionName=region, productName=ULTRA_PRODUCT, skuName="Ultra LRS"):
+        if item.get("type") != "Consumption":
+            continue
+        meter = item.get("meterName", "")
+        for component in ("Provisioned Capacity", "Provisioned IOPS", "Provisioned Throughput"):
+            if component in meter and component not in prices:
+                prices[component] = float(item.get("retailPrice", 0.0)) * USD_TO_GBP
+    if len(prices) < 3:
+        return None
+    return PremiumV2PriceTable(prices["Provisioned Capacity"], prices["Provisioned IOPS"], prices["Provisioned Throughput"])
@@ -0,0 +1,262 @@
+#########################################################################################
+#
+#    Batched UsedCapacity collection for storage accounts
+#    Fetches the latest UsedCapacity of many accounts with the Azure Monitor metrics batch API
+#    (up to 50 accounts of one subscription and region per `az rest` call), asking only for a
+#    short window aggregated server-side, and keeps the result for the rest of the run:
+#
+#       from storage_metrics import CapacityCollector
+#       collector = CapacityCollector()
+#       collector.collect([(resource_id, region), ...])
+#       usage_gb = collector.used_capacity_gb(resource_id, region)
+#
+#   Accounts the batch call could not answer are fetched one at a time with `az monitor metrics list`.
+#
+#   CapacityHistory collects daily averages over the last HISTORY_DAYS days instead, for trend
+#   projections, and keeps them in SQLite so a rerun only fetches the days it does not have yet:
+#
+#       history = CapacityHistory('results/capacity_history.sqlite3')
+#       history.collect([(resource_id, region), ...], days=60)
+#       history.series(resource_id, days=60)   # [('2024-05-01', 812.4), ...]
+#
+#########################################################################################
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from az_cli import run_az, AzCliError
+
+METRICS_BATCH_SIZE = 50        # resource ids per metrics:getBatch call (API limit)
+METRICS_WINDOW = timedelta(hours=3)
+METRICS_INTERVAL = "PT1H"
+METRICS_API_VERSION = "2023-10-01"
+METRICS_NAMESPACE = "microsoft.storage/storageaccounts"
+HISTORY_DAYS = 90              # days of daily UsedCapacity kept for trend projections
+HISTORY_INTERVAL = "P1D"
+
+
+def storage_account_id(subscription, resource_group, account_name):
+    return f"/subscriptions/{subscription}/resourceGroups/{resource_group}/providers/Microsoft.Storage/storageAccounts/{account_name}"
+
+
+# Latest non-null average of a UsedCapacity metric, in GB, or None if there is no data point
+def latest_capacity_gb(metric_values: list):
+    try:
+        data = metric_values[0]["timeseries"][0]["data"]
+    except (IndexError, KeyError, TypeError):
+        return None
+    for point in reversed(data):
+        avg = point.get("average")
+        if avg is not None:
+            return float(avg) / (1024 ** 3)  # Convert bytes to GB
+    return None
+
+
+# One metrics:getBatch call: UsedCapacity of up to METRICS_BATCH_SIZE accounts of a subscription and region
+def fetch_metrics_batch(subscription: str, region: str, resource_ids: list, start: datetime, end: datetime, interval: str, debug: bool = False) -> dict:
+    url = (
+        f"https://{region}.metrics.monitor.azure.com/subscriptions/{subscription}/metrics:getBatch"
+        f"?starttime={_timestamp(start)}&endtime={_timestamp(end)}"
+        f"&interval={interval}&metricnames=UsedCapacity&aggregation=average"
+        f"&metricnamespace={METRICS_NAMESPACE}&api-version={METRICS_API_VERSION}"
+    )
+    return run_az([
+        "rest", "--method", "post", "--url", url,
+        "--resource", "https://metrics.monitor.azure.com",
+        "--body", json.dumps({"resourceids": resource_ids})
+    ], debug=debug)
+
+
+def _timestamp(value: datetime) -> str:
+    return value.isoformat().replace('+00:00', 'Z')
+
+
+class CapacityCollector:
+
+    # Init Function
+    def __init__(self, debug: bool = False) -> None:
+        self.debug = debug
+        self._capacity = {}
+        self._lock = threading.Lock()
+
+    # Fetches capacity for every (resource_id, region) not already known, in batches per subscription and region
+    def collect(self, accounts: list) -> None:
+        groups = {}
+        with self._lock:
+            for resource_id, region in accounts:
+                if resource_id.lower() not in self._capacity:
+                    subscription = resource_id.split("/")[2]
+                    groups.setdefault((subscription, region), set()).add(resource_id)
+        for (subscription, region), resource_ids in groups.items():
+            resource_ids = sorted(resource_ids)
+            for start in range(0, len(resource_ids), METRICS_BATCH_SIZE):
+                try:
+                    self._fetch_batch(subscription, region, resource_ids[start:start + METRICS_BATCH_SIZE])
+                except (AzCliError, ValueError) as e:
+                    if self.debug:
+                        print(f"[WARN] Batched metrics call failed for {subscription}/{region}, will fetch per account: {e}")
+
+    # UsedCapacity in GB (None if the account has no data points). Raises AzCliError if the metrics can't be fetched.
+    def used_capacity_gb(self, resource_id: str, region: str = None):
+        with self._lock:
+            if resource_id.lower() in self._capacity:
+                return self._capacity[resource_id.lower()]
+        usage_gb = self._fetch_one(resource_id)
+        with self._lock:
+            self._capacity[resource_id.lower()] = usage_gb
+        return usage_gb
+
+    def _fetch_batch(self, subscription: str, region: str, resource_ids: list) -> None:
+        end = datetime.now(timezone.utc).replace(microsecond=0)
+        result = fetch_metrics_batch(subscription, region, resource_ids, end - METRICS_WINDOW, end, METRICS_INTERVAL, debug=self.debug)
+        with self._lock:
+            for entry in result.get("values", []):
+                resource_id = entry.get("resourceid") or entry.get("resourceId")
+                if resource_id:
+                    self._capacity[resource_id.lower()] = latest_capacity_gb(entry.get("value", []))
+
+    def _fetch_one(self, resource_id: str):
+        metrics = run_az([
+            "monitor", "metrics", "list",
+            "--resource", resource_id,
+            "--metric", "UsedCapacity",
+            "--interval", METRICS_INTERVAL,
+            "--offset", f"{int(METRICS_WINDOW.total_seconds() // 3600)}h",
+            "--aggregation", "Average"
+        ], debug=self.debug)
+        return latest_capacity_gb(metrics.get("value", []))
+
+
+# Daily UsedCapacity averages in GB, as [(day 'YYYY-MM-DD', gb or None), ...]
+def daily_capacity_gb(metric_values: list) -> list:
+    try:
+        data = metric_values[0]["timeseries"][0]["data"]
+    except (IndexError, KeyError, TypeError):
+        return []
+    points = []
+    for point in data:
+        avg = point.get("average")
+        points.append((point.get("timeStamp", "")[:10], float(avg) / (1024 ** 3) if avg is not None else None))
+    return points
+
+
+class CapacityHistory:
+
+    # Init Function
+    def __init__(self, path: str = ':memory:', debug: bool = False) -> None:
+        self.path = path
+        self.debug = debug
+        self.fetched = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path) if path != ':memory:' else ''
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS capacity ('
+            ' resource_id TEXT NOT NULL,'
+            ' day TEXT NOT NULL,'
+            ' used_gb REAL,'
+            ' PRIMARY KEY (resource_id, day))'
+        )
+        # Complete days already fetched per account, including days without data points
+        self._db.execute('CREATE TABLE IF NOT EXISTS coverage (resource_id TEXT PRIMARY KEY, first_day TEXT NOT NULL, last_day TEXT NOT NULL)')
+        self._db.commit()
+
+    def __str__(self) -> str:
+        return f'(path: {self.path}, fetched: {self.fetched}, reused: {self.reused})'
+
+    # Fetches the last `days` complete days of every (resource_id, region), skipping days already stored.
+    # Accounts needing the same days are batched per subscription and region.
+    def collect(self, accounts: list, days: int = HISTORY_DAYS) -> None:
+        today = datetime.now(timezone.utc).date()
+        wanted_first = today - timedelta(days=days)
+        groups = {}
+        with self._lock:
+            for resource_id, region in accounts:
+                start = self._missing_from(resource_id.lower(), wanted_first, today)
+                if start is None:
+                    self.reused += 1
+                    continue
+                subscription = resource_id.split("/")[2]
+                groups.setdefault((subscription, region, start), set()).add(resource_id)
+        for (subscription, region, start), resource_ids in groups.items():
+            resource_ids = sorted(resource_ids)
+            for offset in range(0, len(resource_ids), METRICS_BATCH_SIZE):
+                batch = resource_ids[offset:offset + METRICS_BATCH_SIZE]
+                try:
+                    result = fetch_metrics_batch(subscription, region, batch, _midnight(start), _midnight(today), HISTORY_INTERVAL, debug=self.debug)
+                    answered = {}
+                    for entry in result.get("values", []):
+                        resource_id = entry.get("resourceid") or entry.get("resourceId")
+                        if resource_id:
+                            answered[resource_id.lower()] = daily_capacity_gb(entry.get("value", []))
+                except (AzCliError, ValueError) as e:
+                    if self.debug:
+                        print(f"[WARN] Batched metrics history call failed for {subscription}/{region}, will fetch per account: {e}")
+                    answered = {}
+                for resource_id in batch:
+                    points = answered.get(resource_id.lower())
+                    if points is None:
+                        try:
+                            points = self._fetch_one(resource_id, start, today)
+                        except (AzCliError, ValueError) as e:
+                            if self.debug:
+                                print(f"[WARN] Could not fetch metrics history for {resource_id}: {e}")
+                            continue
+                    self._store(resource_id.lower(), points, start, today)
+
+    # [(day, gb), ...] of the last `days` complete days with data, oldest first
+    def series(self, resource_id: str, days: int = HISTORY_DAYS) -> list:
+        first = (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat()
+        with self._lock:
+            return self._db.execute(
+                'SELECT day, used_gb FROM capacity WHERE resource_id = ? AND day >= ? AND used_gb IS NOT NULL ORDER BY day',
+                (resource_id.lower(), first)
+            ).fetchall()
+
+    def stats(self) -> dict:
+        return dict({'fetched': self.fetched, 'reused': self.reused})
+
+    def close(self) -> None:
+        self._db.close()
+
+    # First day to fetch for an account, or None if every wanted day is stored
+    def _missing_from(self, resource_id: str, wanted_first, today):
+        row = self._db.execute('SELECT first_day, last_day FROM coverage WHERE resource_id = ?', (resource_id,)).fetchone()
+        if row is None or row[0] > wanted_first.isoformat():
+            return wanted_first
+        last = datetime.strptime(row[1], '%Y-%m-%d').date()
+        if last + timedelta(days=1) >= today:
+            return None
+        return last + timedelta(days=1)
+
+    def _store(self, resource_id: str, points: list, start, today) -> None:
+        with self._lock:
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO capacity (resource_id, day, used_gb) VALUES (?, ?, ?)',
+                                     [(resource_id, day, gb) for day, gb in points if start.isoformat() <= day < today.isoformat()])
+                row = self._db.execute('SELECT first_day FROM coverage WHERE resource_id = ?', (resource_id,)).fetchone()
+                first = min(row[0], start.isoformat()) if row else start.isoformat()
+                self._db.execute('INSERT OR REPLACE INTO coverage (resource_id, first_day, last_day) VALUES (?, ?, ?)',
+                                 (resource_id, first, (today - timedelta(days=1)).isoformat()))
+            self.fetched += 1
+
+    def _fetch_one(self, resource_id: str, start, today) -> list:
+        metrics = run_az([
+            "monitor", "metrics", "list",
+            "--resource", resource_id,
+            "--metric", "UsedCapacity",
+            "--interval", HISTORY_INTERVAL,
+            "--start-time", _timestamp(_midnight(start)),
+            "--end-time", _timestamp(_midnight(today)),
+            "--aggregation", "Average"
+        ], debug=self.debug)
+        return daily_capacity_gb(metrics.get("value", []))
+
+
+def _midnight(day) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
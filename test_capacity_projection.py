@@ -0,0 +1,69 @@
+import math
+import pytest
+
+np = pytest.importorskip("numpy")
+from capacity_projection import MONTH_DAYS, capacity_matrix, fit_trends, project_capacity, project_costs
+
+SERIES = [
+    [("2024-01-01", 100.0), ("2024-01-02", 110.0), ("2024-01-04", 131.0), ("2024-01-05", 139.0)],
+    [("2024-01-03", 50.0), ("2024-01-05", None)],  # one point
+    [],  # no points
+    [("2024-01-01", 400.0), ("2024-01-03", 300.0), ("2024-01-05", 90.0)],  # shrinking
+    [("2024-01-02", 7.0), ("2024-01-05", 7.0)]
+]
+
+
+# Scalar reference: least-squares (intercept, slope) through one account's points
+def line_fit(points):
+    n = len(points)
+    if n == 0:
+        return math.nan, math.nan
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread if spread else 0.0
+    return mean_y - slope * mean_x, slope
+
+
+def test_capacity_matrix_counts_days_back_from_the_latest():
+    days, used_gb = capacity_matrix(SERIES)
+    assert list(days) == [-4, -3, -2, -1, 0]
+    assert used_gb.shape == (5, 5)
+    assert np.isnan(used_gb[1]).sum() == 4 and used_gb[1, 2] == 50.0
+    assert np.isnan(used_gb[2]).all()
+
+
+def test_fit_trends_matches_a_scalar_fit_per_account():
+    days, used_gb = capacity_matrix(SERIES)
+    trend = fit_trends(days, used_gb)
+    for row in range(len(SERIES)):
+        points = [(x, y) for x, y in zip(days, used_gb[row]) if not math.isnan(y)]
+        intercept, slope = line_fit(points)
+        assert trend['points'][row] == len(points)
+        assert trend['growth_gb_per_day'][row] == pytest.approx(slope, nan_ok=True)
+        assert trend['current_gb'][row] == pytest.approx(max(intercept, 0.0) if points else math.nan, nan_ok=True)
+
+
+def test_a_single_point_is_flat_and_no_points_is_unknown():
+    trend = fit_trends([-2.0, 0.0], [[np.nan, 50.0], [80.0, np.nan], [np.nan, np.nan]])
+    assert list(trend['growth_gb_per_day'][:2]) == [0.0, 0.0]
+    assert list(trend['current_gb'][:2]) == [50.0, 80.0]
+    assert np.isnan(trend['growth_gb_per_day'][2]) and np.isnan(trend['current_gb'][2])
+
+
+def test_project_capacity_and_costs():
+    trend = dict({'current_gb': np.array([100.0, 10.0]), 'growth_gb_per_day': np.array([1.0, -1.0])})
+    capacity = project_capacity(trend, (3, 12))
+    assert capacity[0] == pytest.approx([100.0 + 3 * MONTH_DAYS, 100.0 + 12 * MONTH_DAYS])
+    assert list(capacity[1]) == [0.0, 0.0]  # never projected below zero
+
+    rates = [[0.02, None], [0.01, 0.5]]
+    costs = project_costs(capacity, rates)
+    assert costs.shape == (2, 2, 2)
+    for account in range(2):
+        for sku in range(2):
+            for horizon in range(2):
+                rate = rates[account][sku]
+                expected = math.nan if rate is None else rate * capacity[account, horizon]
+                assert costs[account, sku, horizon] == pytest.approx(expected, nan_ok=True)
+    assert project_costs(np.zeros((0, 3)), []).shape == (0, 0, 3)
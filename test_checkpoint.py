@@ -0,0 +1,88 @@
+import json
+import os
+from checkpoint import CheckpointJournal
+
+
+def journal_in(tmp_path, **kwargs):
+    return CheckpointJournal(str(tmp_path / "results.jsonl"), str(tmp_path / "results.json"), **kwargs)
+
+
+def test_resume_keeps_saved_rows_and_replaces_repeated_keys(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.append("a", [1])
+    journal.append("b", [2])
+    journal.close()
+
+    resumed = journal_in(tmp_path)
+    assert resumed.keys() == ["a", "b"]
+    resumed.append("a", [10])
+    resumed.append("c", [3])
+    assert resumed.load() == [("a", [10]), ("b", [2]), ("c", [3])]
+
+
+def test_compact_writes_one_entry_per_key_and_the_results_file(tmp_path):
+    journal = journal_in(tmp_path)
+    for key, row in (("a", [1]), ("b", [2]), ("a", [3])):
+        journal.append(key, row)
+    assert journal.compact() == 2
+    with open(tmp_path / "results.json") as f:
+        assert json.load(f) == [[3], [2]]
+    with open(tmp_path / "results.jsonl") as f:
+        assert [json.loads(line)["key"] for line in f] == ["a", "b"]
+
+
+def test_resume_after_torn_write_keeps_the_next_entry(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.append("a", [1])
+    journal.append("b", [2])
+    journal.close()
+    with open(tmp_path / "results.jsonl", "a") as f:
+        f.write('{"key":"c","ro')  # the crash cut this entry short
+
+    resumed = journal_in(tmp_path)
+    assert resumed.keys() == ["a", "b"]
+    resumed.append("c", [3])
+    resumed.append("d", [4])
+    assert resumed.keys() == ["a", "b", "c", "d"]
+    resumed.compact()
+    with open(tmp_path / "results.json") as f:
+        assert json.load(f) == [[1], [2], [3], [4]]
+
+
+def test_rows_follow_the_given_key_order(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.append("a", [1])
+    journal.append("b", [2])
+    assert list(journal.rows(["b", "x", "a"])) == [[2], None, [1]]
+    assert list(journal_in(tmp_path / "missing").rows(["a"])) == [None]
+
+
+def test_legacy_results_file_is_migrated(tmp_path):
+    with open(tmp_path / "results.json", "w") as f:
+        json.dump([["sa1", "rg", 1], ["sa2", "rg", 2]], f)
+    journal = journal_in(tmp_path)
+    assert journal.keys(legacy_key=lambda row: f"{row[0]}|{row[1]}") == ["sa1|rg", "sa2|rg"]
+
+
+def test_discard_forgets_all_progress(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.append("a", [1])
+    journal.compact()
+    journal.discard()
+    assert not os.path.exists(tmp_path / "results.jsonl")
+    assert not os.path.exists(tmp_path / "results.json")
+    assert journal.keys() == []
+
+
+def test_move_to_replaces_the_journal_and_results_file(tmp_path):
+    old = journal_in(tmp_path)
+    old.append("old", [0])
+    old.compact()
+    merged = CheckpointJournal(str(tmp_path / "merge.jsonl"), str(tmp_path / "merge.json"))
+    merged.append("a", [1])
+    merged.compact()
+    merged.move_to(old.path, old.results_path)
+    assert journal_in(tmp_path).load() == [("a", [1])]
+    with open(tmp_path / "results.json") as f:
+        assert json.load(f) == [[1]]
+    assert not os.path.exists(tmp_path / "merge.jsonl")
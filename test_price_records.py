@@ -0,0 +1,24 @@
+import io
+import json
+import pytest
+from price_records import parse_page, parse_page_stream
+
+FIELDS = ('skuName', 'retailPrice', 'savingsPlan', 'tierMinimumUnits')
+PAGE = dict({
+    'Items': [
+        {'skuName': "P10 LRS", 'retailPrice': 1.5, 'meterName': "P10 LRS Disk", 'tierMinimumUnits': 0.0,
+         'savingsPlan': [{'term': "1 Year", 'retailPrice': 1.0}], 'other': {'skuName': "nested", 'list': [1, {'a': None}]}},
+        {'retailPrice': 2.25, 'skuName': None, 'extra': "ignored"}
+    ],
+    'NextPageLink': "https://prices.azure.com/api/retail/prices?$skip=100"
+})
+
+
+def test_streamed_page_matches_the_decoded_page():
+    pytest.importorskip("ijson")
+    body = json.dumps(PAGE).encode("utf-8")
+    items, next_link = parse_page_stream(io.BytesIO(body), FIELDS)
+    assert (items, next_link) == parse_page(body, FIELDS)
+    assert items[0]['savingsPlan'] == [{'term': "1 Year", 'retailPrice': 1.0}]
+    assert items[1].get('tierMinimumUnits') is None
+    assert parse_page_stream(io.BytesIO(b'{"Items": [], "NextPageLink": null}'), FIELDS) == ([], None)
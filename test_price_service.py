@@ -0,0 +1,33 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+from mock_prices_server import MockPricesServer
+from AzureRetailPricesApi import AzureRetailPricesClient
+from price_cache import PriceCache
+from price_service import PriceService
+
+P10 = dict({'armRegionName': "uksouth", 'productName': "Premium SSD Managed Disks", 'skuName': "P10 LRS", 'meterName': "P10 LRS Disk"})
+ULTRA = dict({'skuName': "Ultra LRS", 'meterName': "Ultra LRS Provisioned IOPS"})  # not a (region, product) pair: memoized
+
+
+@pytest.fixture
+def server():
+    with MockPricesServer() as server:
+        yield server
+
+
+def test_refresh_reaches_upstream_through_a_fresh_response_cache(server, tmp_path):
+    client = AzureRetailPricesClient(url=server.url, cache=PriceCache(str(tmp_path / "cache")))
+    with PriceService(client, port=0, refresh_interval=0) as service:
+        assert service.query(**P10)[0]['retailPrice'] != 99.0
+        assert all(record['retailPrice'] != 99.0 for record in service.query(**ULTRA))
+        server.update_records(lambda record: record['skuName'] in ("P10 LRS", "Ultra LRS"), retailPrice=99.0)
+        requests = server.stats()['requests']
+
+        service.refresh()
+        assert server.stats()['requests'] > requests
+        assert service.query(**P10)[0]['retailPrice'] == 99.0
+        assert [record['retailPrice'] for record in service.query(**ULTRA)] == [99.0] * len(service.query(**ULTRA))
+        assert service.stats()['refreshes'] == 1
@@ -0,0 +1,57 @@
+import os
+import sys
+import pytest
+
+np = pytest.importorskip("numpy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+from disk_tiers import PREMIUM_SSD_TIERS
+from pricing_engine import (HOURS_PER_MONTH, PREMIUM_V2_FREE_IOPS, PREMIUM_V2_FREE_MBPS, PremiumV2PriceTable,
+                            premiumv2_costs, premiumv2_sweep, resolve_tier_prices, tiered_disk_costs)
+
+TABLE = PremiumV2PriceTable(capacity=0.0001, iops=0.000005, throughput=0.00004)
+SIZE_GB = [64, 512, 2048]
+IOPS = [1000, 5000, 20000]
+MBPS = [100, 300, 125]
+
+
+# Scalar reference: one disk's monthly Premium SSD v2 cost
+def premiumv2_cost(size_gb, iops, mbps):
+    return (TABLE.capacity * size_gb + TABLE.iops * max(iops - PREMIUM_V2_FREE_IOPS, 0.0)
+            + TABLE.throughput * max(mbps - PREMIUM_V2_FREE_MBPS, 0.0)) * HOURS_PER_MONTH
+
+
+def test_premiumv2_costs_match_the_scalar_calculation():
+    totals = premiumv2_costs(SIZE_GB, IOPS, MBPS, TABLE)['total']
+    assert totals == pytest.approx([premiumv2_cost(*disk) for disk in zip(SIZE_GB, IOPS, MBPS)])
+
+
+@pytest.mark.parametrize("floor", [True, False])
+def test_premiumv2_sweep_matches_the_scalar_calculation(floor):
+    iops_grid, mbps_grid = [3000, 10000], [125, 250, 500]
+    grid = premiumv2_sweep(SIZE_GB, IOPS, MBPS, TABLE, iops_grid, mbps_grid, floor=floor)
+    assert grid.shape == (2, 3)
+    for i, grid_iops in enumerate(iops_grid):
+        for j, grid_mbps in enumerate(mbps_grid):
+            expected = sum(premiumv2_cost(size, max(iops, grid_iops) if floor else grid_iops, max(mbps, grid_mbps) if floor else grid_mbps)
+                           for size, iops, mbps in zip(SIZE_GB, IOPS, MBPS))
+            assert grid[i, j] == pytest.approx(expected)
+
+
+def test_tiered_disk_costs_take_the_smallest_tier_that_fits():
+    prices = np.arange(1.0, len(PREMIUM_SSD_TIERS) + 1.0)
+    prices[2] = np.nan  # a tier without a price
+    sizes = [1, 4, 5, 16, 1024, 1025, 32767, 40000]
+    costs = tiered_disk_costs(sizes, PREMIUM_SSD_TIERS, prices)
+    for size, cost in zip(sizes, costs):
+        fits = [index for index, (max_size, _, _, _) in enumerate(PREMIUM_SSD_TIERS) if size <= max_size]
+        expected = prices[fits[0]] if fits else np.nan
+        assert cost == pytest.approx(expected, nan_ok=True)
+
+
+def test_resolve_tier_prices_in_a_few_batched_requests():
+    from mock_prices_server import MockPricesServer
+    from AzureRetailPricesApi import AzureRetailPricesClient
+    with MockPricesServer() as server:
+        prices = resolve_tier_prices(AzureRetailPricesClient(url=server.url), "uksouth", "Premium SSD Managed Disks", PREMIUM_SSD_TIERS)
+        assert server.stats()['requests'] <= 2
+    assert not np.isnan(prices).any()
@@ -0,0 +1,50 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+from mock_prices_server import MockPricesServer
+from AzureRetailPricesApi import AzureRetailPricesClient, _merge_plan
+
+
+@pytest.fixture(scope="module")
+def server():
+    with MockPricesServer() as server:
+        yield server
+
+
+def tier_lookup(region, product, sku):
+    return dict({'armRegionName': region, 'productName': product, 'skuName': sku, 'meterName': f"{sku} Disk"})
+
+
+def batch_requests(server, lookups):
+    client = AzureRetailPricesClient(url=server.url)
+    expected = [client.query(**lookup) for lookup in lookups]
+    server.reset_stats()
+    results = client.query_batch(lookups)
+    assert results == expected
+    assert all(results)
+    return server.stats()['requests']
+
+
+def test_lookups_whose_sku_and_meter_both_differ_share_one_request(server):
+    lookups = [tier_lookup("uksouth", "Premium SSD Managed Disks", sku) for sku in ("P10 LRS", "P20 LRS", "P30 LRS")]
+    lookups += [tier_lookup("uksouth", "Standard SSD Managed Disks", sku) for sku in ("E10 LRS", "E20 LRS", "E30 LRS")]
+    assert batch_requests(server, lookups) == 1
+
+
+def test_mixed_field_batch(server):
+    lookups = [tier_lookup("uksouth", "Premium SSD Managed Disks", sku) for sku in ("P10 LRS", "P20 LRS", "P30 LRS")]
+    # Another set of fields: one request with the regions or-ed
+    lookups += [{'armRegionName': region, 'productName': "Azure Premium SSD v2"} for region in ("uksouth", "ukwest")]
+    # Same fields as the first lookups, but every SKU in both regions: the SKU doesn't determine the region,
+    # so the regions are shared and all tier lookups take one request per region
+    lookups += [tier_lookup(region, "Standard SSD Managed Disks", sku) for region in ("uksouth", "ukwest") for sku in ("E10 LRS", "E20 LRS")]
+    assert batch_requests(server, lookups) == 3
+
+
+def test_merge_plan_ors_fields_the_varying_field_determines():
+    lookups = [tier_lookup("uksouth", product, sku) for product, sku in (("A", "P10 LRS"), ("A", "P20 LRS"), ("B", "E10 LRS"))]
+    merged, shared = _merge_plan(tuple(sorted(lookups[0])), lookups)
+    assert shared == ("armRegionName",)
+    assert sorted(merged) == ["meterName", "productName", "skuName"]
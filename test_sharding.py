@@ -0,0 +1,51 @@
+import argparse
+import pytest
+from checkpoint import CheckpointJournal
+from sharding import first_shard_row, in_shard, merge_shards, parse_shard, shard_of, shard_path
+
+
+def test_shard_of_is_stable_across_runs():
+    # Pinned values: shards of a run must not move when Python, the machine or the process changes
+    assert shard_of("disk-a|rg-1", 4) == 1
+    assert shard_of("sa1|rg", 4) == 4
+    assert shard_of("bench-disk-000042|rg-bench-02", 4) == 3
+    assert shard_of("bench-disk-000042|rg-bench-02", 7) == 7
+
+
+def test_every_key_is_in_exactly_one_shard():
+    keys = [f"disk-{i}|rg-{i % 5}" for i in range(200)]
+    for key in keys:
+        assert [index for index in range(1, 5) if in_shard(key, (index, 4))] == [shard_of(key, 4)]
+    assert {shard_of(key, 4) for key in keys} == {1, 2, 3, 4}
+
+
+def test_parse_shard_and_shard_path():
+    assert parse_shard("2/4") == (2, 4)
+    for value in ("0/4", "5/4", "2", "a/b"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(value)
+    assert shard_path("results/x.jsonl", (2, 4)) == "results/x.shard-2-of-4.jsonl"
+    assert shard_path("results/x.jsonl", None) == "results/x.jsonl"
+
+
+def test_merge_follows_input_order_whatever_order_the_shards_saved_in(tmp_path):
+    journal_path = str(tmp_path / "results.jsonl")
+    keys = [f"disk-{i}|rg" for i in range(30)]
+    # Each shard saves its keys in reverse input order, and one key is never saved
+    for key in reversed(keys[:-1]):
+        journal = CheckpointJournal(shard_path(journal_path, (shard_of(key, 3), 3)))
+        journal.append(key, [key])
+        journal.close()
+
+    merged = list(merge_shards(keys + [keys[0]], journal_path, 3))
+    assert [key for key, _ in merged] == keys
+    assert [row for _, row in merged] == [[key] for key in keys[:-1]] + [None]
+
+
+def test_first_shard_row(tmp_path):
+    journal_path = str(tmp_path / "results.jsonl")
+    assert first_shard_row(journal_path, 3) is None
+    journal = CheckpointJournal(shard_path(journal_path, (3, 3)))
+    journal.append("k", ["a", "b"])
+    journal.close()
+    assert first_shard_row(journal_path, 3) == ["a", "b"]
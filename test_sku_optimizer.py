@@ -0,0 +1,34 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+from mock_prices_server import MockPricesServer
+from AzureRetailPricesApi import AzureRetailPricesClient
+from sku_optimizer import DiskOptimizer, TIERED_FAMILIES
+
+
+@pytest.fixture(scope="module")
+def server():
+    with MockPricesServer() as server:
+        yield server
+
+
+def build_requests(server, redundancy):
+    server.reset_stats()
+    optimizer = DiskOptimizer.build(AzureRetailPricesClient(url=server.url), "uksouth", redundancy)
+    return optimizer, server.stats()['requests']
+
+
+def test_build_resolves_every_tier_in_a_few_batched_requests(server):
+    assert sum(len(tiers) for _, tiers in TIERED_FAMILIES) == 39
+    # The 39 tier lookups fit in 3 URLs of at most MAX_URL_LENGTH, plus one query each for Premium SSD v2 and Ultra
+    optimizer, requests = build_requests(server, "LRS")
+    assert requests <= 5
+    assert optimizer.cheapest(512, 3000, 150)[0] == "Premium SSD v2 LRS"
+
+
+def test_zrs_disks_get_zrs_recommendations(server):
+    optimizer, requests = build_requests(server, "ZRS")
+    assert requests <= 3  # Premium SSD v2 and Ultra are LRS only
+    assert optimizer.cheapest(512, 3000, 150)[0].endswith(" ZRS")